@@ -0,0 +1,125 @@
+"""Times get_mealplan and post_grocery_list end to end against a local FakeNotion server
+
+Each database size gets a new workspace and an empty cache directory, and the meal plan
+is made twice: once with cold caches, and once more with the caches the first run left.
+The parse cache is filled with the parses of the synthetic ingredients beforehand, so
+the ingredient parser model isn't needed.
+
+Run from the root of the repository with ``python -m benchmarks.bench_mealplan``.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from notion_mealplan import grocery_list as groc
+from notion_mealplan import mp_functions as mp
+from notion_mealplan.parse_cache import ParseCache
+from notion_mealplan.testing import synthetic_workspace
+
+
+def run(size: int, args) -> list:
+    """Makes two meal plans for a database of size recipes, returning a row per run"""
+    # small databases can't fill two weeks in a row without repeats
+    k = min(args.recipes, size // 3)
+    fake, ids, parses = synthetic_workspace(
+        size,
+        planned=k,
+        latency=args.latency,
+        throttle_every=args.throttle_every,
+        max_page_size=args.page_size,
+    )
+    rows = []
+    with tempfile.TemporaryDirectory() as cache_dir, fake:
+        os.environ.update(
+            NOTION_KEY="benchmark",
+            NOTION_PAGE_ID=ids["recipes"],
+            NOTION_MP_ID=ids["mealplan"],
+            NOTION_MEALPLAN_CACHE=cache_dir,
+        )
+        parse_cache = ParseCache()
+        parse_cache.put_many(parses.values())
+        parse_cache.close()
+
+        for run_name in ("cold", "warm"):
+            client = mp.NotionClient(
+                "benchmark",
+                pool_maxsize=args.concurrency,
+                rate_limit=args.rate,
+                base_url=fake.url,
+            )
+            start = time.perf_counter()
+            recipes, client = mp.get_mealplan(
+                k,
+                args.repeat,
+                concurrency=args.concurrency,
+                use_cache=not args.no_cache,
+                optimize=args.optimize,
+                notion_client=client,
+                weeks=args.weeks,
+            )
+            planned = time.perf_counter()
+            if args.weeks > 1:
+                lists, combined = groc.weekly_grocery_lists(
+                    recipes, client, recipes.weeks
+                )
+                groc.post_grocery_list(recipes, client, ingred_dict=combined)
+            else:
+                groc.post_grocery_list(recipes, client)
+            posted = time.perf_counter()
+            rows.append(
+                (
+                    size,
+                    run_name,
+                    planned - start,
+                    posted - planned,
+                    client.stats["requests"],
+                    client.stats["throttled"],
+                )
+            )
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--recipes", type=int, default=7)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="seconds per request"
+    )
+    parser.add_argument("--throttle-every", type=int, default=0)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument(
+        "--rate", type=float, default=1000.0, help="requests per second allowed"
+    )
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--optimize", choices=["distinct", "overlap"])
+    parser.add_argument(
+        "--weeks", type=int, default=1, help="weeks planned from one fetch"
+    )
+    args = parser.parse_args()
+
+    results = [row for size in args.sizes for row in run(size, args)]
+
+    row = "{0:>8}{1:>6}{2:>12}{3:>12}{4:>10}{5:>11}"
+    print()
+    print(
+        row.format("recipes", "run", "mealplan s", "grocery s", "requests", "throttled")
+    )
+    for size, run_name, plan_s, grocery_s, requests, throttled in results:
+        print(
+            row.format(
+                size,
+                run_name,
+                "{0:.3f}".format(plan_s),
+                "{0:.3f}".format(grocery_s),
+                requests,
+                throttled,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
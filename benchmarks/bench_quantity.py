@@ -0,0 +1,70 @@
+"""Compares the cost per call of parse_quantity with the old exception-driven test_float
+
+"test_float" is the current test_float and "uncached" is parse_quantity, both without
+the memo of parse_quantity, the cost the first time an amount is seen. test_float reads
+plain numbers and fractions without building a ParsedQuantity. "memoized" is the cost
+of every later call of parse_quantity with the same amount.
+
+Run from the root of the repository with ``python -m benchmarks.bench_quantity``.
+"""
+
+import timeit
+from notion_mealplan import grocery_list as groc
+from notion_mealplan.quantity import parse_quantity
+
+AMOUNTS = ["2", "0.5", "1/2", "1 1/2", "-1 1/2", "2 3/4", "a", "1-2", "½"]
+
+
+def legacy_test_float(value):
+    """test_float as it was before it used parse_quantity"""
+    try:
+        return float(value)
+    except ValueError:
+        try:
+            num, denom = value.split("/")
+        except ValueError:
+            return value
+        try:
+            leading, num = num.split(" ")
+            whole = float(leading)
+        except ValueError:
+            whole = 0
+        frac = float(num) / float(denom)
+        return whole - frac if whole < 0 else whole + frac
+    except:
+        return value
+
+
+def per_call(func, amounts, number=200, repeat=300):
+    """Best time per call in microseconds, over many short repeats so that the best
+    one is unlikely to have been interrupted"""
+    best = min(
+        timeit.repeat(lambda: [func(a) for a in amounts], number=number, repeat=repeat)
+    )
+    return best / (number * len(amounts)) * 1e6
+
+
+def main():
+    row = "{0:<10}{1:>12}{2:>14}{3:>12}{4:>14}"
+    print(
+        row.format("amount", "legacy us", "test_float us", "uncached us", "memoized us")
+    )
+    for amounts in [[a] for a in AMOUNTS] + [AMOUNTS]:
+        times = [per_call(legacy_test_float, amounts)]
+        groc.parse_quantity = parse_quantity.__wrapped__
+        try:
+            times.append(per_call(groc.test_float, amounts))
+        finally:
+            groc.parse_quantity = parse_quantity
+        times.append(per_call(parse_quantity.__wrapped__, amounts))
+        times.append(per_call(parse_quantity, amounts))
+        print(
+            row.format(
+                amounts[0] if len(amounts) == 1 else "all",
+                *["{0:.3f}".format(t) for t in times],
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
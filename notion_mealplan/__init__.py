@@ -1,5 +1,10 @@
 __version__ = "0.1.0"
-from . import main
-from dotenv import load_dotenv
 
-load_dotenv()
+import importlib
+
+
+def __getattr__(name: str):
+    # submodules are imported on first use, so importing the package stays cheap
+    if name in ("main", "mp_functions", "grocery_list"):
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,350 @@
+"""Contains the batch mode that plans meals for several households in one process
+
+The households are listed in a TOML file. Top-level keys are defaults for every household,
+and each ``[[household]]`` table gives the Notion ids of one workspace::
+
+    recipes = 5
+    repeat = 1
+
+    [[household]]
+    name = "home"
+    notion_key_env = "HOME_NOTION_KEY"
+    notion_page_id = "..."
+    notion_mp_id = "..."
+
+    [[household]]
+    name = "cabin"
+    notion_key = "secret_..."
+    notion_page_id = "..."
+    notion_mp_id = "..."
+    recipes = 3
+    grocery = false
+
+The households are planned concurrently, sharing the caches and the loaded parser model.
+Households with the same Notion key share one rate limiter, since Notion limits requests
+per integration.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import os
+import time
+import tomllib
+from typing import List, Mapping, Optional, Sequence
+import requests
+from . import grocery_list as groc
+from . import mp_functions as mp
+from . import optimizer
+from . import profiling
+from . import rate_limit as rl
+from .cache import NotionCache
+from .parse_cache import ParseCache
+
+# keys a household table, or the top level of the config file, can have
+KEYS = {
+    "name",
+    "notion_key",
+    "notion_key_env",
+    "notion_page_id",
+    "notion_mp_id",
+    "recipes",
+    "repeat",
+    "optimize",
+    "grocery",
+}
+
+
+@dataclass
+class Household:
+    """Notion workspace and meal plan settings of one household
+
+    Attributes
+    ----------
+    name : str
+        name shown in the report
+    notion_key : str
+        the personal notion key
+    notion_page_id : str
+        id of the recipe database
+    notion_mp_id : Optional[str]
+        id of the page the grocery list is on
+    recipes : int
+        number of recipes to plan
+    repeat : int
+        number of recipes that can be repeats from the previous week
+    optimize : Optional[str]
+        objective of optimizer.optimize_rows, or None to pick recipes at random
+    grocery : bool
+        whether to make a grocery list
+    """
+
+    name: str
+    notion_key: str
+    notion_page_id: str
+    notion_mp_id: Optional[str] = None
+    recipes: int = 0
+    repeat: int = 1
+    optimize: Optional[str] = None
+    grocery: bool = True
+
+
+def load_config(path: str, defaults: Optional[Mapping] = None) -> List[Household]:
+    """Reads the households from a TOML config file
+
+    Parameters
+    ----------
+    path : str
+        path of the config file
+    defaults : Optional[Mapping], optional
+        values that replace the top-level defaults of the file, e.g. from the command
+        line, by default None
+
+    Returns
+    -------
+    List[Household]
+        the households, in the order they are listed
+
+    Raises
+    ------
+    ValueError
+        if the file isn't valid TOML, or a household is missing a value or has an invalid one
+    """
+    try:
+        with open(path, "rb") as f:
+            config = tomllib.load(f)
+    except tomllib.TOMLDecodeError as e:
+        raise ValueError("{0} is not valid TOML: {1}".format(path, e))
+
+    tables = config.pop("household", [])
+    if not isinstance(tables, list) or not tables:
+        raise ValueError("{0} has no [[household]] tables".format(path))
+    config.update({k: v for k, v in (defaults or {}).items() if v is not None})
+
+    households = []
+    for i, table in enumerate(tables):
+        values = {**config, **table}
+        name = str(values.pop("name", None) or "household {0}".format(i + 1))
+        unknown = set(values) - KEYS
+        if unknown:
+            raise ValueError(
+                "{0}: unknown keys {1}".format(name, ", ".join(sorted(unknown)))
+            )
+
+        key_env = values.pop("notion_key_env", None)
+        if key_env is not None and not values.get("notion_key"):
+            values["notion_key"] = os.environ.get(key_env)
+        required = ["notion_key", "notion_page_id", "recipes"]
+        if values.get("grocery", True):
+            required.append("notion_mp_id")
+        for key in required:
+            if not values.get(key):
+                raise ValueError("{0}: {1} is not set".format(name, key))
+
+        if not isinstance(values["recipes"], int) or values["recipes"] < 1:
+            raise ValueError("{0}: recipes must be a positive integer".format(name))
+        if not isinstance(values.get("repeat", 1), int) or values.get("repeat", 1) < 0:
+            raise ValueError(
+                "{0}: repeat must be an integer of at least 0".format(name)
+            )
+        if values.get("optimize") not in (None,) + optimizer.OBJECTIVES:
+            raise ValueError(
+                "{0}: optimize must be one of {1}".format(name, optimizer.OBJECTIVES)
+            )
+        households.append(Household(name=name, **values))
+    return households
+
+
+def run_household(
+    household: Household,
+    notion_client: mp.NotionClient,
+    notion_cache: NotionCache,
+    parse_cache: ParseCache,
+    dry_run: bool = False,
+) -> dict:
+    """Makes the meal plan and grocery list of one household
+
+    Parameters
+    ----------
+    household : Household
+        the household to plan for
+    notion_client : NotionClient
+        client for the household's Notion key
+    notion_cache : NotionCache
+        cache the recipe database is synced into
+    parse_cache : ParseCache
+        cache of parsed ingredient sentences
+    dry_run : bool, optional
+        if True, don't change anything in Notion, by default False
+
+    Returns
+    -------
+    dict
+        the name, whether it succeeded, the planned recipes, how many of them were
+        picked at random because their ingredients aren't known, the error if any, and
+        the stage timings and request metrics of the run, see profiling.Profiler.report
+    """
+    result = {
+        "name": household.name,
+        "ok": False,
+        "recipes": [],
+        "unoptimized": 0,
+        "error": None,
+    }
+    profiler = profiling.Profiler()
+    with profiler.activate():
+        try:
+            with profiler.span("mealplan"):
+                recipes, notion_client = mp.get_mealplan(
+                    household.recipes,
+                    household.repeat,
+                    optimize=household.optimize,
+                    notion_client=notion_client,
+                    dry_run=dry_run,
+                    strict=True,
+                    notion_key=household.notion_key,
+                    notion_page_id=household.notion_page_id,
+                    notion_cache=notion_cache,
+                    parse_cache=parse_cache,
+                )
+            result["recipes"] = list(recipes.selected_page_names)
+            result["unoptimized"] = recipes.unoptimized
+
+            ok = True
+            if household.grocery:
+                with profiler.span("grocery_list"):
+                    ok = groc.post_grocery_list(
+                        recipes,
+                        notion_client,
+                        dry_run=dry_run,
+                        mealplan_page_id=household.notion_mp_id,
+                        parse_cache=parse_cache,
+                    ).ok
+            result["ok"] = ok
+        except (ValueError, requests.RequestException) as e:
+            result["error"] = str(e)
+        except Exception as e:
+            # anything else, e.g. from the shared caches or a page of an unexpected
+            # shape, is still kept to this household
+            result["error"] = "{0}: {1}".format(type(e).__name__, e)
+
+    result.update(profiler.report(notion_client))
+    return result
+
+
+def run_batch(
+    households: Sequence[Household],
+    dry_run: bool = False,
+    max_workers: Optional[int] = None,
+    concurrency: int = 10,
+    rate_limit: float = rl.NOTION_RATE,
+    notion_cache: Optional[NotionCache] = None,
+    parse_cache: Optional[ParseCache] = None,
+    base_url: Optional[str] = None,
+) -> dict:
+    """Plans meals for several households concurrently
+
+    Parameters
+    ----------
+    households : Sequence[Household]
+        the households, e.g. from load_config
+    dry_run : bool, optional
+        if True, don't change anything in Notion, by default False
+    max_workers : Optional[int], optional
+        most households planned at once, by default all of them
+    concurrency : int, optional
+        most requests in flight at once for each household, by default 10
+    rate_limit : float, optional
+        requests per second allowed for each Notion key, by default rl.NOTION_RATE
+    notion_cache : Optional[NotionCache], optional
+        cache the recipe databases are synced into, by default the one in the cache directory
+    parse_cache : Optional[ParseCache], optional
+        cache of parsed ingredient sentences, by default the one in the cache directory
+    base_url : Optional[str], optional
+        url of the Notion API, see NotionClient
+
+    Returns
+    -------
+    dict
+        whether every household succeeded, the total time, the result of each household
+        from run_household, and the request metrics of all of them together
+    """
+    start = time.perf_counter()
+    notion_cache = notion_cache if notion_cache is not None else NotionCache()
+    parse_cache = parse_cache if parse_cache is not None else ParseCache()
+
+    limiters = {}
+    clients = []
+    for household in households:
+        client = mp.NotionClient(
+            household.notion_key,
+            pool_maxsize=concurrency,
+            rate_limit=rate_limit,
+            base_url=base_url,
+        )
+        client.limiter = limiters.setdefault(household.notion_key, client.limiter)
+        clients.append(client)
+
+    with ThreadPoolExecutor(max_workers or len(households) or 1) as pool:
+        results = list(
+            pool.map(
+                lambda household, client: run_household(
+                    household, client, notion_cache, parse_cache, dry_run
+                ),
+                households,
+                clients,
+            )
+        )
+
+    return {
+        "ok": all(r["ok"] for r in results),
+        "total_s": round(time.perf_counter() - start, 6),
+        "households": results,
+        "requests": profiling.merge_requests(r["requests"] for r in results),
+    }
+
+
+def format_batch_report(report: Mapping, profile: bool = False) -> str:
+    """Formats a report from run_batch as text
+
+    Parameters
+    ----------
+    report : Mapping
+        the report
+    profile : bool, optional
+        if True, add the stage timings and request metrics of each household, by default False
+    """
+    row = "{0:<24}{1:>6}{2:>9}{3:>8}{4:>10}{5:>10}  {6}"
+    lines = [
+        row.format(
+            "household", "ok", "recipes", "random", "seconds", "requests", "error"
+        )
+    ]
+    for r in report["households"]:
+        lines.append(
+            row.format(
+                r["name"],
+                "yes" if r["ok"] else "no",
+                len(r["recipes"]),
+                r["unoptimized"],
+                "{0:.3f}".format(r["total_s"]),
+                sum(m["count"] for m in r["requests"].values()),
+                r["error"] or "",
+            )
+        )
+    lines.append("total {0:.3f} s".format(report["total_s"]))
+
+    if profile:
+        for r in report["households"]:
+            lines += ["", "== {0} ==".format(r["name"]), profiling.format_report(r)]
+        lines += [
+            "",
+            "== all households ==",
+            profiling.format_report(
+                {
+                    "spans": [],
+                    "total_s": report["total_s"],
+                    "requests": report["requests"],
+                }
+            ),
+        ]
+    return "\n".join(lines)
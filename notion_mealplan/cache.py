@@ -0,0 +1,264 @@
+"""Contains the local SQLite cache of database rows and page blocks from Notion"""
+
+from datetime import datetime, timedelta, timezone
+import json
+import os
+import sqlite3
+import threading
+from typing import Iterable, List, Mapping, Optional
+
+CACHE_ENV = "NOTION_MEALPLAN_CACHE"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS rows (
+    db_id TEXT, page_id TEXT, last_edited TEXT, data TEXT,
+    PRIMARY KEY (db_id, page_id)
+);
+CREATE TABLE IF NOT EXISTS blocks (page_id TEXT PRIMARY KEY, last_edited TEXT, data TEXT);
+"""
+
+
+def default_cache_dir() -> str:
+    """Gets the directory the caches are kept in
+
+    Returns
+    -------
+    str
+        $NOTION_MEALPLAN_CACHE if set, otherwise ~/.cache/notion_mealplan
+    """
+    return os.environ.get(CACHE_ENV) or os.path.join(
+        os.path.expanduser("~"), ".cache", "notion_mealplan"
+    )
+
+
+def format_time(t: datetime) -> str:
+    """Formats a datetime the way Notion does, e.g. 2023-12-07T14:47:00.000Z"""
+    return t.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+def parse_time(value: str) -> datetime:
+    """Parses a Notion timestamp"""
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def is_archived(page: Mapping) -> bool:
+    """Checks whether a page object returned by Notion has been deleted"""
+    return bool(page.get("archived") or page.get("in_trash"))
+
+
+class NotionCache:
+    """Cache of database rows and page block trees, kept in an SQLite file
+
+    Rows are stored per database with the time of the last sync, so only pages edited
+    since then have to be queried. Block trees are stored with the last_edited_time of
+    their page and are only used while that time is unchanged.
+
+    Parameters
+    ----------
+    path : Optional[str], optional
+        path of the SQLite file, or ":memory:", by default notion.sqlite3 in default_cache_dir()
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        if path is None:
+            os.makedirs(default_cache_dir(), exist_ok=True)
+            path = os.path.join(default_cache_dir(), "notion.sqlite3")
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.executescript(SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        row = self._conn.execute(
+            "SELECT value FROM meta WHERE key = ?", (key,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: str):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value)
+        )
+
+    def last_sync(self, db_id: str) -> Optional[str]:
+        """Gets the start time of the last sync of a database, or None if never synced"""
+        with self._lock:
+            return self._get_meta(f"sync:{db_id}")
+
+    def last_full_sync(self, db_id: str) -> Optional[str]:
+        """Gets the start time of the last full sync of a database, or None if never synced"""
+        with self._lock:
+            return self._get_meta(f"full_sync:{db_id}")
+
+    def needs_full_sync(self, db_id: str, max_age: timedelta) -> bool:
+        """Checks whether a database has to be synced in full
+
+        The cache is rebuilt from a full query once it is older than max_age, so rows
+        can't drift from Notion for longer than that.
+
+        Parameters
+        ----------
+        db_id : str
+            id of the database
+        max_age : timedelta
+            longest time between full syncs
+
+        Returns
+        -------
+        bool
+            True if the database was never synced or the last full sync is too old
+        """
+        full = self.last_full_sync(db_id)
+        if full is None:
+            return True
+        return datetime.now(timezone.utc) - parse_time(full) > max_age
+
+    def put_rows(
+        self,
+        db_id: str,
+        pages: Iterable[Mapping],
+        sync_time: Optional[str] = None,
+        full: bool = False,
+    ):
+        """Stores page objects from a database query, removing the rows of deleted pages
+
+        Parameters
+        ----------
+        db_id : str
+            id of the database
+        pages : Iterable[Mapping]
+            page objects returned by the Notion API
+        sync_time : Optional[str], optional
+            start time of the query, recorded as the last sync if given, by default None
+        full : bool, optional
+            if True, pages is the whole database and replaces every cached row, by default False
+        """
+        pages = list(pages)
+        archived = [(db_id, p["id"]) for p in pages if is_archived(p)]
+        data = [
+            (
+                db_id,
+                p["id"],
+                p.get("last_edited_time"),
+                json.dumps(
+                    {
+                        "id": p["id"],
+                        "last_edited_time": p.get("last_edited_time"),
+                        "properties": p.get("properties", {}),
+                    }
+                ),
+            )
+            for p in pages
+            if not is_archived(p)
+        ]
+        with self._lock, self._conn:
+            if full:
+                self._conn.execute("DELETE FROM rows WHERE db_id = ?", (db_id,))
+            self._conn.executemany(
+                "DELETE FROM rows WHERE db_id = ? AND page_id = ?", archived
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO rows (db_id, page_id, last_edited, data) VALUES (?, ?, ?, ?)",
+                data,
+            )
+            if sync_time is not None:
+                self._set_meta(f"sync:{db_id}", sync_time)
+                if full:
+                    self._set_meta(f"full_sync:{db_id}", sync_time)
+
+    def remove_missing(self, db_id: str, page_ids: Iterable[str]):
+        """Removes the cached rows of a database whose pages aren't in page_ids
+
+        Parameters
+        ----------
+        db_id : str
+            id of the database
+        page_ids : Iterable[str]
+            ids of every page still in the database
+        """
+        page_ids = set(page_ids)
+        with self._lock, self._conn:
+            cached = self._conn.execute(
+                "SELECT page_id FROM rows WHERE db_id = ?", (db_id,)
+            ).fetchall()
+            self._conn.executemany(
+                "DELETE FROM rows WHERE db_id = ? AND page_id = ?",
+                [(db_id, p) for (p,) in cached if p not in page_ids],
+            )
+
+    def rows(self, db_id: str) -> List[Mapping]:
+        """Gets every cached page object of a database, in the order they were first stored"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT data FROM rows WHERE db_id = ? ORDER BY rowid", (db_id,)
+            )
+            return [json.loads(d) for (d,) in cursor]
+
+    def get_blocks(self, page_id: str, last_edited: Optional[str]) -> Optional[List]:
+        """Gets the cached blocks of a page if the page hasn't been edited since they were stored
+
+        Parameters
+        ----------
+        page_id : str
+            id of the page
+        last_edited : Optional[str]
+            current last_edited_time of the page
+
+        Returns
+        -------
+        Optional[List]
+            the cached blocks, or None if there are none or they are out of date
+        """
+        if last_edited is None:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT last_edited, data FROM blocks WHERE page_id = ?", (page_id,)
+            ).fetchone()
+        if row is None or row[0] != last_edited:
+            return None
+        return json.loads(row[1])
+
+    def put_blocks(self, page_id: str, last_edited: Optional[str], blocks: List):
+        """Stores the blocks of a page along with its last_edited_time
+
+        Blocks of part of a page are stored under "<page_id>#<section>".
+        """
+        if last_edited is None:
+            return
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO blocks (page_id, last_edited, data) VALUES (?, ?, ?)",
+                (page_id, last_edited, json.dumps(blocks)),
+            )
+
+    def touch(self, db_id: str, page: Mapping, prev_edited: Optional[str]):
+        """Records an edit we made to the properties of a page
+
+        The row is replaced with the returned page object, and the cached blocks are
+        kept valid under the new last_edited_time if they were valid before the edit,
+        since changing a property doesn't change the content of the page.
+
+        Parameters
+        ----------
+        db_id : str
+            id of the database the page is in
+        page : Mapping
+            page object returned by the update
+        prev_edited : Optional[str]
+            last_edited_time of the page before the update
+        """
+        self.put_rows(db_id, [page])
+        new_edited = page.get("last_edited_time")
+        if prev_edited is None or new_edited is None:
+            return
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE blocks SET last_edited = ? "
+                "WHERE (page_id = ? OR page_id LIKE ?) AND last_edited = ?",
+                (new_edited, page["id"], page["id"] + "#%", prev_edited),
+            )
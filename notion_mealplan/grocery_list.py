@@ -1,39 +1,170 @@
+import asyncio
+from dataclasses import dataclass, field
+from itertools import chain, islice
+import json
 import os
-from typing import Union, List, Sequence, Generator, Mapping, Optional
-from ingredient_parser import parse_multiple_ingredients
+import requests
+from typing import (
+    Dict,
+    Union,
+    List,
+    Sequence,
+    Generator,
+    Mapping,
+    Optional,
+    NamedTuple,
+    Iterable,
+    Callable,
+    Set,
+    Tuple,
+)
 from . import notion_filters as nf
+from . import profiling
 from . import units as units
+from .parse_cache import ParseCache, parse_sentences
+from .quantity import EXACT, RANGE, UNPARSEABLE, fraction_value, parse_quantity
 
 n_headings = nf.headings
 
+# limits of the Notion API for appending blocks
+MAX_BLOCKS_PER_REQUEST = 100
+MAX_REQUEST_BYTES = 500_000
+MAX_TEXT_LENGTH = 2000
+
+# headings that mark the end of the ingredients section
+end_headings = ["instructions", "directions"]
+
+
+def _heading_text(block: Mapping) -> Optional[str]:
+    """Gets the lower case text of a heading block, or None if the block isn't a heading"""
+    dtype = block["type"]
+    if dtype not in n_headings:
+        return None
+    return "".join(rt["plain_text"] for rt in block[dtype]["rich_text"]).lower()
+
 
 class NotionPage:
     """A class to get the contents of a Notion page and find the ingredients"""
 
-    def __init__(self, notion_client, name: str):
+    def __init__(
+        self,
+        notion_client,
+        name: str,
+        cache=None,
+        last_edited: Optional[str] = None,
+    ):
         self.notion_client = notion_client
         self.page_contents = []
         self.recipe_name = name
+        self.cache = cache
+        self.last_edited = last_edited
+
+    def load(self, page_id: str, section: Optional[str] = None):
+        """Gets all the blocks on the page, from the cache if the page hasn't been edited since it was stored
+
+        Parameters
+        ----------
+        page_id : str
+            id of the page
+        section : Optional[str], optional
+            heading of the section that is needed, see aget_content, by default None
+        """
+        asyncio.run(self.aload(page_id, section))
+
+    async def aload(self, page_id: str, section: Optional[str] = None):
+        """Coroutine version of load"""
+        # a page fetched for one section may be incomplete, so it is cached separately
+        key = page_id if section is None else f"{page_id}#{section}"
+        if self.cache is not None:
+            blocks = self.cache.get_blocks(key, self.last_edited)
+            if blocks is not None:
+                self.page_contents = blocks
+                return
+
+        await self.aget_content([page_id], section)
+
+        if self.cache is not None:
+            self.cache.put_blocks(key, self.last_edited, self.page_contents)
 
-    def get_content(self, block_ids):
+    def get_content(self, block_ids, section: Optional[str] = None):
         """Gets all the blocks on the page"""
-        new_ids = []
-        for b_id in block_ids:
-            block_response = self.notion_client.get_children(b_id)
-            if block_response.ok:
-                block_object = block_response.json()
-                if block_object["results"]:
-                    self.page_contents.extend(block_object["results"])
-
-                for b in block_object["results"]:
-                    child_ind = b.get("has_children")
-                    if child_ind == True:
-                        new_ids.append(b.get("id"))
-            else:
+        asyncio.run(self.aget_content(block_ids, section))
+
+    async def aget_content(self, block_ids, section: Optional[str] = None):
+        """Gets all the blocks on the page in document order, fetching each level of the block tree concurrently
+
+        Parameters
+        ----------
+        block_ids : Sequence[str]
+            ids of the blocks (or pages) whose children are fetched
+        section : Optional[str], optional
+            heading of the section that is needed, e.g. "ingredients". Once the section
+            and the heading after it have been found, only blocks inside it are expanded, by default None
+        """
+        a_client = getattr(self.notion_client, "aio", self.notion_client)
+        children = {}
+        level = list(block_ids)
+        ordered = []
+        while level:
+            fetched = await asyncio.gather(
+                *(self._aget_children(a_client, b_id) for b_id in level)
+            )
+            children.update(zip(level, fetched))
+            ordered = list(self._in_order(block_ids, children))
+            level = self._to_expand(ordered, children, section)
+
+        self.page_contents.extend(ordered)
+
+    @staticmethod
+    async def _aget_children(a_client, block_id: str) -> List:
+        """Gets every child of a block, following the pagination of the response"""
+        results = []
+        start_cursor = None
+        while True:
+            block_response = await a_client.get_children(
+                block_id, start_cursor=start_cursor
+            )
+            if not block_response.ok:
                 block_response.raise_for_status()
 
-        if len(new_ids) > 0:
-            return self.get_content(new_ids)
+            block_object = block_response.json()
+            results.extend(block_object["results"])
+            start_cursor = block_object.get("next_cursor")
+            if not block_object.get("has_more") or start_cursor is None:
+                return results
+
+    @staticmethod
+    def _in_order(block_ids, children: Mapping) -> Generator[Mapping, None, None]:
+        """Yields the fetched blocks depth first, so each block is followed by its children"""
+        stack = [iter(children[b_id]) for b_id in reversed(block_ids)]
+        while stack:
+            block = next(stack[-1], None)
+            if block is None:
+                stack.pop()
+                continue
+            yield block
+            if block["id"] in children:
+                stack.append(iter(children[block["id"]]))
+
+    @staticmethod
+    def _to_expand(ordered: List, children: Mapping, section: Optional[str]) -> List:
+        """Gets the ids of the blocks whose children are still needed"""
+        start, end = 0, len(ordered)
+        if section is not None:
+            headings = [(i, _heading_text(b)) for i, b in enumerate(ordered)]
+            found = [i for i, h in headings if h == section]
+            if found:
+                start = found[0]
+                for i, h in headings[start + 1 :]:
+                    if h is not None and any(e in h for e in end_headings):
+                        end = i
+                        break
+
+        return [
+            b["id"]
+            for b in ordered[start:end]
+            if b.get("has_children") and b["id"] not in children
+        ]
 
     def get_ingredients(self) -> Optional[List[str]]:
         """Finds the ingredients block and returns a list of those ingredients.
@@ -43,7 +174,7 @@ class NotionPage:
         Optional[List[str]]
             Returns list of rich_text items in bulleted list blocks
         """
-        inst = ["instructions", "directions"]
+        inst = end_headings
         ing_true, ing_list = self._locate_ingredients("ingredients")
 
         if ing_true and ing_list is not None:
@@ -158,6 +289,61 @@ class NotionPage:
 
         return block_ids
 
+    def get_prev_todos(self) -> List[Mapping]:
+        """Function to get the blocks after 'Grocery List' heading, leaving out blocks nested in them
+
+        Returns
+        -------
+        List[Mapping]
+            blocks: the top level blocks after 'Grocery List'
+        """
+        todo_true, todo_list = self._locate_ingredients("grocery list")
+        if not (todo_true and todo_list):
+            return []
+
+        block_ids = {block["id"] for block in todo_list}
+        return [
+            block
+            for block in todo_list
+            if block.get("parent", {}).get("block_id") not in block_ids
+        ]
+
+
+async def aget_recipe_ingredients(
+    recipes, notion_client, pages: Optional[Sequence[str]] = None
+) -> List[Optional[List[str]]]:
+    """Fetches the ingredients of several recipes concurrently
+
+    Parameters
+    ----------
+    recipes : _type_
+        an instance of NotionDatabase class containing the recipes
+    notion_client : _type_
+        an instance of the NotionClient class
+    pages : Optional[Sequence[str]], optional
+        ids of the recipes to fetch, by default recipes.selected_pages
+
+    Returns
+    -------
+    List[Optional[List[str]]]
+        the ingredient sentences of each recipe, in the same order as pages
+    """
+    if pages is None:
+        pages = recipes.selected_pages
+
+    async def _ingredients(page: str) -> Optional[List[str]]:
+        row = recipes.db.index.get(page)
+        n_page = NotionPage(
+            notion_client,
+            recipes.db.names[row] if row is not None else page,
+            cache=recipes.cache,
+            last_edited=recipes.db.last_edited[row] if row is not None else None,
+        )
+        await n_page.aload(page, section="ingredients")
+        return n_page.get_ingredients()
+
+    return await asyncio.gather(*(_ingredients(page) for page in pages))
+
 
 def get_full_ingred_list(recipes, notion_client) -> Optional[List[str]]:
     """Function that takes planned meals and gets a list of ingredient sentences
@@ -176,14 +362,9 @@ def get_full_ingred_list(recipes, notion_client) -> Optional[List[str]]:
     """
 
     if recipes.selected_pages:
-        all_ingred = []
-        for page, page_name in zip(recipes.selected_pages, recipes.selected_page_names):
-            n_page = NotionPage(notion_client, page_name)
-            n_page.get_content([page])
-            ingred = n_page.get_ingredients()
-
-            if ingred is not None:
-                all_ingred = all_ingred + ingred
+        # all recipes are fetched at once, so this takes as long as the slowest one
+        per_recipe = asyncio.run(aget_recipe_ingredients(recipes, notion_client))
+        all_ingred = list(chain.from_iterable(i for i in per_recipe if i is not None))
     else:
         print("no recipes found")
         all_ingred = None
@@ -191,7 +372,254 @@ def get_full_ingred_list(recipes, notion_client) -> Optional[List[str]]:
     return all_ingred
 
 
-def ingredients_to_list(recipes, notion_client) -> Optional[Mapping]:
+class Quantity(NamedTuple):
+    """An amount of an ingredient
+
+    Attributes
+    ----------
+    amount : Optional[float]
+        the numeric amount, or None if the quantity isn't a number
+    unit : str
+        canonical unit, "" if there is none
+    text : str
+        the original quantity and unit when amount is None
+    """
+
+    amount: Optional[float]
+    unit: str
+    text: str = ""
+
+
+def normalize_name(name: str) -> str:
+    """Key used to find repeats of the same ingredient"""
+    return " ".join(name.lower().split())
+
+
+def canonical_unit(unit: str) -> str:
+    """Gets the form of a unit used to compare units, the plural key of units.UNITS where there is one
+
+    Parameters
+    ----------
+    unit : str
+        unit
+
+    Returns
+    -------
+    str
+        canonical unit
+    """
+    return units.normalize(unit)
+
+
+def _best_amount(amounts: Sequence):
+    """picks the amount with the highest confidence"""
+    prev_conf = 0
+    amount = None
+    for a in amounts:
+        if a.confidence > prev_conf:
+            amount = a
+            prev_conf = a.confidence
+    return amount
+
+
+def to_quantity(amount) -> Quantity:
+    """Converts an amount from the ingredient parser to a Quantity
+
+    Parameters
+    ----------
+    amount : _type_
+        an amount of a parsed ingredient, with quantity and unit
+
+    Returns
+    -------
+    Quantity
+        the numeric amount and canonical unit, the high end of the amount for ranges
+    """
+    raw_unit = str(amount.unit or "")
+    parsed = parse_quantity(str(amount.quantity))
+    if parsed.kind == UNPARSEABLE:
+        text = " ".join(filter(None, [str(amount.quantity), raw_unit]))
+        return Quantity(None, canonical_unit(raw_unit), text)
+
+    # a unit written onto the number, e.g. "200g", counts if the parser found none
+    unit = canonical_unit(raw_unit or parsed.unit)
+    return Quantity(parsed.high if parsed.kind == RANGE else parsed.value, unit)
+
+
+def _format_amount(value: float) -> Union[int, float]:
+    value = round(value, 2)
+    return int(value) if value.is_integer() else value
+
+
+class _Entry:
+    """Amounts of one ingredient"""
+
+    __slots__ = ("name", "slots", "other", "count")
+
+    def __init__(self, name: str):
+        self.name = name
+        # ids of the totals of this ingredient in IngredientAggregator, in the order first seen
+        self.slots = []
+        # quantities that aren't numbers
+        self.other = []
+        # number of times the ingredient appeared without an amount
+        self.count = 0
+
+    def amount_and_unit(self, totals: Sequence) -> tuple[Union[str, int, float], str]:
+        """Formats the entry given the (amount, canonical unit) of each of its slots"""
+        amounts = []
+        for slot in self.slots:
+            total, unit = totals[slot]
+            amount = _format_amount(total)
+            # singular or plural, whichever reads right with the amount
+            amounts.append((amount, units.inflect(unit, amount)))
+        if len(amounts) == 1 and not self.other and not self.count:
+            return amounts[0]
+        if not amounts and not self.other:
+            return ("{0}x".format(self.count) if self.count > 1 else "", "")
+
+        parts = [" ".join(filter(None, [str(a), unit])) for a, unit in amounts]
+        parts.extend(self.other)
+        if self.count:
+            parts.append("{0}x".format(self.count))
+        return (" + ".join(parts), "")
+
+
+class IngredientAggregator:
+    """Combines parsed ingredients into one grocery list entry per ingredient
+
+    Entries are kept in a dictionary keyed by the normalized ingredient name, so adding
+    an ingredient is a single lookup, and they come out in the order first seen.
+
+    Numeric amounts are only recorded as they are added. Each ingredient has a slot
+    for its weights, one for its volumes and one for each other unit, and to_dict
+    converts every amount to grams or millilitres and sums the slots in one NumPy
+    pass. A total is shown in the unit its amounts were written in, and a readable
+    unit is only picked for slots that summed amounts in different units.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        # (ingredient key, "weight"/"volume" or unit) -> slot id
+        self._slot_ids = {}
+        # first unit seen in each slot, and whether other units were added to it
+        self._slot_units = []
+        self._slot_mixed = []
+        # slot id, amount and size of the unit of every numeric amount added
+        self._slots = []
+        self._amounts = []
+        self._factors = []
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _entry(self, name: str) -> tuple[str, _Entry]:
+        key = normalize_name(name)
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = _Entry(name)
+        return key, entry
+
+    def _add_quantity(self, name: str, quantity: Optional[Quantity]):
+        key, entry = self._entry(name)
+        if quantity is None:
+            entry.count += 1
+            return
+        if quantity.amount is None:
+            entry.other.append(quantity.text)
+            return
+
+        info = units.lookup(quantity.unit) if quantity.unit else None
+        slot_key = (key, info.dimension if info is not None else quantity.unit)
+        slot = self._slot_ids.get(slot_key)
+        if slot is None:
+            slot = self._slot_ids[slot_key] = len(self._slot_units)
+            self._slot_units.append(quantity.unit)
+            self._slot_mixed.append(False)
+            entry.slots.append(slot)
+        elif quantity.unit != self._slot_units[slot]:
+            self._slot_mixed[slot] = True
+        self._slots.append(slot)
+        self._amounts.append(quantity.amount)
+        self._factors.append(info.factor if info is not None else 1.0)
+
+    def _totals(self) -> List[tuple[float, str]]:
+        """Sums every slot, returning the total and unit of each"""
+        import numpy as np
+
+        sums = np.bincount(
+            np.asarray(self._slots, dtype=np.intp),
+            weights=np.asarray(self._amounts, dtype=float)
+            * np.asarray(self._factors, dtype=float),
+            minlength=len(self._slot_units),
+        )
+
+        totals = []
+        for total, unit, mixed in zip(
+            sums.tolist(), self._slot_units, self._slot_mixed
+        ):
+            info = units.lookup(unit) if unit else None
+            if info is None:
+                totals.append((total, unit))
+            elif not mixed:
+                totals.append((total / info.factor, unit))
+            else:
+                totals.append(
+                    units.display_unit(total, info.dimension, info.name in units.METRIC)
+                )
+        return totals
+
+    def add(self, parsed):
+        """Adds a parsed ingredient sentence
+
+        Parameters
+        ----------
+        parsed : _type_
+            output of the ingredient parser for one sentence
+        """
+        if parsed.name is None:
+            return
+        if parsed.name.confidence < 0.9:
+            # ingredient likely not parsed correctly, just add as is
+            self._add_quantity(parsed.sentence, None)
+            return
+
+        amount = _best_amount(parsed.amount)
+        if amount is None and parsed.amount:
+            print("amount confidence less than 0 for {0}".format(parsed.amount))
+        self._add_quantity(
+            parsed.name.text, to_quantity(amount) if amount is not None else None
+        )
+
+    def extend(self, parsed_ingredients: Iterable):
+        """Adds every parsed ingredient sentence"""
+        for parsed in parsed_ingredients:
+            self.add(parsed)
+
+    def to_dict(self) -> Mapping:
+        """Gets the grocery list in the format used by convert_dict_to_notion_todo
+
+        Returns
+        -------
+        Mapping
+            A dictionary with the final ingredient name, amount and units, with no duplicates
+        """
+        ingred_dict = {"name": [], "amount": [], "unit": []}
+        totals = self._totals() if self._slots else []
+        for entry in self._entries.values():
+            amount, unit = entry.amount_and_unit(totals)
+            ingred_dict["name"].append(entry.name)
+            ingred_dict["amount"].append(amount)
+            ingred_dict["unit"].append(unit)
+        return ingred_dict
+
+
+def ingredients_to_list(
+    recipes,
+    notion_client,
+    parse_cache: Optional[ParseCache] = None,
+    processes: Optional[int] = None,
+) -> Optional[Mapping]:
     """Function that takes the planned meals, gets ingredients for each, and condenses them into a grocery list
 
     Parameters
@@ -200,6 +628,10 @@ def ingredients_to_list(recipes, notion_client) -> Optional[Mapping]:
         An instance of the NotionDatabase class with current recipes in it
     notion_client : _type_
         An instance of the NotionClient class
+    parse_cache : Optional[ParseCache], optional
+        cache of parsed sentences, by default the one in the cache directory if recipes is cached
+    processes : Optional[int], optional
+        number of processes to parse large sets of sentences with, by default the number of CPUs
 
     Returns
     -------
@@ -207,63 +639,140 @@ def ingredients_to_list(recipes, notion_client) -> Optional[Mapping]:
         A dictionary with the final ingredient name, amount and units, with no duplicates
     """
 
-    all_ingred = get_full_ingred_list(recipes, notion_client)
+    with profiling.span("get_content"):
+        all_ingred = get_full_ingred_list(recipes, notion_client)
 
     if all_ingred is not None:
-        parsed_ingredients = parse_multiple_ingredients(all_ingred)
-        ingred_dict = {"name": [], "amount": [], "unit": []}
-
-        for p in parsed_ingredients:
-            if p.name is None:
-                continue
+        if parse_cache is None and getattr(recipes, "cache", None) is not None:
+            parse_cache = ParseCache()
+        with profiling.span("parse"):
+            parsed = parse_sentences(all_ingred, parse_cache, processes)
+        with profiling.span("merge"):
+            aggregator = IngredientAggregator()
+            aggregator.extend(parsed)
+            ingred_dict = aggregator.to_dict()
+    else:
+        ingred_dict = None
 
-            elif p.name.confidence < 0.9:
-                # ingredient likely not parsed correctly, just add as is
-                ingred_dict["name"].append(p.sentence)
-                ingred_dict["amount"].append("")
-                ingred_dict["unit"].append("")
+    return ingred_dict
 
-            elif p.name.text in ingred_dict["name"]:
-                # add the amounts together
 
-                # get the ingredient from the dictionary
-                ind = ingred_dict["name"].index(p.name.text)
+def weekly_grocery_lists(
+    recipes,
+    notion_client,
+    weeks: Sequence[Sequence[str]],
+    parse_cache: Optional[ParseCache] = None,
+    processes: Optional[int] = None,
+) -> Tuple[List[Optional[Mapping]], Optional[Mapping]]:
+    """Makes a grocery list for each week of a multi-week plan, and one for all of them
 
-                if p.amount and ingred_dict["amount"][ind]:
-                    add_ingred_together(p, ingred_dict, ind)
+    The ingredients of each recipe are fetched and parsed once, however many weeks it
+    is planned in, and a recipe planned in two weeks counts twice in the combined list.
 
-                else:
-                    ingred_dict["amount"][ind] = "2x"
+    Parameters
+    ----------
+    recipes : _type_
+        An instance of the NotionDatabase class with the recipes in it
+    notion_client : _type_
+        An instance of the NotionClient class
+    weeks : Sequence[Sequence[str]]
+        ids of the recipes of each week, e.g. recipes.weeks
+    parse_cache : Optional[ParseCache], optional
+        cache of parsed sentences, by default the one in the cache directory if recipes is cached
+    processes : Optional[int], optional
+        number of processes to parse large sets of sentences with, by default the number of CPUs
 
-                # this should be a separate function because will have to deal with unit incompatibilities
-                # probably shouldn't do it this way because will have to keep adding same ingredient?
-            else:
-                # add into the ingredient dictionary
-                ingred_dict["name"].append(p.name.text)
-                if len(p.amount) == 1:
-                    ingred_dict["amount"].append(p.amount[0].quantity)
-                    ingred_dict["unit"].append(p.amount[0].unit)
-                elif len(p.amount) > 1:
-                    # pick the amount with the highest confidence
-                    prev_conf = 0
-                    amount = None
-                    for a in p.amount:
-                        if a.confidence > prev_conf:
-                            amount = a
-                            prev_conf = a.confidence
-                    if amount is not None:
-                        ingred_dict["amount"].append(amount.quantity)
-                        ingred_dict["unit"].append(amount.unit)
-                    else:
-                        print("amount confidence less than 0 for {0}".format(p.amount))
-                else:
-                    ingred_dict["amount"].append("")
-                    ingred_dict["unit"].append("")
+    Returns
+    -------
+    Tuple[List[Optional[Mapping]], Optional[Mapping]]
+        the grocery list of each week and of all the weeks together, in the format of
+        ingredients_to_list, None where no ingredients were found
+    """
+    pages = list(dict.fromkeys(chain.from_iterable(weeks)))
+    with profiling.span("get_content"):
+        per_recipe = asyncio.run(aget_recipe_ingredients(recipes, notion_client, pages))
+    if parse_cache is None and getattr(recipes, "cache", None) is not None:
+        parse_cache = ParseCache()
+    with profiling.span("parse"):
+        parsed = iter(
+            parse_sentences(
+                list(chain.from_iterable(i for i in per_recipe if i)),
+                parse_cache,
+                processes,
+            )
+        )
+    by_page = {
+        page: list(islice(parsed, len(ingredients or ())))
+        for page, ingredients in zip(pages, per_recipe)
+    }
+
+    with profiling.span("merge"):
+        lists = []
+        combined = IngredientAggregator()
+        for week in weeks:
+            aggregator = IngredientAggregator()
+            for page in week:
+                aggregator.extend(by_page[page])
+                combined.extend(by_page[page])
+            lists.append(aggregator.to_dict() if len(aggregator) else None)
+        return lists, combined.to_dict() if len(combined) else None
+
+
+def format_grocery_list(ingred_dict: Optional[Mapping]) -> List[str]:
+    """Formats a grocery list from ingredients_to_list as one line per item"""
+    if ingred_dict is None:
+        return []
+    return [_block_text(block) for block in iter_todo_blocks(ingred_dict)]
+
+
+def recipe_ingredient_names(
+    recipes,
+    notion_client,
+    pages: Optional[Sequence[str]] = None,
+    parse_cache: Optional[ParseCache] = None,
+    processes: Optional[int] = None,
+) -> List[Optional[Set[str]]]:
+    """Gets the normalized names of the ingredients of each recipe, e.g. for the optimizer
 
-    else:
-        ingred_dict = None
+    Parameters
+    ----------
+    recipes : _type_
+        An instance of the NotionDatabase class with the recipes in it
+    notion_client : _type_
+        An instance of the NotionClient class
+    pages : Optional[Sequence[str]], optional
+        ids of the recipes, by default recipes.selected_pages
+    parse_cache : Optional[ParseCache], optional
+        cache of parsed sentences, by default the one in the cache directory if recipes is cached
+    processes : Optional[int], optional
+        number of processes to parse large sets of sentences with, by default the number of CPUs
 
-    return ingred_dict
+    Returns
+    -------
+    List[Optional[Set[str]]]
+        the ingredient names of each recipe, in the same order as pages, None if a
+        recipe has no ingredients that could be parsed
+    """
+    per_recipe = asyncio.run(aget_recipe_ingredients(recipes, notion_client, pages))
+    if parse_cache is None and getattr(recipes, "cache", None) is not None:
+        parse_cache = ParseCache()
+    parsed = iter(
+        parse_sentences(
+            list(chain.from_iterable(i for i in per_recipe if i)),
+            parse_cache,
+            processes,
+        )
+    )
+
+    names = []
+    for ingredients in per_recipe:
+        found = {
+            normalize_name(p.name.text)
+            for p in islice(parsed, len(ingredients or ()))
+            if p.name is not None and p.name.confidence >= 0.9
+        }
+        names.append(found or None)
+    return names
 
 
 def pluralize_unit(unit_a: str) -> str:
@@ -277,21 +786,9 @@ def pluralize_unit(unit_a: str) -> str:
     Returns
     -------
     str
-        plural
+        plural, or the unit itself if it isn't in units.UNITS
     """
-    pl = "None"
-    for plural, singular in units.UNITS.items():
-        if unit_a == singular:
-            pl = plural
-            break
-        elif unit_a == plural:
-            pl = unit_a
-            break
-        else:
-            pl = unit_a
-            break
-
-    return pl
+    return units.normalize(unit_a)
 
 
 def get_unit_type(unit_a: str) -> str:
@@ -307,12 +804,7 @@ def get_unit_type(unit_a: str) -> str:
     str
         unit type
     """
-    if unit_a in units.WEIGHT:
-        return "weight"
-    elif unit_a in units.VOLUME:
-        return "volume"
-    else:
-        return "other"
+    return units.unit_type(unit_a)
 
 
 def test_float(value: str) -> Union[str, float]:
@@ -328,22 +820,18 @@ def test_float(value: str) -> Union[str, float]:
     Union[str,float]
         either returns the original string, or the float value of that string
     """
+    # plain numbers, the most common amount, and fractions don't need a ParsedQuantity
     try:
         return float(value)
     except ValueError:
-        try:
-            num, denom = value.split("/")
-        except ValueError:
-            return value
-        try:
-            leading, num = num.split(" ")
-            whole = float(leading)
-        except ValueError:
-            whole = 0
-        frac = float(num) / float(denom)
-        return whole - frac if whole < 0 else whole + frac
-    except:
-        return value
+        pass
+    fraction = fraction_value(value)
+    if fraction is not None:
+        return fraction
+    parsed = parse_quantity(value)
+    if parsed.kind == EXACT and not parsed.unit:
+        return parsed.value
+    return value
 
 
 def convert_and_add_ingred(
@@ -395,24 +883,12 @@ def convert_and_add_ingred(
         new_unit = "{0} + {1}".format(unit_a, unit_b)
 
     elif unit_a_type == "weight" and unit_b_type == "weight":
-        ind_a = units.WEIGHT.index(unit_a)
-        ind_b = units.WEIGHT.index(unit_b)
-
-        conv = units.W_CONVERSIONS[ind_a, ind_b]
-
-        # get new amount
-        amount_a = amount_a * conv
+        amount_a = units.convert(amount_a, unit_a, unit_b)
         new_amount = amount_a + amount_b
         new_unit = unit_b
 
     elif unit_a_type == "volume" and unit_b_type == "volume":
-        ind_a = units.VOLUME.index(unit_a)
-        ind_b = units.VOLUME.index(unit_b)
-
-        conv = units.V_CONVERSIONS[ind_a, ind_b]
-
-        # get new amount
-        amount_a = amount_a * conv
+        amount_a = units.convert(amount_a, unit_a, unit_b)
         new_amount = amount_a + amount_b
         new_unit = unit_b
 
@@ -497,43 +973,15 @@ def add_ingred_together(ingred, ingred_dict: Mapping, i: int) -> Mapping:
         # just add them together
         new_amount = add_amounts(ingred.amount[0].quantity, ingred_dict["amount"][i])
         new_unit = unit_b
+    elif units.normalize(unit_a) == units.normalize(unit_b):
+        # the same unit written differently, e.g. singular and plural
+        new_amount = add_amounts(ingred.amount[0].quantity, ingred_dict["amount"][i])
+        new_unit = units.normalize(unit_a)
     else:
-        if unit_a[-1] == "s":
-            # check if units are plural
-            if units.UNITS[unit_a] == unit_b:
-                print("unit a is pluralized")
-                new_amount = add_amounts(
-                    ingred.amount[0].quantity, ingred_dict["amount"][i]
-                )
-                new_unit = unit_a
-            else:
-                # units don't match
-                # pluralize units
-                unit_b = pluralize_unit(unit_b)
-                # check amounts can be converted
-
-                new_amount, new_unit = convert_and_add_ingred(
-                    unit_a, unit_b, ingred, ingred_dict, i
-                )
-
-        elif unit_b[-1] == "s":
-            if units.UNITS[unit_b] == unit_a:
-                print("unit b is pluralized")
-                new_amount = add_amounts(
-                    ingred.amount[0].quantity, ingred_dict["amount"][i]
-                )
-                new_unit = unit_b
-            else:
-                # units don't match
-                unit_a = pluralize_unit(unit_a)
-                new_amount, new_unit = convert_and_add_ingred(
-                    unit_a, unit_b, ingred, ingred_dict, i
-                )
-        else:
-            # units don't match
-            new_amount, new_unit = convert_and_add_ingred(
-                unit_a, unit_b, ingred, ingred_dict, i
-            )
+        # units don't match, check if amounts can be converted
+        new_amount, new_unit = convert_and_add_ingred(
+            units.normalize(unit_a), units.normalize(unit_b), ingred, ingred_dict, i
+        )
 
     # add the new values to the dictionary
     ingred_dict["amount"][i] = new_amount
@@ -542,46 +990,384 @@ def add_ingred_together(ingred, ingred_dict: Mapping, i: int) -> Mapping:
     return ingred_dict
 
 
-def convert_dict_to_notion_todo(ingred_dict: Mapping) -> Mapping:
-    """Function that converts ingredient dictionary into notion page update format
+def _rich_text(content: str) -> List[Mapping]:
+    """Splits text into rich text items no longer than the API allows"""
+    null = None
+    return [
+        {
+            "type": "text",
+            "text": {"content": content[i : i + MAX_TEXT_LENGTH], "link": null},
+        }
+        for i in range(0, max(len(content), 1), MAX_TEXT_LENGTH)
+    ]
+
+
+def iter_todo_blocks(ingred_dict: Mapping) -> Generator[Mapping, None, None]:
+    """Generates a to-do block for each ingredient in the ingredient dictionary
 
     Parameters
     ----------
     ingred_dict : Mapping
         Dictionary of ingredient name, amount, and unit
 
-    Returns
-    -------
+    Yields
+    ------
     Mapping
-        Dictionary to be converted to json of each ingredient as a to-do block
+        to-do block of one ingredient
     """
-    new_blocks = {"children": []}
-
     for i in range(len(ingred_dict["name"])):
         f_ing = "{0} {1} {2}".format(
             ingred_dict["amount"][i], ingred_dict["unit"][i], ingred_dict["name"][i]
         )
 
-        null = None
-        format_block = {
+        yield {
             "object": "block",
             "type": "to_do",
             "to_do": {
-                "rich_text": [
-                    {"type": "text", "text": {"content": f_ing, "link": null}}
-                ],
+                "rich_text": _rich_text(f_ing),
                 "checked": False,
                 "color": "default",
             },
         }
 
-        new_blocks["children"].append(format_block)
 
-    return new_blocks
+def convert_dict_to_notion_todo(ingred_dict: Mapping) -> Mapping:
+    """Function that converts ingredient dictionary into notion page update format
+
+    Parameters
+    ----------
+    ingred_dict : Mapping
+        Dictionary of ingredient name, amount, and unit
+
+    Returns
+    -------
+    Mapping
+        Dictionary to be converted to json of each ingredient as a to-do block
+    """
+    return {"children": list(iter_todo_blocks(ingred_dict))}
 
 
-def post_grocery_list(recipes, notion_client):
-    """Function that removes any old grocery list and posts new grocery list to Notion
+def batch_blocks(
+    blocks: Iterable[Mapping],
+    max_blocks: int = MAX_BLOCKS_PER_REQUEST,
+    max_bytes: int = MAX_REQUEST_BYTES,
+) -> Generator[List[Mapping], None, None]:
+    """Groups blocks into batches that fit in one append request
+
+    Parameters
+    ----------
+    blocks : Iterable[Mapping]
+        blocks to append, in order
+    max_blocks : int, optional
+        most blocks in a batch, by default MAX_BLOCKS_PER_REQUEST
+    max_bytes : int, optional
+        largest JSON size of a batch, by default MAX_REQUEST_BYTES
+
+    Yields
+    ------
+    List[Mapping]
+        the next batch of blocks
+    """
+    batch = []
+    size = 0
+    for block in blocks:
+        block_size = len(json.dumps(block))
+        if batch and (len(batch) >= max_blocks or size + block_size > max_bytes):
+            yield batch
+            batch = []
+            size = 0
+        batch.append(block)
+        size += block_size
+    if batch:
+        yield batch
+
+
+@dataclass
+class AppendProgress:
+    """Progress of appending blocks to a page
+
+    Attributes
+    ----------
+    posted : int
+        number of blocks appended so far
+    batches : int
+        number of requests that succeeded
+    last_block_id : Optional[str]
+        id of the last block appended
+    error : Optional[Exception]
+        the error that stopped the append, if any
+    """
+
+    posted: int = 0
+    batches: int = 0
+    last_block_id: Optional[str] = None
+    error: Optional[Exception] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+async def aappend_blocks(
+    notion_client,
+    block_id: str,
+    blocks: Iterable[Mapping],
+    resume: Optional[AppendProgress] = None,
+    max_blocks: int = MAX_BLOCKS_PER_REQUEST,
+    on_progress: Optional[Callable[[AppendProgress], None]] = None,
+) -> AppendProgress:
+    """Appends any number of blocks to a page in order, in batches the API accepts
+
+    Batches are sent one after another so the blocks stay in order, and the next batch
+    is prepared while the previous one is in flight. The first failed batch stops the
+    append, and passing the returned progress back in as resume skips the blocks
+    already posted.
+
+    Parameters
+    ----------
+    notion_client :
+        An instance of the NotionClient class
+    block_id : str
+        id of the page or block to append to
+    blocks : Iterable[Mapping]
+        blocks to append, in order
+    resume : Optional[AppendProgress], optional
+        progress of an earlier, interrupted call with the same blocks, by default None
+    max_blocks : int, optional
+        most blocks in one request, by default MAX_BLOCKS_PER_REQUEST
+    on_progress : Optional[Callable[[AppendProgress], None]], optional
+        called after each batch is posted, by default None
+
+    Returns
+    -------
+    AppendProgress
+        number of blocks posted, and the error if the append didn't finish
+    """
+    a_client = getattr(notion_client, "aio", notion_client)
+    progress = AppendProgress()
+    blocks = iter(blocks)
+    if resume is not None:
+        progress = AppendProgress(resume.posted, resume.batches, resume.last_block_id)
+        blocks = islice(blocks, resume.posted, None)
+
+    batches = batch_blocks(blocks, max_blocks=max_blocks)
+    batch = next(batches, None)
+    while batch is not None:
+        request = asyncio.ensure_future(
+            a_client.append_block_children(block_id, {"children": batch})
+        )
+        next_batch = next(batches, None)
+        try:
+            response = await request
+            if not response.ok:
+                response.raise_for_status()
+        except requests.RequestException as err:
+            progress.error = err
+            return progress
+
+        results = response.json().get("results") or [{}]
+        progress.posted += len(batch)
+        progress.batches += 1
+        progress.last_block_id = results[-1].get("id", progress.last_block_id)
+        if on_progress is not None:
+            on_progress(progress)
+        batch = next_batch
+
+    return progress
+
+
+def _block_text(block: Mapping) -> str:
+    """Gets the plain text of a to-do block, from either the API or convert_dict_to_notion_todo"""
+    rich_text = block.get(block.get("type"), {}).get("rich_text", [])
+    text = "".join(
+        rt.get("plain_text", rt.get("text", {}).get("content", "")) for rt in rich_text
+    )
+    # items without a unit are formatted with a double space
+    return " ".join(text.split())
+
+
+class TodoDiff(NamedTuple):
+    """Changes needed to turn the current grocery list into the new one
+
+    Attributes
+    ----------
+    keep : List[str]
+        ids of to-do blocks that are unchanged, and keep their checked state
+    update : List[tuple[str, Mapping]]
+        ids of to-do blocks to reuse, with the new block for each
+    delete : List[str]
+        ids of blocks to remove
+    append : List[Mapping]
+        new blocks to add at the end of the list
+    """
+
+    keep: List[str]
+    update: List[tuple[str, Mapping]]
+    delete: List[str]
+    append: List[Mapping]
+
+
+def reconcile_todos(
+    existing: Sequence[Mapping], new_blocks: Sequence[Mapping]
+) -> TodoDiff:
+    """Works out the fewest changes that turn the existing grocery list into the new one
+
+    To-do blocks with the same text as a new item are kept. Other to-do blocks are
+    reused for the remaining new items, in order, and anything left over is deleted
+    or appended.
+
+    Parameters
+    ----------
+    existing : Sequence[Mapping]
+        blocks currently under the 'Grocery List' heading
+    new_blocks : Sequence[Mapping]
+        to-do blocks of the new grocery list, from convert_dict_to_notion_todo
+
+    Returns
+    -------
+    TodoDiff
+        the blocks to keep, update, delete and append
+    """
+    # new items by text, so each existing block can be matched in O(1)
+    wanted = {}
+    for i, block in enumerate(new_blocks):
+        wanted.setdefault(_block_text(block), []).append(i)
+
+    keep = []
+    reusable = []
+    delete = []
+    matched = set()
+    for block in existing:
+        if block.get("type") != "to_do":
+            delete.append(block["id"])
+            continue
+        same = wanted.get(_block_text(block))
+        if same:
+            matched.add(same.pop(0))
+            keep.append(block["id"])
+        else:
+            reusable.append(block["id"])
+
+    remaining = [b for i, b in enumerate(new_blocks) if i not in matched]
+    update = list(zip(reusable, remaining))
+    delete.extend(reusable[len(update) :])
+    append = remaining[len(update) :]
+
+    return TodoDiff(keep, update, delete, append)
+
+
+@dataclass
+class TodoProgress:
+    """Progress of applying a TodoDiff to a page
+
+    Attributes
+    ----------
+    page_id : Optional[str]
+        id of the page the grocery list is on
+    diff : Optional[TodoDiff]
+        the changes being made
+    failed : Dict[str, Union[requests.Response, Exception]]
+        the failed response or the exception raised for each block that couldn't be
+        updated or deleted
+    append : AppendProgress
+        progress of appending the new blocks
+    """
+
+    page_id: Optional[str] = None
+    diff: Optional[TodoDiff] = None
+    failed: Dict[str, Union[requests.Response, Exception]] = field(default_factory=dict)
+    append: AppendProgress = field(default_factory=AppendProgress)
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed and self.append.ok
+
+
+async def apply_todo_diff(
+    notion_client,
+    page_id: str,
+    diff: TodoDiff,
+    resume: Optional[TodoProgress] = None,
+) -> TodoProgress:
+    """Sends the updates and deletions of a TodoDiff concurrently, then appends the new blocks
+
+    A failed update or deletion doesn't stop the others, or the append. Passing the
+    returned progress back in as resume only sends the updates and deletions that
+    failed, and appends the blocks that weren't posted.
+
+    Parameters
+    ----------
+    notion_client :
+        An instance of the NotionClient class
+    page_id : str
+        id of the page the grocery list is on
+    diff : TodoDiff
+        changes to make
+    resume : Optional[TodoProgress], optional
+        progress of an earlier, unfinished call with the same diff, by default None
+
+    Returns
+    -------
+    TodoProgress
+        the blocks that couldn't be changed, and the progress of appending the new blocks
+    """
+    a_client = getattr(notion_client, "aio", notion_client)
+    update, delete = diff.update, diff.delete
+    append_resume = None
+    if resume is not None:
+        update = [
+            (block_id, block) for block_id, block in update if block_id in resume.failed
+        ]
+        delete = [block_id for block_id in delete if block_id in resume.failed]
+        append_resume = resume.append
+
+    async def _send(request):
+        try:
+            return await request
+        except requests.RequestException as err:
+            return err
+
+    block_ids = [block_id for block_id, block in update] + list(delete)
+    responses = await asyncio.gather(
+        *(
+            _send(
+                a_client.update_block(
+                    block_id,
+                    {
+                        "to_do": {
+                            "rich_text": block["to_do"]["rich_text"],
+                            "checked": False,
+                        }
+                    },
+                )
+            )
+            for block_id, block in update
+        ),
+        *(_send(a_client.delete_block(block_id)) for block_id in delete),
+    )
+
+    progress = TodoProgress(page_id, diff)
+    for block_id, response in zip(block_ids, responses):
+        if isinstance(response, Exception) or not response.ok:
+            progress.failed[block_id] = response
+
+    progress.append = await aappend_blocks(
+        notion_client, page_id, diff.append, resume=append_resume
+    )
+    return progress
+
+
+def post_grocery_list(
+    recipes,
+    notion_client,
+    sync: str = "diff",
+    dry_run: bool = False,
+    mealplan_page_id: Optional[str] = None,
+    parse_cache: Optional[ParseCache] = None,
+    ingred_dict: Optional[Mapping] = None,
+    resume: Optional[TodoProgress] = None,
+) -> TodoProgress:
+    """Function that updates the grocery list on the Notion page to match the selected recipes
 
     Parameters
     ----------
@@ -589,34 +1375,97 @@ def post_grocery_list(recipes, notion_client):
         An instance of the NotionDatabase class
     notion_client :
         An instance of the NotionClient class
-    """
+    sync : str, optional
+        "diff" to only change the items that differ from the current list, keeping the
+        checked state of unchanged items, or "replace" to remove the old list and post
+        the new one, by default "diff"
+    dry_run : bool, optional
+        if True, print the grocery list instead of posting it, by default False
+    mealplan_page_id : Optional[str], optional
+        id of the page the grocery list is on, by default $NOTION_MP_ID
+    parse_cache : Optional[ParseCache], optional
+        cache of parsed sentences, see ingredients_to_list
+    ingred_dict : Optional[Mapping], optional
+        grocery list to post, e.g. from weekly_grocery_lists, by default the list of
+        recipes.selected_pages from ingredients_to_list
+    resume : Optional[TodoProgress], optional
+        progress returned by an earlier call that didn't finish. Only the changes it
+        didn't make are sent, without reading the page or the recipes again, by default None
 
-    if len(recipes.selected_pages) > 0:
-        NOTION_MP_ID = os.environ.get("NOTION_MP_ID")
+    Returns
+    -------
+    TodoProgress
+        the changes made, with ok False if the grocery list couldn't be updated
+    """
 
-        # remove old list first
-        grocery_page = NotionPage(notion_client, "Meal Plan and Grocery List")
-        grocery_page.get_content([NOTION_MP_ID])
-        block_ids = grocery_page.get_prev_todo_ids()
+    if resume is not None and resume.diff is not None and not dry_run:
+        with profiling.span("post"):
+            progress = asyncio.run(
+                apply_todo_diff(notion_client, resume.page_id, resume.diff, resume)
+            )
+        _print_progress(progress)
+        return progress
 
-        if block_ids:
-            for b in block_ids:
-                notion_client.delete_block(b)
+    if len(recipes.selected_pages) > 0:
+        NOTION_MP_ID = mealplan_page_id or os.environ.get("NOTION_MP_ID")
 
-        ingred_dict = ingredients_to_list(recipes, notion_client)
+        if not dry_run:
+            with profiling.span("grocery_page"):
+                grocery_page = NotionPage(notion_client, "Meal Plan and Grocery List")
+                grocery_page.get_content([NOTION_MP_ID])
 
+        if ingred_dict is None:
+            ingred_dict = ingredients_to_list(recipes, notion_client, parse_cache)
         if ingred_dict is not None:
-            # convert to appropriate json
-            new_blocks = convert_dict_to_notion_todo(ingred_dict)
+            new_blocks = convert_dict_to_notion_todo(ingred_dict)["children"]
+        else:
+            print("No ingredients were found")
+            new_blocks = []
 
-            try:
-                notion_client.append_block_children(NOTION_MP_ID, new_blocks)
+        if dry_run:
+            print("Grocery list:")
+            for item in format_grocery_list(ingred_dict):
+                print("  " + item)
+            return TodoProgress()
 
-                print("Updated grocery list")
-            except:
-                print("error updating grocery list")
+        if sync == "diff":
+            diff = reconcile_todos(grocery_page.get_prev_todos(), new_blocks)
         else:
-            print("No ingredients were found")
+            # remove old list first, deleting a block deletes the blocks nested in it
+            old_ids = [block["id"] for block in grocery_page.get_prev_todos()]
+            diff = TodoDiff([], [], old_ids, new_blocks)
+
+        with profiling.span("post"):
+            progress = asyncio.run(apply_todo_diff(notion_client, NOTION_MP_ID, diff))
+        _print_progress(progress)
+        return progress
 
     else:
         print("There are no selected recipes")
+        return TodoProgress()
+
+
+def _print_progress(progress: TodoProgress):
+    """Prints the outcome of posting a grocery list"""
+    diff = progress.diff
+    if progress.ok:
+        print(
+            "Updated grocery list: {0} unchanged, {1} changed, {2} removed, {3} added".format(
+                len(diff.keep), len(diff.update), len(diff.delete), len(diff.append)
+            )
+        )
+    else:
+        print(
+            "error updating grocery list, {0} of {1} old items couldn't be changed, "
+            "{2} of {3} new items were added".format(
+                len(progress.failed),
+                len(diff.update) + len(diff.delete),
+                progress.append.posted,
+                len(diff.append),
+            )
+        )
+        for block_id, error in progress.failed.items():
+            print("for block id {0}".format(block_id))
+            print(error)
+        if progress.append.error is not None:
+            print(progress.append.error)
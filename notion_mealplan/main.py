@@ -1,5 +1,23 @@
+import argparse
+import json
+import os
+import sys
+from typing import Optional, Sequence
+import requests
+from dotenv import load_dotenv
+from . import batch
 from . import mp_functions as mp
 from . import grocery_list as groc
+from . import profiling
+
+# exit codes of the mealplan command
+EXIT_OK = 0
+# a request to Notion failed, or a meal plan couldn't be made from the recipes
+EXIT_FAILURE = 1
+# the arguments were invalid, argparse exits with this as well
+EXIT_USAGE = 2
+# $NOTION_KEY or $NOTION_PAGE_ID isn't set, or the --config file is invalid
+EXIT_CONFIG = 3
 
 
 def get_input() -> tuple[int, int]:
@@ -13,37 +31,257 @@ def get_input() -> tuple[int, int]:
         repeat_freq is the number of those recipes that can be repeats from the previous week
     """
 
-    print("How many recipes do you need this week?")
-    k = input()
-    print("How much repetition will you allow from last week? (Recommended is 1)")
-    repeat_freq = input()
+    while True:
+        print("How many recipes do you need this week?")
+        k = input()
+        print("How much repetition will you allow from last week? (Recommended is 1)")
+        repeat_freq = input()
+
+        # convert to int
+        try:
+            return (int(k), int(repeat_freq))
+        except ValueError:
+            print(
+                "Number of recipes and repetition frequency must be integers, please try again"
+            )
+
 
-    # convert to int
+def _count(value: str) -> int:
+    """Parses a command line argument that must be a whole number of at least 0"""
     try:
-        k = int(k)
-        repeat_freq = int(repeat_freq)
-    except:
-        print(
-            "Number of recipes and repetition frequency must be integers, please try again"
+        count = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError("{0!r} is not an integer".format(value))
+    if count < 0:
+        raise argparse.ArgumentTypeError("{0} is negative".format(count))
+    return count
+
+
+def _positive(value: str) -> int:
+    """Parses a command line argument that must be a whole number of at least 1"""
+    count = _count(value)
+    if count == 0:
+        raise argparse.ArgumentTypeError("must be at least 1")
+    return count
+
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    """Function to parse the command line arguments
+
+    Parameters
+    ----------
+    argv : Optional[Sequence[str]], optional
+        the arguments, by default sys.argv[1:]
+    """
+    parser = argparse.ArgumentParser(
+        prog="mealplan",
+        description="Notion meal planner and grocery list. "
+        "Prompts for the number of recipes when --recipes isn't given.",
+    )
+    parser.add_argument(
+        "-n", "--recipes", type=_positive, help="number of recipes to plan each week"
+    )
+    parser.add_argument(
+        "-r",
+        "--repeat",
+        type=_count,
+        default=None,
+        help="number of recipes that can be repeats from the previous week (default 1)",
+    )
+    parser.add_argument(
+        "--weeks",
+        type=_positive,
+        default=1,
+        help="number of consecutive weeks to plan, only the first is marked as planned "
+        "in Notion (default 1)",
+    )
+    parser.add_argument(
+        "--combined",
+        action="store_true",
+        help="with --weeks, post one grocery list for every week instead of the first week's",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="print the meal plan and grocery list without changing anything in Notion",
+    )
+    parser.add_argument(
+        "--no-grocery", action="store_true", help="don't make a grocery list"
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=_positive,
+        default=10,
+        help="most requests to Notion in flight at once (default 10)",
+    )
+    parser.add_argument(
+        "--config",
+        metavar="PATH",
+        help="plan for every household in a TOML file, see notion_mealplan.batch. "
+        "--recipes and --repeat then replace the defaults at the top of the file",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="print how long each stage took and the requests sent to Notion",
+    )
+    parser.add_argument(
+        "--report", metavar="PATH", help="write the profile as a JSON run report"
+    )
+    args = parser.parse_args(argv)
+
+    if args.config is not None:
+        if args.weeks > 1:
+            parser.error("--weeks can't be used with --config")
+        return args
+    if args.recipes is None:
+        if args.repeat is not None:
+            parser.error("--repeat requires --recipes")
+        if not sys.stdin.isatty():
+            parser.error("--recipes is required when not run interactively")
+    elif args.repeat is None:
+        args.repeat = 1
+    return args
+
+
+def post_weekly_lists(args: argparse.Namespace, recipes, notion_client) -> bool:
+    """Prints the grocery list of each week, and posts the first week's or the combined one
+
+    Returns
+    -------
+    bool
+        False if the grocery list couldn't be posted
+    """
+    lists, combined = groc.weekly_grocery_lists(recipes, notion_client, recipes.weeks)
+    sections = [("Week {0}".format(i), l) for i, l in enumerate(lists, 1)]
+    if args.combined:
+        sections.append(("All weeks", combined))
+    for title, ingred_dict in sections:
+        print("{0} grocery list:".format(title))
+        for item in groc.format_grocery_list(ingred_dict):
+            print("  " + item)
+
+    if args.dry_run:
+        return True
+    return groc.post_grocery_list(
+        recipes, notion_client, ingred_dict=combined if args.combined else lists[0]
+    ).ok
+
+
+def run(args: argparse.Namespace) -> int:
+    """Makes the meal plan and grocery list described by the parsed arguments
+
+    Returns
+    -------
+    int
+        the exit code
+    """
+    for name in ("NOTION_KEY", "NOTION_PAGE_ID"):
+        if not os.environ.get(name):
+            print("${0} is not set".format(name), file=sys.stderr)
+            return EXIT_CONFIG
+
+    if args.recipes is None:
+        k, repeat_freq = get_input()
+    else:
+        k, repeat_freq = args.recipes, args.repeat
+
+    status = EXIT_OK
+    profiler = profiling.Profiler()
+    notion_client = mp.NotionClient(
+        os.environ["NOTION_KEY"], pool_maxsize=args.concurrency
+    )
+    try:
+        with profiler.activate():
+            with profiler.span("mealplan"):
+                try:
+                    recipes, notion_client = mp.get_mealplan(
+                        k,
+                        repeat_freq,
+                        concurrency=args.concurrency,
+                        notion_client=notion_client,
+                        dry_run=args.dry_run,
+                        strict=True,
+                        weeks=args.weeks,
+                    )
+                except ValueError as e:
+                    print("Could not make a meal plan: {0}".format(e), file=sys.stderr)
+                    return EXIT_FAILURE
+
+            print("Meal plan:" if args.dry_run else "Meal plan updated:")
+            for week, pages in enumerate(recipes.weeks, 1):
+                if args.weeks > 1:
+                    print(" Week {0}:".format(week))
+                for page in pages:
+                    print("  " + recipes.db.names[recipes.db.index[page]])
+
+            if not args.no_grocery:
+                with profiler.span("grocery_list"):
+                    if args.weeks > 1:
+                        ok = post_weekly_lists(args, recipes, notion_client)
+                    else:
+                        ok = groc.post_grocery_list(
+                            recipes, notion_client, dry_run=args.dry_run
+                        ).ok
+                if not ok:
+                    status = EXIT_FAILURE
+    except requests.RequestException as e:
+        print("Request to Notion failed: {0}".format(e), file=sys.stderr)
+        status = EXIT_FAILURE
+
+    if args.profile:
+        print(profiling.format_report(profiler.report(notion_client)))
+    if args.report:
+        profiler.write_json(args.report, notion_client)
+    return status
+
+
+def run_config(args: argparse.Namespace) -> int:
+    """Makes the meal plans and grocery lists of every household in the --config file
+
+    Returns
+    -------
+    int
+        the exit code
+    """
+    try:
+        households = batch.load_config(
+            args.config, {"recipes": args.recipes, "repeat": args.repeat}
         )
-        get_input()
+    except (OSError, ValueError) as e:
+        print("Invalid config: {0}".format(e), file=sys.stderr)
+        return EXIT_CONFIG
+    if args.no_grocery:
+        for household in households:
+            household.grocery = False
+
+    report = batch.run_batch(
+        households, dry_run=args.dry_run, concurrency=args.concurrency
+    )
 
-    return (k, repeat_freq)
+    print(batch.format_batch_report(report, profile=args.profile))
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+    return EXIT_OK if report["ok"] else EXIT_FAILURE
 
 
-def main() -> None:
+def main(argv: Optional[Sequence[str]] = None) -> int:
     """This is the main function that generates the meal plan and grocery list."""
 
-    print("Welcome to the Notion Meal Planner")
+    args = parse_args(argv)
+    load_dotenv()
 
-    k, repeat_freq = get_input()
+    print("Welcome to the Notion Meal Planner")
 
-    recipes, notion_client = mp.get_mealplan(k, repeat_freq)
+    status = run(args) if args.config is None else run_config(args)
 
-    print("Meal plan updated")
+    if status == EXIT_OK:
+        print("*****************************************")
+        print("Mealplan complete!")
+        print("*****************************************")
+    return status
 
-    groc.post_grocery_list(recipes, notion_client)
 
-    print("*****************************************")
-    print("Mealplan complete!")
-    print("*****************************************")
+if __name__ == "__main__":
+    sys.exit(main())
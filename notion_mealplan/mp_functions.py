@@ -1,16 +1,55 @@
-from collections import ChainMap
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
 import os
+import threading
+import time
 import requests
+from requests.adapters import HTTPAdapter
 import json
 from urllib.parse import urljoin
 from dotenv import load_dotenv
 import random
-from typing import Union, List, Sequence, Generator, Mapping, Optional
+from typing import (
+    Union,
+    List,
+    Sequence,
+    Generator,
+    Mapping,
+    Optional,
+    Dict,
+    Iterable,
+    Tuple,
+)
 from . import notion_filters as nf
+from .cache import NotionCache, format_time, is_archived
+from . import rate_limit as rl
+from .recipe_table import RecipeTable
+from . import grocery_list as groc
+from . import optimizer
+from . import profiling
+from . import sampling
 from . import units as units
 
 n_headings = nf.headings
 
+# largest page size the Notion API accepts
+MAX_PAGE_SIZE = 100
+
+# the Notion API, can be changed with $NOTION_BASE_URL, e.g. to a testing.FakeNotion server
+NOTION_BASE_URL = "https://api.notion.com/v1/"
+
+# seconds to wait to connect and to wait between bytes of the response, so a stalled
+# connection is retried instead of blocking a worker thread
+REQUEST_TIMEOUT = (5, 30)
+
+# status recorded in the request metrics for a timeout or dropped connection
+CONNECTION_FAILED = 599
+
+# the cache is rebuilt from a full query after this long, in case it has drifted from Notion
+FULL_SYNC_AFTER = timedelta(days=30)
+
 
 def load_env_variables():
     # check for Notion variables
@@ -22,14 +61,66 @@ def load_env_variables():
         print("Notion page id doesn't exist")
 
 
+@dataclass
+class UpdateResult:
+    """Outcome of updating several pages at once
+
+    Attributes
+    ----------
+    updated : List[str]
+        ids of the pages that were updated
+    skipped : List[str]
+        ids of the pages that didn't need updating
+    failed : Dict[str, Union[requests.Response, Exception]]
+        the failed response or the exception raised for each page that couldn't be updated
+    pages : Dict[str, Mapping]
+        the page object returned for each updated page
+    """
+
+    updated: List[str] = field(default_factory=list)
+    skipped: List[str] = field(default_factory=list)
+    failed: Dict[str, Union[requests.Response, Exception]] = field(default_factory=dict)
+    pages: Dict[str, Mapping] = field(default_factory=dict)
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed
+
+    def raise_for_status(self):
+        """Raises an HTTPError listing the pages that failed, if any"""
+        if self.failed:
+            raise requests.HTTPError(
+                "{0} page update(s) failed: {1}".format(
+                    len(self.failed), ", ".join(self.failed)
+                )
+            )
+
+
 class NotionClient:
     # class to deal with Notion API
     # gets notion key and page number from environment variables
     # outputs response from notion api
     # has methods for querying database and updating properties of a page in the database
+    # every call is paced by a token bucket, and 429s, transient 5xx errors, timeouts and
+    # dropped connections are retried
 
-    def __init__(self, notion_key: Optional[str]):
+    def __init__(
+        self,
+        notion_key: Optional[str],
+        pool_maxsize: int = 10,
+        rate_limit: float = rl.NOTION_RATE,
+        max_retries: int = 5,
+        base_url: Optional[str] = None,
+        timeout: Union[float, Tuple[float, float]] = REQUEST_TIMEOUT,
+    ):
         self.notion_key = notion_key
+        self.pool_maxsize = pool_maxsize
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.limiter = rl.TokenBucket(rate_limit)
+        self.stats = {"requests": 0, "throttled": 0, "retried": 0, "wait_s": 0.0}
+        self._stats_lock = threading.Lock()
+        self.metrics = profiling.RequestMetrics()
 
         self.default_headers = {
             "Authorization": f"Bearer {self.notion_key}",
@@ -38,10 +129,108 @@ class NotionClient:
         }
         self.session = requests.Session()
         self.session.headers.update(self.default_headers)
-        self.NOTION_BASE_URL = "https://api.notion.com/v1/"
+        self.mount_pool(pool_maxsize)
+        self.NOTION_BASE_URL = (
+            base_url or os.environ.get("NOTION_BASE_URL") or NOTION_BASE_URL
+        )
+        self._aio = None
+
+    def mount_pool(self, pool_maxsize: int):
+        """Sets the number of connections kept open to the API"""
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.pool_maxsize = pool_maxsize
+
+    def _count(self, key: str, value=1):
+        with self._stats_lock:
+            self.stats[key] += value
+
+    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Sends a request once the rate limiter allows it, retrying 429 and 5xx responses
+        as well as timeouts and connection errors
+
+        Parameters
+        ----------
+        method : str
+            HTTP method
+        url : str
+            full url of the endpoint
+
+        Returns
+        -------
+        requests.Response
+            the first successful response, or the last failed one once retries run out
+
+        Raises
+        ------
+        requests.ConnectionError, requests.Timeout
+            if the last attempt couldn't connect or timed out
+        """
+        name = profiling.endpoint(method, url)
+        kwargs.setdefault("timeout", self.timeout)
+        attempt = 0
+        while True:
+            self._count("wait_s", self.limiter.acquire())
+            self._count("requests")
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                self.metrics.record(
+                    name, CONNECTION_FAILED, time.perf_counter() - start
+                )
+                if attempt >= self.max_retries:
+                    raise
+                wait = rl.backoff(attempt)
+                attempt += 1
+                self._count("retried")
+                time.sleep(wait)
+                continue
+            self.metrics.record(
+                name,
+                response.status_code,
+                time.perf_counter() - start,
+                len(getattr(response.request, "body", None) or b""),
+                len(response.content or b""),
+            )
+
+            if response.status_code == 429:
+                self._count("throttled")
+                wait = rl.retry_after(response)
+                if wait is None:
+                    wait = rl.backoff(attempt)
+                # hold back every other call on this integration as well,
+                # the next acquire then waits out the Retry-After period
+                self.limiter.defer(wait)
+                wait = 0.0
+            elif response.status_code in rl.RETRY_STATUS:
+                wait = rl.backoff(attempt)
+            else:
+                return response
+
+            if attempt >= self.max_retries:
+                return response
+            attempt += 1
+            self._count("retried")
+            if wait > 0:
+                time.sleep(wait)
+
+    @property
+    def aio(self):
+        """An AsyncNotionClient sharing this client's session and connection pool"""
+        if self._aio is None:
+            self._aio = AsyncNotionClient(client=self)
+        return self._aio
 
     def query_database(
-        self, db_id, filter_object=None, sorts=None, start_cursor=None, page_size=None
+        self,
+        db_id,
+        filter_object=None,
+        sorts=None,
+        start_cursor=None,
+        page_size=None,
+        filter_properties=None,
     ):
         db_url = urljoin(self.NOTION_BASE_URL, f"databases/{db_id}/query")
         params = {}
@@ -53,21 +242,35 @@ class NotionClient:
             params["start_cursor"] = start_cursor
         if page_size is not None:
             params["page_size"] = page_size
+        # ids of the only properties to return, sent in the query string
+        query = None
+        if filter_properties is not None:
+            query = {"filter_properties": list(filter_properties)}
 
-        return self.session.post(db_url, json=params)
+        return self._request("POST", db_url, json=params, params=query)
 
     def update_page(self, page_id: str, properties: Mapping):
         pg_url = urljoin(self.NOTION_BASE_URL, f"pages/{page_id}")
 
-        return self.session.patch(pg_url, json=properties)
+        return self._request("PATCH", pg_url, json=properties)
 
-    def get_children(self, block_id: str):
+    def get_children(self, block_id: str, start_cursor=None, page_size=None):
         b_url = urljoin(self.NOTION_BASE_URL, f"blocks/{block_id}/children")
-        return self.session.get(b_url)
+        params = {}
+        if start_cursor is not None:
+            params["start_cursor"] = start_cursor
+        if page_size is not None:
+            params["page_size"] = page_size
+
+        return self._request("GET", b_url, params=params)
+
+    def update_block(self, block_id: str, properties: Mapping):
+        ub_url = urljoin(self.NOTION_BASE_URL, f"blocks/{block_id}")
+        return self._request("PATCH", ub_url, json=properties)
 
     def append_block_children(self, block_id: str, properties: Mapping):
         ab_url = urljoin(self.NOTION_BASE_URL, f"blocks/{block_id}/children")
-        return self.session.patch(ab_url, json=properties)
+        return self._request("PATCH", ab_url, json=properties)
 
     def delete_block(self, block_id: str):
         """Function that deletes blocks using Notion API
@@ -83,7 +286,137 @@ class NotionClient:
             _description_
         """
         d_url = urljoin(self.NOTION_BASE_URL, f"blocks/{block_id}")
-        return self.session.delete(d_url)
+        return self._request("DELETE", d_url)
+
+    def update_pages(self, updates: Mapping[str, Mapping]) -> UpdateResult:
+        """Updates several pages concurrently, see AsyncNotionClient.update_pages"""
+        return asyncio.run(self.aio.update_pages(updates))
+
+
+class AsyncNotionClient:
+    """Asyncio version of NotionClient with the same methods, each of which returns a coroutine.
+
+    Requests are sent on the pooled session of a NotionClient by a thread pool of
+    ``concurrency`` workers, so at most ``concurrency`` calls are in flight at once
+    and each of them reuses an open connection.
+
+    Parameters
+    ----------
+    notion_key : Optional[str], optional
+        the personal notion key, used to create a new NotionClient, by default None
+    concurrency : Optional[int], optional
+        maximum number of requests in flight, by default the pool size of the client
+    client : Optional[NotionClient], optional
+        an existing NotionClient to share the session of, by default None
+    """
+
+    def __init__(
+        self,
+        notion_key: Optional[str] = None,
+        concurrency: Optional[int] = None,
+        client: Optional[NotionClient] = None,
+    ):
+        if client is None:
+            client = NotionClient(notion_key, pool_maxsize=concurrency or 10)
+        if concurrency is None:
+            concurrency = client.pool_maxsize
+        elif concurrency > client.pool_maxsize:
+            # make sure every worker can hold its own connection
+            client.mount_pool(concurrency)
+
+        self.client = client
+        self.concurrency = concurrency
+        self._executor = ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix="notion"
+        )
+
+    async def _run(self, method, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, lambda: method(*args, **kwargs)
+        )
+
+    async def query_database(
+        self,
+        db_id,
+        filter_object=None,
+        sorts=None,
+        start_cursor=None,
+        page_size=None,
+        filter_properties=None,
+    ):
+        return await self._run(
+            self.client.query_database,
+            db_id,
+            filter_object,
+            sorts=sorts,
+            start_cursor=start_cursor,
+            page_size=page_size,
+            filter_properties=filter_properties,
+        )
+
+    async def update_page(self, page_id: str, properties: Mapping):
+        return await self._run(self.client.update_page, page_id, properties)
+
+    async def get_children(self, block_id: str, start_cursor=None, page_size=None):
+        return await self._run(
+            self.client.get_children,
+            block_id,
+            start_cursor=start_cursor,
+            page_size=page_size,
+        )
+
+    async def update_block(self, block_id: str, properties: Mapping):
+        return await self._run(self.client.update_block, block_id, properties)
+
+    async def append_block_children(self, block_id: str, properties: Mapping):
+        return await self._run(self.client.append_block_children, block_id, properties)
+
+    async def delete_block(self, block_id: str):
+        return await self._run(self.client.delete_block, block_id)
+
+    async def update_pages(self, updates: Mapping[str, Mapping]) -> UpdateResult:
+        """Sends the property updates for several pages concurrently, collecting any failures
+
+        Parameters
+        ----------
+        updates : Mapping[str, Mapping]
+            the properties to update for each page id
+
+        Returns
+        -------
+        UpdateResult
+            the pages that were updated and the failures of the rest
+        """
+
+        async def _update(page_id: str, properties: Mapping):
+            try:
+                return await self.update_page(page_id, properties)
+            except requests.RequestException as err:
+                return err
+
+        responses = await asyncio.gather(
+            *(_update(page_id, properties) for page_id, properties in updates.items())
+        )
+
+        result = UpdateResult()
+        for page_id, response in zip(updates, responses):
+            if isinstance(response, Exception) or not response.ok:
+                result.failed[page_id] = response
+            else:
+                result.updated.append(page_id)
+                result.pages[page_id] = response.json()
+        return result
+
+    def close(self):
+        """Shuts down the worker threads, leaving the session of the NotionClient open"""
+        self._executor.shutdown(wait=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
 
 
 class NotionDatabase:
@@ -93,8 +426,66 @@ class NotionDatabase:
 
     def __init__(self, notion_client):
         self.notion_client = notion_client
+        self.db = RecipeTable()
+        self.db_len = 0
+        self.db_id = None
+        self.cache = None
+        # recipe ids of each week, see select_weeks
+        self.weeks = []
+        # recipes optimize_select picked at random because their ingredients aren't known
+        self.unoptimized = 0
+
+    def iter_results(
+        self,
+        db_id: Optional[str],
+        filter_object=None,
+        page_size: Optional[int] = MAX_PAGE_SIZE,
+        filter_properties: Optional[Sequence[str]] = None,
+    ) -> Generator[List, None, None]:
+        """Queries the database and yields the results of each page of the response as it arrives
+
+        Parameters
+        ----------
+        db_id : Optional[str]
+            The id of the database to be read in
+        filter_object : _type_, optional
+            Any filter to be applied to the database, by default None
+        page_size : Optional[int], optional
+            number of results per request, by default MAX_PAGE_SIZE
+        filter_properties : Optional[Sequence[str]], optional
+            ids of the only properties to return, by default every property
+
+        Yields
+        ------
+        List
+            the results of one page of the query
+        """
+        start_cursor = None
+        while True:
+            db_response = self.notion_client.query_database(
+                db_id,
+                filter_object,
+                start_cursor=start_cursor,
+                page_size=page_size,
+                filter_properties=filter_properties,
+            )
+            if not db_response.ok:
+                # raise an error if there's something wrong
+                db_response.raise_for_status()
+
+            db_response_obj = db_response.json()
+            yield db_response_obj["results"]
 
-    def load_db(self, db_id: Optional[str], filter_object=None):
+            start_cursor = db_response_obj.get("next_cursor")
+            if not db_response_obj.get("has_more") or start_cursor is None:
+                break
+
+    def load_db(
+        self,
+        db_id: Optional[str],
+        filter_object=None,
+        page_size: Optional[int] = MAX_PAGE_SIZE,
+    ):
         """Loads in database pages from Notion, iterating through pages if necessary
 
         Parameters
@@ -103,33 +494,95 @@ class NotionDatabase:
             The id of the database to be read in
         filter_object : _type_, optional
             Any filter to be applied to the database, typically one of those in notion_filters, by default None
+        page_size : Optional[int], optional
+            number of results per request, by default MAX_PAGE_SIZE
         """
-        page_count = 1
-        db_response = self.notion_client.query_database(db_id, filter_object)
-        records = {}
-        if db_response.ok:
-            records = db_response.json()
-            db_response_obj = db_response.json()
+        # ingest each page of results as it arrives so the raw JSON isn't kept
+        table = RecipeTable()
+        for page_results in self.iter_results(db_id, filter_object, page_size):
+            table.extend(page_results)
 
-            while db_response_obj.get("has_more"):
-                page_count += 1
-                start_cursor = db_response_obj.get("next_cursor")
-                db_response = self.notion_client.query_database(
-                    db_id, filter_object, start_cursor=start_cursor
-                )
+        self.db = table
+        self.db_id = db_id
+        self.db_len = len(self.db)  # calculate length every time database is loaded in
+
+    def sync_db(
+        self,
+        db_id: Optional[str],
+        cache: NotionCache,
+        page_size: Optional[int] = MAX_PAGE_SIZE,
+        full_sync_after: timedelta = FULL_SYNC_AFTER,
+    ):
+        """Loads in the whole database through a local cache, only querying pages edited since the last sync
 
-                if db_response.ok:
-                    records = ChainMap(records, db_response.json())
-                else:
-                    db_response.raise_for_status()
+        An incremental sync also lists the ids of every page, without their properties,
+        so pages deleted from the database since the last sync are removed from the cache.
+
+        Parameters
+        ----------
+        db_id : Optional[str]
+            The id of the database to be read in
+        cache : NotionCache
+            cache the database rows are kept in
+        page_size : Optional[int], optional
+            number of results per request, by default MAX_PAGE_SIZE
+        full_sync_after : timedelta, optional
+            time after which the whole database is queried again, by default FULL_SYNC_AFTER
+        """
+        # take the time before querying so edits made during the sync are picked up next time,
+        # rounded down to the minute like last_edited_time so later edits in the same minute are too
+        sync_time = format_time(
+            datetime.now(timezone.utc).replace(second=0, microsecond=0)
+        )
+        full = cache.needs_full_sync(db_id, full_sync_after)
+        filter_object = None if full else nf.filter_edited_since(cache.last_sync(db_id))
+
+        if full:
+            # collect everything first so a failed query leaves the old rows in place
+            pages = []
+            for page_results in self.iter_results(db_id, filter_object, page_size):
+                pages.extend(page_results)
+            cache.put_rows(db_id, pages, sync_time=sync_time, full=True)
         else:
-            # raise an error if there's something wrong
-            db_response.raise_for_status()
+            # the query doesn't return deleted pages, so find them by listing what is left
+            page_ids = set()
+            for page_results in self.iter_results(
+                db_id, None, page_size, filter_properties=[nf.title_property_id]
+            ):
+                page_ids.update(p["id"] for p in page_results if not is_archived(p))
+            cache.remove_missing(db_id, page_ids)
+            for page_results in self.iter_results(db_id, filter_object, page_size):
+                cache.put_rows(db_id, page_results)
+            cache.put_rows(db_id, [], sync_time=sync_time)
+
+        self.db = RecipeTable.from_results(cache.rows(db_id))
+        self.db_id = db_id
+        self.db_len = len(self.db)
+        self.cache = cache
+
+    def subset(
+        self, dish: Optional[str] = None, planned: Optional[bool] = None
+    ) -> "NotionDatabase":
+        """Creates a database containing only the recipes with the given dish tag and/or planned flag
+
+        Parameters
+        ----------
+        dish : Optional[str], optional
+            dish tag the recipe must have, by default None
+        planned : Optional[bool], optional
+            required value of 'Planned this week', by default None
 
-        self.db = records
-        self.db_len = len(
-            self.db["results"]
-        )  # calculate length every time database is loaded in
+        Returns
+        -------
+        NotionDatabase
+            database sharing this one's client and cache
+        """
+        sub = NotionDatabase(self.notion_client)
+        sub.db = self.db.take(self.db.where(dish=dish, planned=planned))
+        sub.db_len = len(sub.db)
+        sub.db_id = self.db_id
+        sub.cache = self.cache
+        return sub
 
     def get_page(self, k: int) -> tuple[str, str]:
         """Gets page name and id from the database info
@@ -148,14 +601,15 @@ class NotionDatabase:
                 title of the page
         """
 
-        page_id = self.db["results"][k]["id"]
-        page_name = self.db["results"][k]["properties"]["Name"]["title"][0][
-            "plain_text"
-        ]
-        return (page_id, page_name)
+        return self.db.get(k)
 
     def random_select(
-        self, n: int, prev_pages: Optional[Sequence] = None, repeat_freq: int = 0
+        self,
+        n: int,
+        prev_pages: Optional[Sequence] = None,
+        repeat_freq: int = 0,
+        weights: Optional[Sequence[float]] = None,
+        rng: Optional[random.Random] = None,
     ):
         """randomly selects n unique recipes, checking against previous recipe list for repetition
 
@@ -167,93 +621,235 @@ class NotionDatabase:
             previous list of recipe ids, by default None
         repeat_freq : int, optional
             number of times that a recipe from prev_pages can appear, by default 0
+        weights : Optional[Sequence[float]], optional
+            relative chance of selecting each row of the database, e.g. a rating or
+            sampling.days_since(self.db.last_edited), by default all equal
+        rng : Optional[random.Random], optional
+            source of random numbers, by default the random module
+
+        Raises
+        ------
+        ValueError
+            if there aren't enough recipes to select n without going over repeat_freq
         """
+        prev_rows = [self.db.index[p] for p in prev_pages or () if p in self.db]
+        rows = sampling.sample_rows(
+            n, range(self.db_len), prev_rows, repeat_freq, weights, rng
+        )
 
-        rep = 0
-        pages = []
-        page_names = []
-        i = 0
-        while i < n:
-            k = random.randint(0, self.db_len - 1)
-            page, page_name = self.get_page(k)
-            if prev_pages is not None and page in prev_pages:
-                rep += 1
-                if rep > repeat_freq:
-                    continue
-                else:
-                    i += 1
-                    pages.append(page)
-                    page_names.append(page_name)
-            elif page in pages:
-                continue
-            else:
-                i += 1
-                pages.append(page)
-                page_names.append(page_name)
+        self.selected_pages = [self.db.ids[k] for k in rows]
+        self.selected_page_names = [self.db.names[k] for k in rows]
 
-        self.selected_pages = pages
-        self.selected_page_names = page_names
+    def optimize_select(
+        self,
+        n: int,
+        ingredients: Sequence[Optional[Iterable[str]]],
+        prev_pages: Optional[Sequence] = None,
+        repeat_freq: int = 0,
+        objective: str = "distinct",
+        rng: Optional[random.Random] = None,
+    ):
+        """selects n unique recipes that share as many ingredients as possible, see optimizer.optimize_rows
 
-        # self.sample = random.sample(range(0,self.db_len),k=n)
+        Parameters
+        ----------
+        n : int
+            number of recipes to select
+        ingredients : Sequence[Optional[Iterable[str]]]
+            ingredient names of each row of the database, None if unknown
+        prev_pages : Optional[Sequence], optional
+            previous list of recipe ids, by default None
+        repeat_freq : int, optional
+            number of times that a recipe from prev_pages can appear, by default 0
+        objective : str, optional
+            "distinct" or "overlap", by default "distinct"
+        rng : Optional[random.Random], optional
+            source of random numbers, by default the random module
+
+        Raises
+        ------
+        ValueError
+            if there aren't enough recipes to select n without going over repeat_freq
+        """
+        prev_rows = [self.db.index[p] for p in prev_pages or () if p in self.db]
+        index = optimizer.IngredientIndex(ingredients)
+        rows = optimizer.optimize_rows(
+            n,
+            range(self.db_len),
+            index,
+            prev_rows,
+            repeat_freq,
+            objective,
+            rng,
+        )
+        # too few recipes with known ingredients, the rest were picked at random
+        self.unoptimized = sum(index.recipes[r] is None for r in rows)
+
+        self.selected_pages = [self.db.ids[k] for k in rows]
+        self.selected_page_names = [self.db.names[k] for k in rows]
+
+    def select_weeks(
+        self,
+        n: int,
+        weeks: int,
+        prev_pages: Optional[Sequence] = None,
+        repeat_freq: int = 0,
+        ingredients: Optional[Sequence[Optional[Iterable[str]]]] = None,
+        objective: Optional[str] = None,
+        rng: Optional[random.Random] = None,
+    ) -> List[List[str]]:
+        """selects n recipes for each of several consecutive weeks
+
+        Each week can have at most repeat_freq recipes from the week before it, and the
+        first week at most repeat_freq from prev_pages. The pages of every week are kept
+        in self.weeks, and the first week is left selected. self.unoptimized is the
+        number of recipes over all the weeks that were picked at random because their
+        ingredients aren't known.
+
+        Parameters
+        ----------
+        n : int
+            number of recipes to select each week
+        weeks : int
+            number of weeks
+        prev_pages : Optional[Sequence], optional
+            recipe ids of the week before the first, by default None
+        repeat_freq : int, optional
+            number of recipes that can be repeats from the week before, by default 0
+        ingredients : Optional[Sequence[Optional[Iterable[str]]]], optional
+            ingredient names of each row of the database, needed with an objective
+        objective : Optional[str], optional
+            "distinct" or "overlap" to select with optimize_select, by default None to
+            select with random_select
+        rng : Optional[random.Random], optional
+            source of random numbers, by default the random module
 
-        # pages = []
-        # for s in self.sample:
-        #    pages.append(self.get_page(s))
+        Returns
+        -------
+        List[List[str]]
+            the recipe ids of each week
 
-        # rep = set(prev_pages) & set(pages)
-        # if len(rep) > repeat_freq:
-        #    diff = len(rep) - repeat_freq
+        Raises
+        ------
+        ValueError
+            if there aren't enough recipes to select n without going over repeat_freq
+        """
+        self.weeks = []
+        unoptimized = 0
+        for week in range(weeks):
+            if objective is None:
+                self.random_select(n, prev_pages, repeat_freq, rng=rng)
+            else:
+                self.optimize_select(
+                    n, ingredients, prev_pages, repeat_freq, objective, rng
+                )
+                unoptimized += self.unoptimized
+            self.weeks.append(self.selected_pages)
+            prev_pages = self.selected_pages
 
-        # type(self).selected_pages = pages  #store list of pages selected (in case size of database changes between calls)
+        self.get_selected(self.weeks[0])
+        self.unoptimized = unoptimized
+        return self.weeks
 
     def get_selected(self, page_ind: Optional[Sequence] = None):
-        """Updated self.selected_pages and self.selected_page_names, either with a list of page ids or with all of the pages currently in the database results
+        """Updated self.selected_pages and self.selected_page_names, either with a list of rows or page ids, or with all of the pages currently in the database
 
         Parameters
         ----------
         page_ind : Optional[Sequence], optional
-            list of page ids to select, by default None
+            list of rows or page ids to select, by default None
         """
-        pages = []
-        page_names = []
-        if page_ind == None:
-            for i in range(0, self.db_len):
-                page, page_name = self.get_page(i)
-                pages.append(page)
-                page_names.append(page_name)
-            self.selected_pages = pages
-            self.selected_page_names = page_names
+        if page_ind is None:
+            self.selected_pages = list(self.db.ids)
+            self.selected_page_names = list(self.db.names)
         else:
+            pages = []
+            page_names = []
             for p in page_ind:
+                if isinstance(p, str):
+                    p = self.db.index[p]
                 page, page_name = self.get_page(p)
                 pages.append(page)
                 page_names.append(page_name)
             self.selected_pages = pages
             self.selected_page_names = page_names
 
-    def update_planned(self, properties_to_update: Mapping):
+    def select_where(self, dish: Optional[str] = None, planned: Optional[bool] = None):
+        """Selects the pages in the database with the given dish tag and/or planned flag
+
+        Parameters
+        ----------
+        dish : Optional[str], optional
+            dish tag the recipe must have, by default None
+        planned : Optional[bool], optional
+            required value of 'Planned this week', by default None
+        """
+        self.get_selected(self.db.where(dish=dish, planned=planned))
+
+    def _is_noop(self, page: str, properties_to_update: Mapping) -> bool:
+        """Checks whether an update only sets 'Planned this week' to the value it already has"""
+        properties = properties_to_update.get("properties", {})
+        row = self.db.index.get(page)
+        if row is None or set(properties) != {nf.planned_property}:
+            return False
+        return bool(self.db.planned[row]) == properties[nf.planned_property].get(
+            "checkbox"
+        )
+
+    def update_planned(
+        self, properties_to_update: Mapping, skip: Optional[Iterable[str]] = None
+    ) -> UpdateResult:
         """Updates pages in self.selected_pages with the parameter 'Planned this week'
 
+        The updates are sent concurrently, and pages that already have the new value
+        are skipped. A failed page doesn't stop the others from being updated.
+
         Parameters
         ----------
         properties_to_update : Mapping
             typically from the notion_filters.py
-        """
+        skip : Optional[Iterable[str]], optional
+            ids of pages to leave as they are, by default None
 
+        Returns
+        -------
+        UpdateResult
+            the pages that were updated, skipped, or failed
+        """
+        skip = set(skip or ())
+        skipped = []
+        updates = {}
         for page in self.selected_pages:
-            errcode = self.notion_client.update_page(page, properties_to_update)
-
-            # check that this worked
-            if errcode.ok:
-                continue
+            if page in skip or self._is_noop(page, properties_to_update):
+                skipped.append(page)
             else:
-                print("for page id {0}".format(page))
-                print(errcode)
-                errcode.raise_for_status()
+                updates[page] = properties_to_update
+
+        result = self.notion_client.update_pages(updates)
+        result.skipped = skipped + result.skipped
+
+        for page, page_object in result.pages.items():
+            if self.cache is not None:
+                row = self.db.index.get(page)
+                prev_edited = self.db.last_edited[row] if row is not None else None
+                self.cache.touch(self.db_id, page_object, prev_edited)
+            self.db.append(page_object)
+
+        # check that this worked
+        for page, errcode in result.failed.items():
+            print("for page id {0}".format(page))
+            print(errcode)
+
+        return result
 
 
 def remove_prev(
-    notion_client, notion_key: Optional[str], notion_page_id: Optional[str]
+    notion_client,
+    notion_key: Optional[str],
+    notion_page_id: Optional[str],
+    prev_recipes: Optional[NotionDatabase] = None,
+    keep: Optional[Iterable[str]] = None,
+    strict: bool = False,
 ):
     """_summary_
 
@@ -265,47 +861,169 @@ def remove_prev(
         the personal notion key
     notion_page_id : Optional[str]
         _description_
+    prev_recipes : Optional[NotionDatabase], optional
+        the previously selected recipes if already loaded, by default they are queried
+    keep : Optional[Iterable[str]], optional
+        ids of previous recipes that are planned again and stay planned, by default None
+    strict : bool, optional
+        if True, raise when a previous recipe couldn't be removed, by default False
 
     Returns
     -------
     NotionDatabase
         returns a database with the previously selected recipes
+
+    Raises
+    ------
+    requests.HTTPError
+        if strict and any previous recipe couldn't be removed
     """
-    prev_recipes = NotionDatabase(notion_client)
-    prev_recipes.load_db(notion_page_id, filter_object=nf.filter_prev)
+    if prev_recipes is None:
+        prev_recipes = NotionDatabase(notion_client)
+        prev_recipes.load_db(notion_page_id, filter_object=nf.filter_prev)
 
     if prev_recipes.db_len > 0:
         prev_recipes.get_selected()
-        prev_recipes.update_planned(nf.update_prev_planned_props)
+        result = prev_recipes.update_planned(nf.update_prev_planned_props, skip=keep)
+        if not result.ok:
+            print(
+                "{0} previous recipes could not be removed".format(len(result.failed))
+            )
+            if strict:
+                result.raise_for_status()
     else:
         print("no previous meal plan")
     return prev_recipes
 
 
-def get_mealplan(k: int, repeat_freq: int):
+def get_mealplan(
+    k: int,
+    repeat_freq: int,
+    concurrency: int = 10,
+    use_cache: bool = True,
+    optimize: Optional[str] = None,
+    notion_client: Optional[NotionClient] = None,
+    dry_run: bool = False,
+    strict: bool = False,
+    notion_key: Optional[str] = None,
+    notion_page_id: Optional[str] = None,
+    notion_cache: Optional[NotionCache] = None,
+    parse_cache=None,
+    weeks: int = 1,
+):
     """Function that gets the previous meal plan, removes it, and selects a new meal plan.
 
+    With more than one week, the recipe database is loaded once and a plan is selected
+    for each week in turn, see NotionDatabase.select_weeks. Only the first week is marked
+    as planned in Notion, and the plan of every week is kept in recipes.weeks.
+
     Parameters
     ----------
     k : int
         _description_
     repeat_freq : int
         _description_
-    """
+    concurrency : int, optional
+        maximum number of requests to Notion in flight at once, by default 10
+    use_cache : bool, optional
+        if True, sync the recipe database into the local cache and only query pages edited since the last run, by default True
+    optimize : Optional[str], optional
+        "distinct" or "overlap" to pick recipes that share ingredients with optimizer.optimize_rows,
+        which reads the ingredients of every recipe, by default None to pick at random
+    notion_client : Optional[NotionClient], optional
+        client to send the requests with, by default a new one for $NOTION_KEY
+    dry_run : bool, optional
+        if True, select the new meal plan without updating any recipe in Notion, by default False
+    strict : bool, optional
+        if True, raise when a recipe couldn't be updated, by default False
+    notion_key : Optional[str], optional
+        the personal notion key, by default $NOTION_KEY
+    notion_page_id : Optional[str], optional
+        id of the recipe database, by default $NOTION_PAGE_ID
+    notion_cache : Optional[NotionCache], optional
+        cache to sync the recipe database into, by default the one in the cache directory
+    parse_cache : Optional[ParseCache], optional
+        cache of parsed ingredients for the optimizer, by default the one in the cache directory
+    weeks : int, optional
+        number of consecutive weeks to plan, by default 1
 
-    load_env_variables()
+    Raises
+    ------
+    ValueError
+        if there aren't enough recipes to select k without going over repeat_freq
+    requests.HTTPError
+        if strict and a recipe couldn't be updated
+    """
 
-    notion_key = os.environ.get("NOTION_KEY")
-    notion_page_id = os.environ.get("NOTION_PAGE_ID")
-    notion_client = NotionClient(notion_key)
+    if notion_key is None or notion_page_id is None:
+        load_env_variables()
+        notion_key = notion_key or os.environ.get("NOTION_KEY")
+        notion_page_id = notion_page_id or os.environ.get("NOTION_PAGE_ID")
+    if notion_client is None:
+        notion_client = NotionClient(notion_key, pool_maxsize=concurrency)
 
-    # remove prev meal plan
-    prev_recipes = remove_prev(notion_client, notion_key, notion_page_id)
+    if use_cache:
+        # one incremental query, then filter the planned and lunch/dinner recipes locally
+        with profiling.span("sync_db"):
+            all_recipes = NotionDatabase(notion_client)
+            all_recipes.sync_db(
+                notion_page_id,
+                notion_cache if notion_cache is not None else NotionCache(),
+            )
+            prev_recipes = all_recipes.subset(planned=True)
+            recipes = all_recipes.subset(dish=nf.dish_ld)
+    else:
+        with profiling.span("load_db"):
+            prev_recipes = NotionDatabase(notion_client)
+            prev_recipes.load_db(notion_page_id, filter_object=nf.filter_prev)
+            recipes = NotionDatabase(notion_client)
+            recipes.load_db(notion_page_id, filter_object=nf.filter_ld)
 
     # get new meal plan
-    recipes = NotionDatabase(notion_client)
-    recipes.load_db(notion_page_id, filter_object=nf.filter_ld)
-    recipes.random_select(k, prev_recipes.selected_pages, repeat_freq)
-    recipes.update_planned(nf.update_planned_props)
+    prev_recipes.get_selected()
+    if optimize is not None:
+        with profiling.span("recipe_ingredients"):
+            ingredients = groc.recipe_ingredient_names(
+                recipes, notion_client, recipes.db.ids, parse_cache
+            )
+    else:
+        ingredients = None
+    with profiling.span("select"):
+        recipes.select_weeks(
+            k,
+            weeks,
+            prev_recipes.selected_pages,
+            repeat_freq,
+            ingredients,
+            optimize,
+        )
+    if recipes.unoptimized:
+        print(
+            "{0} recipes were picked at random, their ingredients aren't known".format(
+                recipes.unoptimized
+            )
+        )
+
+    # recipes planned again stay planned, so they don't need either update
+    keep = set(prev_recipes.selected_pages) & set(recipes.selected_pages)
+
+    if dry_run:
+        return recipes, notion_client
+
+    # remove prev meal plan
+    with profiling.span("update_planned"):
+        remove_prev(
+            notion_client,
+            notion_key,
+            notion_page_id,
+            prev_recipes=prev_recipes,
+            keep=keep,
+            strict=strict,
+        )
+        result = recipes.update_planned(nf.update_planned_props, skip=keep)
+    if not result.ok:
+        print("{0} recipes could not be planned".format(len(result.failed)))
+        if strict:
+            result.raise_for_status()
 
     return recipes, notion_client
@@ -8,4 +8,22 @@ filter_prev = {"property": "Planned this week", "checkbox": {"equals": True}}
 
 filter_ld = {"property": "Dish", "multi_select": {"contains": "Lunch/Dinner"}}
 
+dish_ld = "Lunch/Dinner"
+
+
+def filter_edited_since(timestamp: str) -> dict:
+    """Filter for pages edited on or after a timestamp (Notion rounds these to the minute)"""
+    return {
+        "timestamp": "last_edited_time",
+        "last_edited_time": {"on_or_after": timestamp},
+    }
+
+
 headings = ["heading_1", "heading_2", "heading_3"]
+
+# names of the recipe database properties that are read in
+name_property = "Name"
+dish_property = "Dish"
+planned_property = "Planned this week"
+# id of the title property of every database, used to query pages without their properties
+title_property_id = "title"
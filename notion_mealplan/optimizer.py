@@ -0,0 +1,264 @@
+"""Contains the optimizer that picks meal plans with ingredients in common"""
+
+import heapq
+import random
+from typing import Dict, FrozenSet, Iterable, List, Optional, Sequence
+from . import sampling
+
+# how to score a plan, lower is better
+OBJECTIVES = ("distinct", "overlap")
+
+
+class IngredientIndex:
+    """Inverted index from each ingredient to the recipes that use it
+
+    Ingredients are numbered in the order first seen, and recipes are identified by
+    their position in the sequence the index was built from, e.g. rows of a RecipeTable.
+
+    Parameters
+    ----------
+    ingredients : Sequence[Optional[Iterable[str]]]
+        the normalized ingredient names of each recipe, None if they aren't known
+    """
+
+    def __init__(self, ingredients: Sequence[Optional[Iterable[str]]]):
+        ids: Dict[str, int] = {}
+        # ingredient ids of each recipe, None if unknown
+        self.recipes: List[Optional[FrozenSet[int]]] = []
+        # recipes using each ingredient
+        self.postings: List[List[int]] = []
+
+        for row, names in enumerate(ingredients):
+            used = set()
+            for name in names or ():
+                i = ids.get(name)
+                if i is None:
+                    i = ids[name] = len(self.postings)
+                    self.postings.append([])
+                if i not in used:
+                    used.add(i)
+                    self.postings[i].append(row)
+            self.recipes.append(frozenset(used) if used else None)
+        self.names = list(ids)
+
+    def __len__(self) -> int:
+        return len(self.recipes)
+
+    def distinct(self, rows: Iterable[int]) -> int:
+        """Number of different ingredients used by a set of recipes"""
+        return len(set().union(*(self.recipes[r] or () for r in rows)))
+
+
+def _cost(objective: str, distinct: int, total: int) -> float:
+    if objective == "distinct":
+        return distinct
+    # fraction of ingredient uses that are the first use of that ingredient
+    return distinct / total if total else 1.0
+
+
+class _Plan:
+    """Recipes in a plan, with how many of them use each ingredient
+
+    ``overlap`` holds, for every recipe in the index, the number of its ingredients
+    already in the plan. It is updated through the postings of an ingredient only
+    when the ingredient enters or leaves the plan.
+    """
+
+    def __init__(self, index: IngredientIndex, prev: set):
+        self.index = index
+        self.prev = prev
+        self.rows: List[int] = []
+        self.counts: Dict[int, int] = {}
+        self.overlap = [0] * len(index)
+        self.total = 0
+        self.repeats = 0
+
+    def add(self, row: int, pos: Optional[int] = None):
+        ingredients = self.index.recipes[row] or ()
+        for i in ingredients:
+            if i not in self.counts:
+                self.counts[i] = 0
+                for r in self.index.postings[i]:
+                    self.overlap[r] += 1
+            self.counts[i] += 1
+        self.total += len(ingredients)
+        self.repeats += row in self.prev
+        if pos is None:
+            self.rows.append(row)
+        else:
+            self.rows[pos] = row
+
+    def remove(self, pos: int) -> int:
+        row = self.rows[pos]
+        ingredients = self.index.recipes[row] or ()
+        for i in ingredients:
+            self.counts[i] -= 1
+            if not self.counts[i]:
+                del self.counts[i]
+                for r in self.index.postings[i]:
+                    self.overlap[r] -= 1
+        self.total -= len(ingredients)
+        self.repeats -= row in self.prev
+        return row
+
+    def cost_with(self, row: int, objective: str) -> float:
+        """Cost of the plan if row were added"""
+        size = len(self.index.recipes[row])
+        new = size - self.overlap[row]
+        return _cost(objective, len(self.counts) + new, self.total + size)
+
+
+def optimize_rows(
+    n: int,
+    rows: Sequence[int],
+    index: IngredientIndex,
+    prev_rows: Iterable[int] = (),
+    repeat_budget: int = 0,
+    objective: str = "distinct",
+    rng: Optional[random.Random] = None,
+    max_candidates: int = 200,
+    max_passes: int = 10,
+) -> List[int]:
+    """Selects n rows whose recipes share as many ingredients as possible
+
+    The first recipe is picked at random so plans change from week to week. Recipes
+    are then added greedily, each time taking the one that adds the fewest new
+    ingredients. A local search then tries swapping each recipe in the plan for the
+    recipes that share the most ingredients with the rest of it, found through the
+    inverted index, until no swap improves the plan.
+
+    Only recipes with known ingredients can be scored. If there are too few of them,
+    as many as allowed are optimized and the rest of the plan is filled at random from
+    the recipes with unknown ingredients, which come last in the returned rows.
+
+    Parameters
+    ----------
+    n : int
+        number of rows to select
+    rows : Sequence[int]
+        rows to select from
+    index : IngredientIndex
+        ingredients of every row
+    prev_rows : Iterable[int], optional
+        rows that were selected last time, by default ()
+    repeat_budget : int, optional
+        largest number of rows from prev_rows allowed, by default 0
+    objective : str, optional
+        "distinct" to minimize the number of different ingredients, or "overlap" to
+        minimize the fraction of ingredients used by only one recipe, by default "distinct"
+    rng : Optional[random.Random], optional
+        source of random numbers, by default the random module
+    max_candidates : int, optional
+        most recipes tried in place of each recipe in the local search, by default 200
+    max_passes : int, optional
+        most passes of the local search over the plan, by default 10
+
+    Returns
+    -------
+    List[int]
+        selected rows, the optimized ones first
+
+    Raises
+    ------
+    ValueError
+        if there are fewer than n rows that can be selected, or the objective is unknown
+    """
+    if objective not in OBJECTIVES:
+        raise ValueError(f"objective must be one of {OBJECTIVES}, not {objective!r}")
+    rng = rng if rng is not None else random
+    prev = set(prev_rows)
+    allowed = set(rows)
+    known = [r for r in rows if index.recipes[r] is not None]
+
+    # most recipes with known ingredients that can be in the plan
+    fresh = sum(r not in prev for r in known)
+    n_known = min(n, fresh + min(max(repeat_budget, 0), len(known) - fresh))
+    plan = _Plan(index, prev)
+    if n_known < n:
+        # checks the whole request can be met before optimizing part of it
+        sampling.sample_rows(n, rows, prev, repeat_budget, rng=rng)
+    if n_known:
+        _search(
+            plan,
+            n_known,
+            known,
+            allowed,
+            repeat_budget,
+            objective,
+            rng,
+            max_candidates,
+            max_passes,
+        )
+    if n_known < n:
+        unknown = [r for r in rows if index.recipes[r] is None]
+        plan.rows.extend(
+            sampling.sample_rows(
+                n - n_known, unknown, prev, repeat_budget - plan.repeats, rng=rng
+            )
+        )
+    return plan.rows
+
+
+def _search(
+    plan: _Plan,
+    n: int,
+    known: Sequence[int],
+    allowed: set,
+    repeat_budget: int,
+    objective: str,
+    rng: random.Random,
+    max_candidates: int,
+    max_passes: int,
+):
+    """Adds n of the known rows to an empty plan, see optimize_rows"""
+    prev = plan.prev
+    index = plan.index
+    # checks the request can be met, and picks the first recipe at random
+    first = sampling.sample_rows(n, known, prev, repeat_budget, rng=rng)[0]
+    plan.add(first)
+
+    # ties are broken by a random key so equally good plans are picked evenly
+    tiebreak = {r: rng.random() for r in known}
+
+    def eligible(row: int) -> bool:
+        return row not in plan.rows and (
+            row not in prev or plan.repeats < repeat_budget
+        )
+
+    while len(plan.rows) < n:
+        best, best_key = None, None
+        for r in known:
+            if eligible(r):
+                key = (plan.cost_with(r, objective), tiebreak[r])
+                if best_key is None or key < best_key:
+                    best, best_key = r, key
+        plan.add(best)
+
+    for _ in range(max_passes):
+        improved = False
+        for pos in range(n):
+            current = plan.rows[pos]
+            before = _cost(objective, len(plan.counts), plan.total)
+            plan.remove(pos)
+
+            # recipes sharing the most ingredients with the rest of the plan
+            sharing = set()
+            for ingredient in plan.counts:
+                sharing.update(index.postings[ingredient])
+            candidates = heapq.nlargest(
+                max_candidates,
+                (r for r in sharing if r in allowed and r in tiebreak),
+                key=plan.overlap.__getitem__,
+            )
+
+            best, best_cost = current, before
+            for row in candidates:
+                if row != current and eligible(row):
+                    cost = plan.cost_with(row, objective)
+                    if cost < best_cost - 1e-12:
+                        best, best_cost = row, cost
+
+            plan.add(best, pos)
+            improved = improved or best != current
+        if not improved:
+            break
@@ -0,0 +1,312 @@
+"""Contains the persistent cache of ingredient sentences parsed by the ingredient parser"""
+
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import hashlib
+from itertools import chain
+from importlib import metadata
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence
+from .cache import default_cache_dir
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS parses (key TEXT PRIMARY KEY, data TEXT, used INTEGER);
+CREATE INDEX IF NOT EXISTS parses_used ON parses (used);
+"""
+
+# changed whenever sentence_key does, so entries under the old keys are cleared
+KEY_FORMAT = "2"
+
+# below this many sentences the model runs in a single process
+PARALLEL_THRESHOLD = 200
+
+# one batch of sentences goes through the model at a time, e.g. across households
+_model_lock = threading.Lock()
+
+
+class ParsedText(NamedTuple):
+    text: str
+    confidence: float
+
+
+class ParsedAmount(NamedTuple):
+    quantity: str
+    unit: str
+    confidence: float
+
+
+class ParsedSentence(NamedTuple):
+    """The parts of the ingredient parser output used for the grocery list"""
+
+    sentence: str
+    name: Optional[ParsedText]
+    amount: List[ParsedAmount]
+
+    @classmethod
+    def from_parsed(cls, parsed) -> "ParsedSentence":
+        """Copies the name and amounts out of a ParsedIngredient from the ingredient parser"""
+        name = None
+        if parsed.name is not None:
+            name = ParsedText(parsed.name.text, parsed.name.confidence)
+        amount = [
+            ParsedAmount(str(a.quantity), str(a.unit or ""), a.confidence)
+            for a in parsed.amount
+        ]
+        return cls(parsed.sentence, name, amount)
+
+    @classmethod
+    def from_json(cls, data: str) -> "ParsedSentence":
+        sentence, name, amount = json.loads(data)
+        return cls(
+            sentence,
+            ParsedText(*name) if name is not None else None,
+            [ParsedAmount(*a) for a in amount],
+        )
+
+
+def parser_version() -> str:
+    """Gets the installed version of the ingredient parser without importing it"""
+    try:
+        return metadata.version("ingredient-parser-nlp")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def sentence_key(sentence: str) -> str:
+    """Hash of an ingredient sentence, used as its cache key
+
+    The sentence is hashed exactly as it is, since the cached parse holds the sentence
+    and is returned for it.
+    """
+    return hashlib.sha256(sentence.encode("utf-8")).hexdigest()
+
+
+class ParseCache:
+    """Size-bounded cache of parsed ingredient sentences, kept in an SQLite file
+
+    Entries are keyed by a hash of the sentence. When there are more than max_entries,
+    the least recently used are removed, and the whole cache is cleared if the
+    installed version of the ingredient parser or the format of the keys changes.
+
+    Parameters
+    ----------
+    path : Optional[str], optional
+        path of the SQLite file, or ":memory:", by default parse.sqlite3 in default_cache_dir()
+    max_entries : int, optional
+        most sentences kept, by default 20000
+    version : Optional[str], optional
+        version of the parser the entries belong to, by default the installed version
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_entries: int = 20000,
+        version: Optional[str] = None,
+    ):
+        if path is None:
+            os.makedirs(default_cache_dir(), exist_ok=True)
+            path = os.path.join(default_cache_dir(), "parse.sqlite3")
+        self.path = path
+        self.max_entries = max_entries
+        self.version = version if version is not None else parser_version()
+        self.hits = 0
+        self.misses = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+
+        with self._lock, self._conn:
+            self._conn.executescript(SCHEMA)
+            row = self._conn.execute(
+                "SELECT value FROM meta WHERE key = 'version'"
+            ).fetchone()
+            stored = "{0} keys:{1}".format(self.version, KEY_FORMAT)
+            if row is None or row[0] != stored:
+                # parses from another version of the model may differ
+                self._conn.execute("DELETE FROM parses")
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)",
+                    (stored,),
+                )
+            row = self._conn.execute("SELECT MAX(used) FROM parses").fetchone()
+            self._clock = row[0] or 0
+
+    def close(self):
+        self._conn.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM parses").fetchone()[0]
+
+    def get_many(self, sentences: Iterable[str]) -> Dict[str, ParsedSentence]:
+        """Looks up sentences in the cache
+
+        Parameters
+        ----------
+        sentences : Iterable[str]
+            ingredient sentences
+
+        Returns
+        -------
+        Dict[str, ParsedSentence]
+            the cached parse of each sentence that was found, in the order given
+        """
+        keys = {sentence_key(s): s for s in sentences}
+        found = {}
+        with self._lock, self._conn:
+            self._clock += 1
+            key_list = list(keys)
+            # stay under SQLite's limit on the number of parameters
+            for i in range(0, len(key_list), 500):
+                chunk = key_list[i : i + 500]
+                marks = ",".join("?" * len(chunk))
+                for key, data in self._conn.execute(
+                    f"SELECT key, data FROM parses WHERE key IN ({marks})", chunk
+                ):
+                    found[keys[key]] = ParsedSentence.from_json(data)
+                self._conn.execute(
+                    f"UPDATE parses SET used = ? WHERE key IN ({marks})",
+                    [self._clock, *chunk],
+                )
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return {s: found[s] for s in keys.values() if s in found}
+
+    def put_many(self, parsed: Iterable[ParsedSentence]):
+        """Stores parsed sentences, removing the least recently used if the cache is full
+
+        Parameters
+        ----------
+        parsed : Iterable[ParsedSentence]
+            parsed ingredient sentences
+        """
+        with self._lock, self._conn:
+            self._clock += 1
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO parses (key, data, used) VALUES (?, ?, ?)",
+                [
+                    (sentence_key(p.sentence), json.dumps(p), self._clock)
+                    for p in parsed
+                ],
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM parses").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM parses WHERE key IN "
+                    "(SELECT key FROM parses ORDER BY used ASC LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+
+
+def _load_parser():
+    """Loads the parser model once when a worker process starts"""
+    import ingredient_parser
+
+
+def _parse_chunk(sentences: Sequence[str]) -> List[ParsedSentence]:
+    """Runs the parser model over a list of sentences"""
+    from ingredient_parser import parse_multiple_ingredients
+
+    # the parser echoes back its own copy of the sentence, so key by the input
+    return [
+        ParsedSentence.from_parsed(p)._replace(sentence=s)
+        for s, p in zip(sentences, parse_multiple_ingredients(list(sentences)))
+    ]
+
+
+def _split(sentences: Sequence[str], n_chunks: int) -> List[Sequence[str]]:
+    """Splits sentences into n_chunks contiguous chunks of nearly equal size"""
+    size, extra = divmod(len(sentences), n_chunks)
+    chunks = []
+    start = 0
+    for i in range(n_chunks):
+        end = start + size + (1 if i < extra else 0)
+        if end > start:
+            chunks.append(sentences[start:end])
+        start = end
+    return chunks
+
+
+def parse_uncached(
+    sentences: Sequence[str],
+    processes: Optional[int] = None,
+    threshold: int = PARALLEL_THRESHOLD,
+) -> List[ParsedSentence]:
+    """Parses sentences with the model, across several processes for large batches
+
+    Each worker loads the model once and parses a contiguous chunk of sentences, and
+    the chunks are put back together in order. Below threshold sentences, starting
+    the workers costs more than it saves, so the model runs in this process. Workers
+    are started with "spawn", since this is called from the worker threads of an
+    AsyncNotionClient and forking a process that has threads isn't safe.
+
+    Parameters
+    ----------
+    sentences : Sequence[str]
+        ingredient sentences
+    processes : Optional[int], optional
+        number of worker processes, by default the number of CPUs
+    threshold : int, optional
+        smallest number of sentences parsed in worker processes, by default PARALLEL_THRESHOLD
+
+    Returns
+    -------
+    List[ParsedSentence]
+        the parse of each sentence, in the same order
+    """
+    processes = processes or os.cpu_count() or 1
+    if processes == 1 or len(sentences) < threshold:
+        return _parse_chunk(sentences)
+
+    # a few chunks per worker evens out sentences that take longer to parse
+    chunks = _split(list(sentences), processes * 4)
+    with ProcessPoolExecutor(
+        processes,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_load_parser,
+    ) as pool:
+        return list(chain.from_iterable(pool.map(_parse_chunk, chunks)))
+
+
+def parse_sentences(
+    sentences: Sequence[str],
+    cache: Optional[ParseCache] = None,
+    processes: Optional[int] = None,
+) -> List[ParsedSentence]:
+    """Parses ingredient sentences, only sending sentences that aren't cached to the model
+
+    Parameters
+    ----------
+    sentences : Sequence[str]
+        ingredient sentences
+    cache : Optional[ParseCache], optional
+        cache of earlier parses, by default None
+    processes : Optional[int], optional
+        number of processes for large batches, see parse_uncached, by default the number of CPUs
+
+    Returns
+    -------
+    List[ParsedSentence]
+        the parse of each sentence, in the same order
+    """
+    found = cache.get_many(sentences) if cache is not None else {}
+    missing = list(dict.fromkeys(s for s in sentences if s not in found))
+
+    if missing:
+        with _model_lock:
+            if cache is not None:
+                # another thread may have parsed some of them while this one waited,
+                # and the lookup counts the sentences again
+                cache.misses -= len(missing)
+                found.update(cache.get_many(missing))
+                missing = [s for s in missing if s not in found]
+            parsed = parse_uncached(missing, processes) if missing else []
+            found.update(zip(missing, parsed))
+            if cache is not None and parsed:
+                cache.put_many(parsed)
+
+    return [found[s] for s in sentences]
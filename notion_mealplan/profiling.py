@@ -0,0 +1,252 @@
+"""Contains the timers and request metrics used to profile a run of the meal planner"""
+
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+import json
+import re
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional
+from urllib.parse import urlsplit
+
+# upper bounds of the request latency histogram buckets, in milliseconds
+LATENCY_BUCKETS_MS = [10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+_VERSION = re.compile(r"v\d+")
+
+_current: ContextVar[Optional["Profiler"]] = ContextVar("profiler", default=None)
+
+
+class Profiler:
+    """Records how long each stage of a run takes
+
+    Stages are timed with span(), and spans opened inside another span are recorded
+    with the path of their parents, e.g. "grocery_list/parse".
+    """
+
+    def __init__(self):
+        self.spans: List[dict] = []
+        self._stack: List[str] = []
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        path = "/".join(self._stack + [name])
+        self._stack.append(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._stack.pop()
+            self.spans.append(
+                {
+                    "name": path,
+                    "start_s": round(start - self._start, 6),
+                    "duration_s": round(time.perf_counter() - start, 6),
+                }
+            )
+
+    @contextmanager
+    def activate(self) -> Iterator["Profiler"]:
+        """Makes this the profiler that span() records to"""
+        token = _current.set(self)
+        try:
+            yield self
+        finally:
+            _current.reset(token)
+
+    def report(self, notion_client=None) -> dict:
+        """Gets the spans, and the request metrics of notion_client if given, as a dictionary"""
+        report = {
+            "total_s": round(time.perf_counter() - self._start, 6),
+            "spans": sorted(self.spans, key=lambda s: s["start_s"]),
+        }
+        if notion_client is not None:
+            report["requests"] = notion_client.metrics.to_dict()
+            report["client"] = dict(notion_client.stats)
+        return report
+
+    def write_json(self, path: str, notion_client=None):
+        """Writes the report to a JSON file"""
+        with open(path, "w") as f:
+            json.dump(self.report(notion_client), f, indent=2)
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Times a stage with the active profiler, if there is one
+
+    Parameters
+    ----------
+    name : str
+        name of the stage
+    """
+    profiler = _current.get()
+    if profiler is None:
+        yield
+        return
+    with profiler.span(name):
+        yield
+
+
+def endpoint(method: str, url: str) -> str:
+    """Names the endpoint of a request without the version or the ids in it
+
+    Parameters
+    ----------
+    method : str
+        HTTP method
+    url : str
+        url of the request, e.g. "https://api.notion.com/v1/blocks/<id>/children"
+
+    Returns
+    -------
+    str
+        e.g. "GET blocks/children"
+    """
+    parts = urlsplit(url).path.strip("/").split("/")
+    if parts and _VERSION.fullmatch(parts[0]):
+        parts = parts[1:]
+    return "{0} {1}".format(method, "/".join(parts[::2]))
+
+
+class _EndpointMetrics:
+    __slots__ = (
+        "count",
+        "errors",
+        "seconds",
+        "bytes_sent",
+        "bytes_received",
+        "buckets",
+    )
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+
+class RequestMetrics:
+    """Thread-safe counts, latency histograms and bytes transferred for each endpoint"""
+
+    def __init__(self):
+        self._endpoints: Dict[str, _EndpointMetrics] = {}
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        name: str,
+        status: int,
+        seconds: float,
+        bytes_sent: int = 0,
+        bytes_received: int = 0,
+    ):
+        """Records one request
+
+        Parameters
+        ----------
+        name : str
+            endpoint, see endpoint()
+        status : int
+            status code of the response
+        seconds : float
+            time from sending the request to receiving the whole response
+        bytes_sent : int, optional
+            size of the request body, by default 0
+        bytes_received : int, optional
+            size of the response body, by default 0
+        """
+        bucket = bisect_left(LATENCY_BUCKETS_MS, seconds * 1000)
+        with self._lock:
+            metrics = self._endpoints.get(name)
+            if metrics is None:
+                metrics = self._endpoints[name] = _EndpointMetrics()
+            metrics.count += 1
+            metrics.errors += status >= 400
+            metrics.seconds += seconds
+            metrics.bytes_sent += bytes_sent
+            metrics.bytes_received += bytes_received
+            metrics.buckets[bucket] += 1
+
+    def to_dict(self) -> Mapping:
+        """Gets the metrics of each endpoint, with the histogram keyed by bucket bound"""
+        labels = ["<={0}ms".format(b) for b in LATENCY_BUCKETS_MS] + [
+            ">{0}ms".format(LATENCY_BUCKETS_MS[-1])
+        ]
+        with self._lock:
+            return {
+                name: {
+                    "count": m.count,
+                    "errors": m.errors,
+                    "total_s": round(m.seconds, 6),
+                    "mean_ms": round(m.seconds / m.count * 1000, 3),
+                    "bytes_sent": m.bytes_sent,
+                    "bytes_received": m.bytes_received,
+                    "latency_ms": dict(zip(labels, m.buckets)),
+                }
+                for name, m in sorted(self._endpoints.items())
+            }
+
+
+def merge_requests(requests: Iterable[Mapping]) -> dict:
+    """Adds up the request metrics of several runs, from RequestMetrics.to_dict
+
+    Parameters
+    ----------
+    requests : Iterable[Mapping]
+        the metrics of each run
+
+    Returns
+    -------
+    dict
+        the metrics of all of the runs together, in the same format
+    """
+    merged = {}
+    for metrics in requests:
+        for name, m in metrics.items():
+            total = merged.get(name)
+            if total is None:
+                merged[name] = {**m, "latency_ms": dict(m["latency_ms"])}
+                continue
+            for key in ("count", "errors", "total_s", "bytes_sent", "bytes_received"):
+                total[key] += m[key]
+            for bucket, count in m["latency_ms"].items():
+                total["latency_ms"][bucket] += count
+    for m in merged.values():
+        m["total_s"] = round(m["total_s"], 6)
+        m["mean_ms"] = round(m["total_s"] / m["count"] * 1000, 3)
+    return dict(sorted(merged.items()))
+
+
+def format_report(report: Mapping) -> str:
+    """Formats a report from Profiler.report as text tables"""
+    lines = ["{0:<40}{1:>12}".format("stage", "seconds")]
+    for s in report["spans"]:
+        depth = s["name"].count("/")
+        label = "  " * depth + s["name"].rsplit("/", 1)[-1]
+        lines.append("{0:<40}{1:>12.3f}".format(label, s["duration_s"]))
+    lines.append("{0:<40}{1:>12.3f}".format("total", report["total_s"]))
+
+    requests = report.get("requests")
+    if requests:
+        lines.append("")
+        row = "{0:<28}{1:>7}{2:>7}{3:>10}{4:>12}{5:>12}"
+        lines.append(
+            row.format("endpoint", "count", "errors", "mean ms", "sent", "received")
+        )
+        for name, m in requests.items():
+            lines.append(
+                row.format(
+                    name,
+                    m["count"],
+                    m["errors"],
+                    "{0:.1f}".format(m["mean_ms"]),
+                    m["bytes_sent"],
+                    m["bytes_received"],
+                )
+            )
+    return "\n".join(lines)
@@ -0,0 +1,162 @@
+"""Contains the parser for the quantities in ingredient amounts, such as 1 1/2, 2-3 or 200g"""
+
+from functools import lru_cache
+import re
+from typing import NamedTuple, Optional
+
+EXACT = "exact"
+RANGE = "range"
+UNPARSEABLE = "unparseable"
+
+# unicode vulgar fractions, written out so the pattern below only has to handle n/d
+FRACTIONS = {
+    "¼": " 1/4",
+    "½": " 1/2",
+    "¾": " 3/4",
+    "⅐": " 1/7",
+    "⅑": " 1/9",
+    "⅒": " 1/10",
+    "⅓": " 1/3",
+    "⅔": " 2/3",
+    "⅕": " 1/5",
+    "⅖": " 2/5",
+    "⅗": " 3/5",
+    "⅘": " 4/5",
+    "⅙": " 1/6",
+    "⅚": " 5/6",
+    "⅛": " 1/8",
+    "⅜": " 3/8",
+    "⅝": " 5/8",
+    "⅞": " 7/8",
+    "⁄": "/",
+}
+_TRANSLATE = str.maketrans(FRACTIONS)
+
+# a decimal, optionally followed by the numerator of a mixed number, then a denominator
+_NUMBER = r"(\d+(?:\.\d*)?|\.\d+)(?:\s+(\d+)(?=\s*/))?(?:\s*/\s*(\d+))?"
+
+_QUANTITY = re.compile(
+    rf"\s*{_NUMBER}(?:\s*(?:-|–|—|to|or)\s*{_NUMBER})?\s*([^\W\d_][^\W\d]*\.?)?\s*"
+)
+
+
+class ParsedQuantity(NamedTuple):
+    """A quantity read from the text of an amount
+
+    Attributes
+    ----------
+    kind : str
+        EXACT, RANGE or UNPARSEABLE
+    value : Optional[float]
+        the amount, or the low end of a range, None if unparseable
+    high : Optional[float]
+        the high end of a range, None otherwise
+    unit : str
+        unit written straight after the number, e.g. "g" in "200g", "" if there is none
+    """
+
+    kind: str
+    value: Optional[float] = None
+    high: Optional[float] = None
+    unit: str = ""
+
+
+def _value(number: str, mixed: Optional[str], den: Optional[str]) -> Optional[float]:
+    # the three groups of one _NUMBER
+    if den is None:
+        return float(number)
+    if not int(den):
+        return None
+    if mixed is None:
+        return float(number) / int(den)
+    return float(number) + int(mixed) / int(den)
+
+
+_UNPARSEABLE = ParsedQuantity(UNPARSEABLE)
+
+
+def fraction_value(text: str) -> Optional[float]:
+    """Reads a fraction or mixed number, e.g. "1/2", "1 1/2" or "-1 1/2"
+
+    Parameters
+    ----------
+    text : str
+        the quantity
+
+    Returns
+    -------
+    Optional[float]
+        the value, None for anything else or a denominator of zero
+    """
+    head, slash, den = text.partition("/")
+    if not slash or not den.isdecimal():
+        return None
+    whole, _, num = head.strip().rpartition(" ")
+    try:
+        frac = float(num) / float(den)
+        if not whole:
+            return frac
+        if not num.isdecimal():
+            # e.g. the range "1 -1/2"
+            return None
+        value = float(whole)
+    except (ValueError, ZeroDivisionError):
+        return None
+    # the sign of a mixed number is the sign of its fraction too
+    return value - frac if value < 0 else value + frac
+
+
+@lru_cache(maxsize=4096)
+def parse_quantity(text: str) -> ParsedQuantity:
+    """Reads a quantity, with one pass of a precompiled regular expression if needed
+
+    Handles decimals, fractions, mixed numbers, unicode fractions ("1½"), ranges
+    ("1-2", "2 to 3") and units attached to the number ("200g", "1.5kg"). Plain
+    numbers and fractions of whole numbers, which may be negative like "-1 1/2",
+    are read without the regular expression.
+    A grocery list repeats the same few quantities many times, so results are memoized.
+
+    Parameters
+    ----------
+    text : str
+        the quantity, e.g. from the ingredient parser
+
+    Returns
+    -------
+    ParsedQuantity
+        the value and kind of quantity, UNPARSEABLE if it isn't a number
+    """
+    if not text.isascii():
+        text = text.translate(_TRANSLATE)
+
+    if "/" in text:
+        # anything else with a fraction, e.g. "1/2-3/4" or "1/0", is left to the regex
+        value = fraction_value(text)
+        if value is not None:
+            return ParsedQuantity(EXACT, value)
+    elif text.replace(".", "", 1).isdecimal():
+        # plain numbers are the most common quantity, checking the characters is
+        # cheaper than the exception float() raises for anything else
+        return ParsedQuantity(EXACT, float(text))
+
+    match = _QUANTITY.fullmatch(text)
+    if match is None:
+        # a negative amount, e.g. "-1 / 2", is read without its sign and negated
+        head = text.lstrip()
+        if head[:1] == "-" and head[1:2] != "-":
+            parsed = parse_quantity(head[1:])
+            if parsed.kind == EXACT:
+                return ParsedQuantity(EXACT, -parsed.value, None, parsed.unit)
+        return _UNPARSEABLE
+    groups = match.groups()
+    value = _value(*groups[:3])
+    if value is None:
+        return _UNPARSEABLE
+    unit = groups[6] or ""
+
+    if groups[3] is None:
+        return ParsedQuantity(EXACT, value, None, unit)
+    high = _value(*groups[3:6])
+    if high is None:
+        return _UNPARSEABLE
+    return ParsedQuantity(RANGE, value, high, unit)
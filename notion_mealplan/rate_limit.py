@@ -0,0 +1,118 @@
+"""Contains the token bucket used to pace requests to the Notion API"""
+
+import random
+import threading
+import time
+from typing import Callable, Optional
+
+# Notion allows an average of three requests per second per integration
+NOTION_RATE = 3.0
+
+# status codes worth trying again after a short wait
+RETRY_STATUS = {500, 502, 503, 504}
+
+
+class TokenBucket:
+    """A thread-safe token bucket that paces calls to ``rate`` per second on average
+
+    Parameters
+    ----------
+    rate : float, optional
+        number of tokens added per second, by default NOTION_RATE
+    capacity : Optional[float], optional
+        largest burst allowed, by default the same as rate
+    clock : Callable[[], float], optional
+        monotonic clock, by default time.monotonic
+    sleep : Callable[[float], None], optional
+        function used to wait, by default time.sleep
+    """
+
+    def __init__(
+        self,
+        rate: float = NOTION_RATE,
+        capacity: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self) -> float:
+        """Takes one token, waiting until it is available
+
+        Returns
+        -------
+        float
+            number of seconds spent waiting
+        """
+        with self._lock:
+            self._refill()
+            # reserve the token now so concurrent callers queue up behind each other
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+        if wait > 0:
+            self._sleep(wait)
+        return wait
+
+    def defer(self, seconds: float):
+        """Holds back every caller for at least ``seconds``, e.g. after a 429 response
+
+        Parameters
+        ----------
+        seconds : float
+            number of seconds before the next token is available
+        """
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.tokens, -seconds * self.rate)
+
+
+def retry_after(response) -> Optional[float]:
+    """Reads the Retry-After header of a response in seconds
+
+    Parameters
+    ----------
+    response : requests.Response
+        response from the Notion API
+
+    Returns
+    -------
+    Optional[float]
+        number of seconds to wait, or None if the header is missing or not a number
+    """
+    value = response.headers.get("Retry-After")
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff(attempt: int, base: float = 0.5, cap: float = 30.0) -> float:
+    """Exponential backoff with full jitter
+
+    Parameters
+    ----------
+    attempt : int
+        number of attempts made so far, starting at 0
+    base : float, optional
+        wait for the first retry before jitter, by default 0.5
+    cap : float, optional
+        longest wait, by default 30.0
+
+    Returns
+    -------
+    float
+        number of seconds to wait
+    """
+    return random.uniform(0, min(cap, base * 2**attempt))
@@ -0,0 +1,162 @@
+"""Contains the compact table that recipes from the Notion database are loaded into"""
+
+from array import array
+import sys
+from typing import Iterable, List, Mapping, Optional, Sequence
+from . import notion_filters as nf
+
+
+def _title(properties: Mapping) -> str:
+    title = properties.get(nf.name_property, {}).get("title") or []
+    return "".join(t.get("plain_text", "") for t in title)
+
+
+def _dishes(properties: Mapping) -> tuple:
+    tags = properties.get(nf.dish_property, {}).get("multi_select") or []
+    # tag names repeat across every recipe, so only keep one copy of each
+    return tuple(sys.intern(t["name"]) for t in tags)
+
+
+def _planned(properties: Mapping) -> bool:
+    return bool(properties.get(nf.planned_property, {}).get("checkbox"))
+
+
+class RecipeTable:
+    """Column-oriented table of the recipe fields used by the meal planner
+
+    Rows hold the page id, the name, the dish tags, the planned flag and the
+    last_edited_time of a recipe, and ``index`` maps each page id to its row.
+    The raw Notion JSON is not kept.
+    """
+
+    __slots__ = ("ids", "names", "dishes", "planned", "last_edited", "index")
+
+    def __init__(self):
+        self.ids: List[str] = []
+        self.names: List[str] = []
+        self.dishes: List[tuple] = []
+        self.planned = array("b")
+        self.last_edited: List[Optional[str]] = []
+        self.index: dict = {}
+
+    @classmethod
+    def from_results(cls, results: Iterable[Mapping]) -> "RecipeTable":
+        """Creates a table from the results of a database query
+
+        Parameters
+        ----------
+        results : Iterable[Mapping]
+            page objects returned by the Notion API
+
+        Returns
+        -------
+        RecipeTable
+            table with one row per page
+        """
+        table = cls()
+        table.extend(results)
+        return table
+
+    def append(self, result: Mapping):
+        """Adds a page object from the Notion API to the table, replacing its row if already present
+
+        Parameters
+        ----------
+        result : Mapping
+            page object returned by the Notion API
+        """
+        properties = result.get("properties", {})
+        row = self.index.get(result["id"])
+        if row is None:
+            self.index[result["id"]] = len(self.ids)
+            self.ids.append(result["id"])
+            self.names.append(_title(properties))
+            self.dishes.append(_dishes(properties))
+            self.planned.append(_planned(properties))
+            self.last_edited.append(result.get("last_edited_time"))
+        else:
+            self.names[row] = _title(properties)
+            self.dishes[row] = _dishes(properties)
+            self.planned[row] = _planned(properties)
+            self.last_edited[row] = result.get("last_edited_time")
+
+    def extend(self, results: Iterable[Mapping]):
+        """Adds every page object in results to the table
+
+        Parameters
+        ----------
+        results : Iterable[Mapping]
+            page objects returned by the Notion API
+        """
+        for result in results:
+            self.append(result)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, page_id: str) -> bool:
+        return page_id in self.index
+
+    def get(self, k: int) -> tuple[str, str]:
+        """Gets the page id and name of row k
+
+        Parameters
+        ----------
+        k : int
+            row of the table
+
+        Returns
+        -------
+        tuple[str, str]
+            page_id, page_name
+        """
+        return (self.ids[k], self.names[k])
+
+    def where(
+        self, dish: Optional[str] = None, planned: Optional[bool] = None
+    ) -> List[int]:
+        """Finds the rows matching all of the given conditions
+
+        Parameters
+        ----------
+        dish : Optional[str], optional
+            dish tag the recipe must have, by default None
+        planned : Optional[bool], optional
+            required value of the planned flag, by default None
+
+        Returns
+        -------
+        List[int]
+            matching rows, in table order
+        """
+        rows = []
+        for k in range(len(self.ids)):
+            if dish is not None and dish not in self.dishes[k]:
+                continue
+            if planned is not None and bool(self.planned[k]) != planned:
+                continue
+            rows.append(k)
+        return rows
+
+    def take(self, rows: Sequence[int]) -> "RecipeTable":
+        """Creates a new table from a subset of rows
+
+        Parameters
+        ----------
+        rows : Sequence[int]
+            rows to copy, in the order they should appear
+
+        Returns
+        -------
+        RecipeTable
+            table containing only those rows
+        """
+        table = RecipeTable()
+        for k in rows:
+            table.index[self.ids[k]] = len(table.ids)
+            table.ids.append(self.ids[k])
+            table.names.append(self.names[k])
+            table.dishes.append(self.dishes[k])
+            table.planned.append(self.planned[k])
+            table.last_edited.append(self.last_edited[k])
+        return table
@@ -0,0 +1,103 @@
+"""Contains the weighted sampling used to pick recipes for the meal plan"""
+
+from datetime import datetime, timezone
+import heapq
+import math
+import random
+from typing import Iterable, List, Optional, Sequence
+from .cache import parse_time
+
+
+def _key(weight: float, rng: random.Random) -> float:
+    # Efraimidis-Spirakis key u ** (1 / w), as a log so small weights don't underflow
+    return math.log(1.0 - rng.random()) / weight
+
+
+def sample_rows(
+    n: int,
+    rows: Sequence[int],
+    prev_rows: Iterable[int] = (),
+    repeat_budget: int = 0,
+    weights: Optional[Sequence[float]] = None,
+    rng: Optional[random.Random] = None,
+) -> List[int]:
+    """Samples n rows without replacement, with at most repeat_budget from prev_rows
+
+    Every row is given a random key in one pass, and the n largest keys are taken with
+    no more than repeat_budget of them from the previous pool. This is the same as
+    drawing rows one at a time with probability proportional to their weight and
+    skipping previous rows once the budget is used up, but always takes a bounded time.
+
+    Parameters
+    ----------
+    n : int
+        number of rows to select
+    rows : Sequence[int]
+        rows to select from
+    prev_rows : Iterable[int], optional
+        rows that were selected last time, by default ()
+    repeat_budget : int, optional
+        largest number of rows from prev_rows allowed, by default 0
+    weights : Optional[Sequence[float]], optional
+        relative chance of selecting each row, indexed by row, by default all equal.
+        Rows with a weight of 0 are never selected.
+    rng : Optional[random.Random], optional
+        source of random numbers, by default the random module
+
+    Returns
+    -------
+    List[int]
+        selected rows, in the order they were drawn
+
+    Raises
+    ------
+    ValueError
+        if there are fewer than n rows that can be selected
+    """
+    rng = rng if rng is not None else random
+    prev = set(prev_rows)
+    fresh = []
+    repeats = []
+    for row in rows:
+        weight = weights[row] if weights is not None else 1.0
+        if weight <= 0:
+            continue
+        pool = repeats if row in prev else fresh
+        pool.append((_key(weight, rng), row))
+
+    budget = min(max(repeat_budget, 0), len(repeats))
+    if n > len(fresh) + budget:
+        raise ValueError(
+            "can't select {0} recipes: {1} are available and only {2} of the {3} "
+            "previous recipes may repeat".format(n, len(fresh), budget, len(repeats))
+        )
+
+    best = heapq.nlargest(n, fresh) + heapq.nlargest(min(budget, n), repeats)
+    return [row for key, row in heapq.nlargest(n, best)]
+
+
+def days_since(
+    timestamps: Sequence[Optional[str]], now: Optional[datetime] = None
+) -> List[float]:
+    """Weights that favour recipes the longer it has been since they were last edited
+
+    Planning a recipe sets its Planned property, so the last_edited_time of a page is
+    usually the last time it was planned.
+
+    Parameters
+    ----------
+    timestamps : Sequence[Optional[str]]
+        last_edited_time of each recipe, e.g. RecipeTable.last_edited
+    now : Optional[datetime], optional
+        current time, by default datetime.now
+
+    Returns
+    -------
+    List[float]
+        one more than the number of days since each timestamp, 1 if it is missing
+    """
+    now = now if now is not None else datetime.now(timezone.utc)
+    return [
+        1.0 + max((now - parse_time(t)).total_seconds() / 86400, 0.0) if t else 1.0
+        for t in timestamps
+    ]
@@ -0,0 +1,527 @@
+"""Contains a local stand-in for the Notion API, used for offline tests and benchmarks
+
+FakeNotion keeps databases, pages and blocks in memory and serves the endpoints used by
+this package over HTTP, so a NotionClient pointed at its url behaves as it would
+against Notion. Latency, page sizes and 429 responses can be set to measure how the
+client copes with them, and synthetic_workspace fills it with a recipe database of
+any size.
+"""
+
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import itertools
+import json
+import random
+import threading
+import time
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+from urllib.parse import parse_qs, urlsplit
+import uuid
+from . import notion_filters as nf
+from .cache import format_time, parse_time
+from .parse_cache import ParsedAmount, ParsedSentence, ParsedText
+
+
+def _rich_text(rich_text: Iterable[Mapping]) -> List[Mapping]:
+    """Fills in plain_text the way Notion does for rich text sent to it"""
+    return [
+        {
+            **rt,
+            "plain_text": rt.get("plain_text", rt.get("text", {}).get("content", "")),
+        }
+        for rt in rich_text
+    ]
+
+
+def make_block(btype: str, text: str = "") -> dict:
+    """Creates a block of a given type with some text, in the format sent to the API"""
+    return {
+        "object": "block",
+        "type": btype,
+        btype: {"rich_text": [{"type": "text", "text": {"content": text}}]},
+    }
+
+
+class FakeNotion:
+    """An in-memory Notion workspace served over HTTP
+
+    Parameters
+    ----------
+    latency : float, optional
+        seconds each request takes, by default 0.0
+    max_page_size : int, optional
+        most results returned in one response, by default 100 as in the Notion API
+    throttle_every : int, optional
+        respond to every nth request with 429, 0 to never throttle, by default 0
+    retry_after : float, optional
+        value of the Retry-After header of 429 responses, by default 0.0
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        max_page_size: int = 100,
+        throttle_every: int = 0,
+        retry_after: float = 0.0,
+    ):
+        self.latency = latency
+        self.max_page_size = max_page_size
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+
+        # database id -> ids of its pages, in creation order
+        self.databases: Dict[str, List[str]] = {}
+        self.pages: Dict[str, dict] = {}
+        self.blocks: Dict[str, dict] = {}
+        # page or block id -> ids of its child blocks, in order
+        self.children: Dict[str, List[str]] = {}
+        # "METHOD endpoint" -> number of requests, e.g. "GET blocks/children"
+        self.requests: Counter = Counter()
+        self.throttled = 0
+
+        self._count = itertools.count(1)
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    # ----- building the workspace -----
+
+    def add_database(self, db_id: Optional[str] = None) -> str:
+        """Adds an empty database and returns its id"""
+        db_id = db_id or str(uuid.uuid4())
+        self.databases[db_id] = []
+        return db_id
+
+    def add_page(
+        self,
+        db_id: Optional[str],
+        properties: Mapping,
+        blocks: Sequence[Mapping] = (),
+        page_id: Optional[str] = None,
+        last_edited: Optional[str] = None,
+    ) -> str:
+        """Adds a page, to a database if db_id is given, and returns its id
+
+        Parameters
+        ----------
+        db_id : Optional[str]
+            id of the database the page is in, or None for a standalone page
+        properties : Mapping
+            page properties in the format returned by the API
+        blocks : Sequence[Mapping], optional
+            content of the page, see make_block, by default ()
+        page_id : Optional[str], optional
+            id of the page, by default a new uuid
+        last_edited : Optional[str], optional
+            last_edited_time of the page, by default now
+        """
+        page_id = page_id or str(uuid.uuid4())
+        self.pages[page_id] = {
+            "object": "page",
+            "id": page_id,
+            "last_edited_time": last_edited or format_time(datetime.now(timezone.utc)),
+            "archived": False,
+            "properties": json.loads(json.dumps(properties)),
+        }
+        self.children[page_id] = []
+        if db_id is not None:
+            self.databases[db_id].append(page_id)
+        self.add_blocks(page_id, blocks)
+        return page_id
+
+    def add_blocks(self, parent_id: str, blocks: Iterable[Mapping]) -> List[dict]:
+        """Appends blocks to a page or block, returning them as the API would
+
+        A block may have a "children" list of blocks to nest inside it.
+        """
+        added = []
+        for block in blocks:
+            block = json.loads(json.dumps(block))
+            nested = block.pop("children", [])
+            btype = block["type"]
+            block[btype]["rich_text"] = _rich_text(block[btype].get("rich_text", []))
+            block.update(
+                object="block",
+                id=block.get("id") or str(uuid.uuid4()),
+                parent={"block_id": parent_id},
+                has_children=bool(nested),
+                archived=False,
+            )
+            self.blocks[block["id"]] = block
+            self.children[block["id"]] = []
+            self.children.setdefault(parent_id, []).append(block["id"])
+            if parent_id in self.blocks:
+                self.blocks[parent_id]["has_children"] = True
+            self.add_blocks(block["id"], nested)
+            added.append(block)
+        return added
+
+    # ----- serving -----
+
+    @property
+    def url(self) -> str:
+        """Base url to give to NotionClient, e.g. http://127.0.0.1:8123/v1/"""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1/"
+
+    def start(self) -> "FakeNotion":
+        """Starts serving on a free local port in a background thread"""
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        # a short poll interval so stop() doesn't hold up every test
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, args=(0.05,), daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> "FakeNotion":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def handle(
+        self, method: str, path: str, query: Mapping, body: Optional[Mapping]
+    ) -> Tuple[int, Mapping, Mapping]:
+        """Handles one request
+
+        Returns
+        -------
+        Tuple[int, Mapping, Mapping]
+            status code, response body and extra headers
+        """
+        if self.latency:
+            time.sleep(self.latency)
+
+        parts = path.strip("/").split("/")
+        if parts and parts[0] == "v1":
+            parts = parts[1:]
+        endpoint = "/".join(p for i, p in enumerate(parts) if i % 2 == 0)
+
+        with self._lock:
+            self.requests[f"{method} {endpoint}"] += 1
+            if self.throttle_every and next(self._count) % self.throttle_every == 0:
+                self.throttled += 1
+                return (
+                    429,
+                    {"object": "error", "code": "rate_limited"},
+                    {"Retry-After": str(self.retry_after)},
+                )
+
+            route = {
+                ("POST", "databases/query"): self._query,
+                ("PATCH", "pages"): self._update_page,
+                ("GET", "blocks/children"): self._get_children,
+                ("PATCH", "blocks/children"): self._append_children,
+                ("PATCH", "blocks"): self._update_block,
+                ("DELETE", "blocks"): self._delete_block,
+            }.get((method, endpoint))
+            if route is None or len(parts) < 2:
+                return (404, {"object": "error", "code": "invalid_request_url"}, {})
+            return route(parts[1], query, body or {})
+
+    def _not_found(self, object_id: str) -> Tuple[int, Mapping, Mapping]:
+        return (
+            404,
+            {
+                "object": "error",
+                "code": "object_not_found",
+                "message": f"Could not find {object_id}",
+            },
+            {},
+        )
+
+    def _paginate(self, items: List, start_cursor, page_size) -> Mapping:
+        start = int(start_cursor or 0)
+        size = min(int(page_size or 100), self.max_page_size)
+        end = start + size
+        return {
+            "object": "list",
+            "results": items[start:end],
+            "has_more": end < len(items),
+            "next_cursor": str(end) if end < len(items) else None,
+        }
+
+    def _query(self, db_id: str, query: Mapping, body: Mapping):
+        if db_id not in self.databases:
+            return self._not_found(db_id)
+        pages = [self.pages[p] for p in self.databases[db_id]]
+        pages = [
+            p for p in pages if not p["archived"] and _matches(p, body.get("filter"))
+        ]
+        if "filter_properties" in query:
+            pages = [_only_properties(p, query["filter_properties"]) for p in pages]
+        return (
+            200,
+            self._paginate(pages, body.get("start_cursor"), body.get("page_size")),
+            {},
+        )
+
+    def _touch(self, page: dict):
+        # Notion rounds last_edited_time to the minute, and it must move forward
+        now = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+        last = parse_time(page["last_edited_time"])
+        page["last_edited_time"] = format_time(max(now, last + timedelta(minutes=1)))
+
+    def _update_page(self, page_id: str, query: Mapping, body: Mapping):
+        page = self.pages.get(page_id)
+        if page is None:
+            return self._not_found(page_id)
+        if page["archived"] and body.get("archived") is not False:
+            return (
+                400,
+                {
+                    "object": "error",
+                    "code": "validation_error",
+                    "message": "Can't edit block that is archived.",
+                },
+                {},
+            )
+        if "archived" in body:
+            page["archived"] = bool(body["archived"])
+        for name, value in body.get("properties", {}).items():
+            page["properties"].setdefault(name, {}).update(value)
+        self._touch(page)
+        return (200, page, {})
+
+    def _get_children(self, block_id: str, query: Mapping, body: Mapping):
+        if block_id not in self.children:
+            return self._not_found(block_id)
+        blocks = [self.blocks[b] for b in self.children[block_id]]
+        first = lambda key: (query.get(key) or [None])[0]
+        return (
+            200,
+            self._paginate(blocks, first("start_cursor"), first("page_size")),
+            {},
+        )
+
+    def _append_children(self, block_id: str, query: Mapping, body: Mapping):
+        if block_id not in self.children:
+            return self._not_found(block_id)
+        children = body.get("children", [])
+        if len(children) > 100:
+            return (400, {"object": "error", "code": "validation_error"}, {})
+        added = self.add_blocks(block_id, children)
+        return (200, {"object": "list", "results": added}, {})
+
+    def _update_block(self, block_id: str, query: Mapping, body: Mapping):
+        block = self.blocks.get(block_id)
+        if block is None:
+            return self._not_found(block_id)
+        btype = block["type"]
+        if btype in body:
+            update = dict(body[btype])
+            if "rich_text" in update:
+                update["rich_text"] = _rich_text(update["rich_text"])
+            block[btype].update(update)
+        return (200, block, {})
+
+    def _delete_block(self, block_id: str, query: Mapping, body: Mapping):
+        block = self.blocks.pop(block_id, None)
+        if block is None:
+            return self._not_found(block_id)
+        parent = self.children.get(block["parent"]["block_id"], [])
+        if block_id in parent:
+            parent.remove(block_id)
+        # the blocks nested in it are deleted along with it
+        nested = list(self.children.pop(block_id, []))
+        while nested:
+            child = nested.pop()
+            self.blocks.pop(child, None)
+            nested.extend(self.children.pop(child, []))
+        block["archived"] = True
+        return (200, block, {})
+
+
+def _only_properties(page: Mapping, property_ids: Sequence[str]) -> dict:
+    """Copies a page with only the given properties, where the title property has the id title"""
+    properties = {
+        name: prop
+        for name, prop in page["properties"].items()
+        if prop.get("id") in property_ids
+        or (prop.get("type") == "title" and nf.title_property_id in property_ids)
+    }
+    return {**page, "properties": properties}
+
+
+def _matches(page: Mapping, filter_object: Optional[Mapping]) -> bool:
+    """Evaluates the parts of the Notion filter syntax used by this package"""
+    if not filter_object:
+        return True
+    if "and" in filter_object:
+        return all(_matches(page, f) for f in filter_object["and"])
+    if "or" in filter_object:
+        return any(_matches(page, f) for f in filter_object["or"])
+    if filter_object.get("timestamp") == "last_edited_time":
+        since = filter_object["last_edited_time"]["on_or_after"]
+        return parse_time(page["last_edited_time"]) >= parse_time(since)
+
+    prop = page["properties"].get(filter_object["property"], {})
+    if "checkbox" in filter_object:
+        return bool(prop.get("checkbox")) == filter_object["checkbox"]["equals"]
+    if "multi_select" in filter_object:
+        names = [t["name"] for t in prop.get("multi_select") or []]
+        return filter_object["multi_select"]["contains"] in names
+    raise ValueError(f"unsupported filter {filter_object}")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # send the headers and body of a response together, without waiting on acks
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def _respond(self):
+        url = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        status, payload, headers = self.server.fake.handle(
+            self.command, url.path, parse_qs(url.query), body
+        )
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = do_PATCH = do_DELETE = _respond
+
+    def log_message(self, format, *args):
+        pass
+
+
+INGREDIENTS = [
+    "flour",
+    "sugar",
+    "butter",
+    "eggs",
+    "milk",
+    "olive oil",
+    "garlic",
+    "onion",
+    "tomatoes",
+    "basil",
+    "rice",
+    "soy sauce",
+    "ginger",
+    "chicken thighs",
+    "ground beef",
+    "black beans",
+    "cumin",
+    "paprika",
+    "carrots",
+    "celery",
+    "potatoes",
+    "spinach",
+    "lemon juice",
+    "parmesan",
+    "pasta",
+    "coconut milk",
+    "chickpeas",
+    "bell pepper",
+    "honey",
+    "vinegar",
+]
+
+AMOUNTS = [
+    ("1", "cup"),
+    ("2", "cups"),
+    ("1/2", "cup"),
+    ("2", "tbsp"),
+    ("1", "tsp"),
+    ("200", "g"),
+    ("1", "lb"),
+    ("3", ""),
+    ("1", ""),
+]
+
+
+def synthetic_workspace(
+    n_recipes: int,
+    seed: int = 0,
+    planned: int = 7,
+    ingredients: Tuple[int, int] = (5, 15),
+    fake: Optional[FakeNotion] = None,
+    **kwargs,
+) -> Tuple[FakeNotion, Dict[str, str], Dict[str, ParsedSentence]]:
+    """Creates a FakeNotion with a recipe database and a meal plan page
+
+    Parameters
+    ----------
+    n_recipes : int
+        number of recipes in the database
+    seed : int, optional
+        seed of the random recipes, by default 0
+    planned : int, optional
+        number of recipes already planned, by default 7
+    ingredients : Tuple[int, int], optional
+        smallest and largest number of ingredients in a recipe, by default (5, 15)
+    fake : Optional[FakeNotion], optional
+        server to add the database and page to, e.g. for several workspaces, by default a new one
+    **kwargs
+        passed to FakeNotion, e.g. latency
+
+    Returns
+    -------
+    Tuple[FakeNotion, Dict[str, str], Dict[str, ParsedSentence]]
+        the workspace, the ids of the "recipes" database and "mealplan" page, and the
+        parse of every ingredient sentence, e.g. to fill a ParseCache without the parser
+    """
+    rng = random.Random(seed)
+    fake = fake if fake is not None else FakeNotion(**kwargs)
+    db_id = fake.add_database()
+    parses = {}
+
+    planned_rows = set(rng.sample(range(n_recipes), min(planned, n_recipes)))
+    # a spread of edit times, so syncs since a recent time only see some recipes
+    start = datetime.now(timezone.utc) - timedelta(days=60)
+    for k in range(n_recipes):
+        names = rng.sample(INGREDIENTS, rng.randint(*ingredients))
+        blocks = [make_block("heading_2", "Ingredients")]
+        for name in names:
+            quantity, unit = rng.choice(AMOUNTS)
+            sentence = " ".join(filter(None, [quantity, unit, name]))
+            parses[sentence] = ParsedSentence(
+                sentence,
+                ParsedText(name, 0.99),
+                [ParsedAmount(quantity, unit, 0.99)],
+            )
+            blocks.append(make_block("bulleted_list_item", sentence))
+        blocks.append(make_block("heading_2", "Instructions"))
+        blocks.append(make_block("paragraph", "Cook everything."))
+
+        dishes = ["Lunch/Dinner"] if rng.random() < 0.8 else ["Breakfast"]
+        fake.add_page(
+            db_id,
+            {
+                nf.name_property: {
+                    "type": "title",
+                    "title": [{"plain_text": f"Recipe {k}"}],
+                },
+                nf.dish_property: {
+                    "type": "multi_select",
+                    "multi_select": [{"name": d} for d in dishes],
+                },
+                nf.planned_property: {
+                    "type": "checkbox",
+                    "checkbox": k in planned_rows,
+                },
+            },
+            blocks,
+            last_edited=format_time(start + timedelta(minutes=k)),
+        )
+
+    mealplan_id = fake.add_page(None, {}, [make_block("heading_1", "Grocery List")])
+    return fake, {"recipes": db_id, "mealplan": mealplan_id}, parses
@@ -1,4 +1,6 @@
-import numpy as np
+"""Contains the units recognised in ingredient amounts and the conversions between them"""
+
+from typing import Dict, NamedTuple, Optional, Union
 
 UNITS = {
     "bags": "bag",
@@ -94,6 +96,51 @@ UNITS = {
     "wheels": "wheel",
 }
 
+# size of each weight unit in grams and each volume unit in millilitres
+WEIGHT_FACTORS = {
+    "g": 1.0,
+    "grams": 1.0,
+    "kgs": 1000.0,
+    "kilograms": 1000.0,
+    "oz": 28.349523125,
+    "ounces": 28.349523125,
+    "lbs": 453.59237,
+    "pounds": 453.59237,
+}
+
+VOLUME_FACTORS = {
+    "tsps": 4.92892159375,
+    "teaspoons": 4.92892159375,
+    "tbsps": 14.78676478125,
+    "tablespoons": 14.78676478125,
+    "cups": 236.5882365,
+    "pints": 473.176473,
+    "pts": 473.176473,
+    "quarts": 946.352946,
+    "gallons": 3785.411784,
+    "litres": 1000.0,
+    "liters": 1000.0,
+    "l": 1000.0,
+    "milliliters": 1.0,
+    "ml": 1.0,
+}
+
+# other spellings of the units above that aren't the singular forms in UNITS
+ALIASES = {
+    "kg": "kgs",
+    "lb": "lbs",
+    "tb": "tbsps",
+    "tbs": "tbsps",
+    "qt": "quarts",
+    "qts": "quarts",
+    "millilitres": "milliliters",
+    "millilitre": "milliliters",
+}
+
+# abbreviations written the same for any amount, e.g. "3 tbsp"
+INVARIANT = {"tsps": "tsp", "tbsps": "tbsp", "kgs": "kg"}
+
+# order of the rows and columns of V_CONVERSIONS and W_CONVERSIONS
 VOLUME = [
     "tsps",
     "teaspoons",
@@ -106,132 +153,208 @@ VOLUME = [
     "l",
     "ml",
 ]
-
 WEIGHT = ["g", "grams", "kgs", "kilograms", "oz", "ounces", "lbs", "pounds"]
 
-W_CONVERSIONS = np.array(
-    [
-        [1, 1, 1000, 1000, 0.0352739619, 0.0352739619, 0.0022046226, 0.0022046226],
-        [1, 1, 1000, 1000, 0.0352739619, 0.0352739619, 0.0022046226, 0.0022046226],
-        [0.001, 0.001, 1, 1, 35.2739619496, 35.2739619496, 2.2046226218, 2.2046226218],
-        [0.001, 0.001, 1, 1, 35.2739619496, 35.2739619496, 2.2046226218, 2.2046226218],
-        [28.349523125, 28.349523125, 0.0283495231, 0.0283495231, 1, 1, 0.0625, 0.0625],
-        [28.349523125, 28.349523125, 0.0283495231, 0.0283495231, 1, 1, 0.0625, 0.0625],
-        [453.59237, 453.59237, 0.45359237, 0.45359237, 16, 16, 1, 1],
-        [453.59237, 453.59237, 0.45359237, 0.45359237, 16, 16, 1, 1],
-    ]
-)
-
-V_CONVERSIONS = np.array(
-    [
-        [
-            1,
-            1,
-            1 / 3,
-            1 / 3,
-            0.0208333333,
-            0.0013020833,
-            0.0049289216,
-            0.0049289216,
-            0.0049289216,
-            4.9289215937,
-        ],
-        [
-            1,
-            1,
-            1 / 3,
-            1 / 3,
-            0.0208333333,
-            0.0013020833,
-            0.0049289216,
-            0.0049289216,
-            0.0049289216,
-            4.9289215937,
-        ],
-        [
-            3,
-            3,
-            1,
-            1,
-            0.0625,
-            0.00390625,
-            0.0147867648,
-            0.0147867648,
-            0.0147867648,
-            14.786764781,
-        ],
-        [
-            3,
-            3,
-            1,
-            1,
-            0.0625,
-            0.00390625,
-            0.0147867648,
-            0.0147867648,
-            0.0147867648,
-            14.786764781,
-        ],
-        [
-            48,
-            48,
-            16,
-            16,
-            1,
-            0.0625,
-            0.2365882365,
-            0.2365882365,
-            0.2365882365,
-            236.5882365,
-        ],
-        [768, 768, 256, 256, 16, 1, 3.785411784, 3.785411784, 3.785411784, 3785.411784],
-        [
-            202.88413621,
-            202.88413621,
-            67.628045404,
-            67.628045404,
-            4.2267528377,
-            0.2641720524,
-            1,
-            1,
-            1,
-            1000,
-        ],
-        [
-            202.88413621,
-            202.88413621,
-            67.628045404,
-            67.628045404,
-            4.2267528377,
-            0.2641720524,
-            1,
-            1,
-            1,
-            1000,
-        ],
-        [
-            202.88413621,
-            202.88413621,
-            67.628045404,
-            67.628045404,
-            4.2267528377,
-            0.2641720524,
-            1,
-            1,
-            1,
-            1000,
-        ],
-        [
-            0.2028841362,
-            0.2028841362,
-            0.0676280454,
-            0.0676280454,
-            0.0042267528,
-            0.0002641721,
-            0.001,
-            0.001,
-            0.001,
-            1,
-        ],
-    ]
-)
+METRIC = {
+    "g",
+    "grams",
+    "kgs",
+    "kilograms",
+    "litres",
+    "liters",
+    "l",
+    "milliliters",
+    "ml",
+}
+
+# units totals are shown in, largest first, with the smallest amount of each shown
+DISPLAY_UNITS = {
+    ("weight", True): [("kg", 1.0), ("g", 0.0)],
+    ("weight", False): [("lbs", 1.0), ("oz", 0.0)],
+    ("volume", True): [("l", 1.0), ("ml", 0.0)],
+    ("volume", False): [
+        ("gallons", 1.0),
+        ("cups", 0.25),
+        ("tbsps", 1.0),
+        ("tsps", 0.0),
+    ],
+}
+
+
+class UnitInfo(NamedTuple):
+    """A unit that can be converted
+
+    Attributes
+    ----------
+    name : str
+        canonical name of the unit
+    dimension : str
+        "weight" or "volume"
+    factor : float
+        size of the unit in grams or millilitres
+    """
+
+    name: str
+    dimension: str
+    factor: float
+
+
+def _build_registry() -> Dict[str, UnitInfo]:
+    registry = {}
+    for dimension, factors in (("weight", WEIGHT_FACTORS), ("volume", VOLUME_FACTORS)):
+        for name, factor in factors.items():
+            registry[name] = UnitInfo(name, dimension, factor)
+
+    # singular forms and abbreviations point at the same unit
+    for plural, singular in UNITS.items():
+        if plural in registry and singular not in registry:
+            registry[singular] = registry[plural]
+    for alias, name in ALIASES.items():
+        registry.setdefault(alias, registry[name])
+    return registry
+
+
+REGISTRY = _build_registry()
+
+
+def _build_normalize() -> Dict[str, str]:
+    normalize = {}
+    for plural, singular in UNITS.items():
+        normalize[plural] = plural
+        normalize.setdefault(singular, plural)
+    # units that can be converted but aren't in UNITS, and other abbreviations
+    for name in [*WEIGHT_FACTORS, *VOLUME_FACTORS]:
+        normalize.setdefault(name, name)
+    for alias, name in ALIASES.items():
+        normalize.setdefault(alias, normalize[name])
+    return normalize
+
+
+# plural, singular or abbreviated unit -> the plural form used as the key of UNITS
+NORMALIZE = _build_normalize()
+
+
+def normalize(unit: str) -> str:
+    """Gets the canonical form of a unit, the plural key of UNITS where there is one
+
+    Parameters
+    ----------
+    unit : str
+        unit in any case, singular, plural or abbreviated
+
+    Returns
+    -------
+    str
+        canonical unit, or the unit in lower case if it isn't known
+    """
+    unit = unit.strip().lower()
+    return NORMALIZE.get(unit, unit)
+
+
+def inflect(unit: str, amount: Union[int, float]) -> str:
+    """Gets the form of a canonical unit to show with an amount, e.g. "1 cup" but "2 cups"
+
+    Parameters
+    ----------
+    unit : str
+        canonical unit, see normalize()
+    amount : Union[int, float]
+        amount shown with the unit
+
+    Returns
+    -------
+    str
+        the singular form of the unit for an amount of one, the plural form otherwise
+    """
+    if unit in INVARIANT:
+        return INVARIANT[unit]
+    return UNITS.get(unit, unit) if amount == 1 else unit
+
+
+def lookup(unit: str) -> Optional[UnitInfo]:
+    """Gets the dimension and size of a unit, or None if it isn't a weight or volume"""
+    return REGISTRY.get(unit.strip().lower())
+
+
+def unit_type(unit: str) -> str:
+    """Gets the unit type, one of "weight", "volume" or "other"."""
+    info = lookup(unit)
+    return info.dimension if info is not None else "other"
+
+
+def convert(amount: float, unit_a: str, unit_b: str) -> float:
+    """Converts an amount from unit_a to unit_b
+
+    Parameters
+    ----------
+    amount : float
+        amount in unit_a
+    unit_a : str
+        unit to convert from
+    unit_b : str
+        unit to convert to
+
+    Returns
+    -------
+    float
+        amount in unit_b
+
+    Raises
+    ------
+    ValueError
+        if the units aren't both weights or both volumes
+    """
+    info_a = lookup(unit_a)
+    info_b = lookup(unit_b)
+    if info_a is None or info_b is None or info_a.dimension != info_b.dimension:
+        raise ValueError(f"can't convert {unit_a} to {unit_b}")
+    return amount * info_a.factor / info_b.factor
+
+
+def display_unit(total: float, dimension: str, metric: bool) -> tuple[float, str]:
+    """Picks a readable unit for a total in grams or millilitres
+
+    The largest unit in DISPLAY_UNITS that gives at least its smallest amount is used,
+    so 60 ml of flour is shown as 0.25 cups rather than 4 tbsps.
+
+    Parameters
+    ----------
+    total : float
+        amount in grams or millilitres
+    dimension : str
+        "weight" or "volume"
+    metric : bool
+        whether to use metric units
+
+    Returns
+    -------
+    tuple[float, str]
+        the amount in the chosen unit, and the unit
+    """
+    for unit, smallest in DISPLAY_UNITS[(dimension, metric)]:
+        amount = total / REGISTRY[unit].factor
+        if amount >= smallest:
+            return (amount, unit)
+    return (amount, unit)
+
+
+def _conversion_tables() -> dict:
+    """Builds the conversion matrices, importing NumPy only when they are first needed
+
+    Entry [i, j] converts an amount in unit i of WEIGHT (or VOLUME) to unit j.
+    """
+    import numpy as np
+
+    tables = {}
+    for name, names in (("W_CONVERSIONS", WEIGHT), ("V_CONVERSIONS", VOLUME)):
+        factors = np.array([REGISTRY[n].factor for n in names])
+        tables[name] = factors[:, np.newaxis] / factors[np.newaxis, :]
+    return tables
+
+
+def __getattr__(name: str):
+    # W_CONVERSIONS and V_CONVERSIONS are created on first access
+    if name in ("W_CONVERSIONS", "V_CONVERSIONS"):
+        globals().update(_conversion_tables())
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,14 @@
+from notion_mealplan.testing import synthetic_workspace
+import pytest
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    """A synthetic workspace served locally, with the environment pointed at it"""
+    fake, ids, parses = synthetic_workspace(60, seed=1, planned=5, max_page_size=7)
+    monkeypatch.setenv("NOTION_KEY", "offline")
+    monkeypatch.setenv("NOTION_PAGE_ID", ids["recipes"])
+    monkeypatch.setenv("NOTION_MP_ID", ids["mealplan"])
+    monkeypatch.setenv("NOTION_MEALPLAN_CACHE", str(tmp_path))
+    with fake:
+        yield fake, ids, parses
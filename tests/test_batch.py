@@ -0,0 +1,169 @@
+from notion_mealplan import batch
+from notion_mealplan import mp_functions as mp
+from notion_mealplan import notion_filters as nf
+from notion_mealplan.cache import NotionCache
+from notion_mealplan.parse_cache import ParseCache
+from notion_mealplan.testing import FakeNotion, synthetic_workspace
+import pytest
+import sqlite3
+
+CONFIG = """
+recipes = 4
+repeat = 0
+
+[[household]]
+name = "home"
+notion_key_env = "HOME_NOTION_KEY"
+notion_page_id = "{home[recipes]}"
+notion_mp_id = "{home[mealplan]}"
+
+[[household]]
+name = "cabin"
+notion_key = "cabin-key"
+notion_page_id = "{cabin[recipes]}"
+recipes = 3
+grocery = false
+"""
+
+
+@pytest.fixture
+def households(tmp_path, monkeypatch):
+    """Two households with workspaces on one local server, and their config file"""
+    monkeypatch.setenv("HOME_NOTION_KEY", "home-key")
+    with FakeNotion() as fake:
+        home = synthetic_workspace(40, seed=1, planned=4, fake=fake)[1]
+        cabin = synthetic_workspace(30, seed=2, planned=3, fake=fake)[1]
+        path = tmp_path / "households.toml"
+        path.write_text(CONFIG.format(home=home, cabin=cabin))
+        yield fake, {"home": home, "cabin": cabin}, str(path)
+
+
+def planned(fake, db_id):
+    return {
+        p
+        for p in fake.databases[db_id]
+        if fake.pages[p]["properties"][nf.planned_property]["checkbox"]
+    }
+
+
+def test_load_config(households):
+    """Function to test that households take the top-level defaults and environment keys"""
+    fake, ids, path = households
+    home, cabin = batch.load_config(path, {"repeat": 1, "recipes": None})
+
+    assert (home.name, home.notion_key, home.recipes, home.repeat) == (
+        "home",
+        "home-key",
+        4,
+        1,
+    )
+    assert home.grocery and home.notion_mp_id == ids["home"]["mealplan"]
+    assert (cabin.notion_key, cabin.recipes, cabin.grocery) == ("cabin-key", 3, False)
+
+
+@pytest.mark.parametrize(
+    "text, message",
+    [
+        ("recipes = 3", "has no"),
+        ("[[household]]\nnotion_key = 'k'\nnotion_page_id = 'p'", "recipes"),
+        (
+            "[[household]]\nnotion_key = 'k'\nnotion_page_id = 'p'\nrecipes = 2",
+            "notion_mp_id",
+        ),
+        ("[[household]]\nname = 'x'\ncolour = 'red'", "unknown keys colour"),
+        ("[[household]\n", "not valid TOML"),
+    ],
+)
+def test_invalid_config(tmp_path, text, message):
+    """Function to test the errors for invalid config files"""
+    path = tmp_path / "households.toml"
+    path.write_text(text)
+    with pytest.raises(ValueError, match=message):
+        batch.load_config(str(path))
+
+
+def test_run_batch(households, tmp_path):
+    """Function to test planning every household concurrently with shared caches"""
+    fake, ids, path = households
+    parses = {}
+    # the same arguments as the households fixture, so the recipes get the same sentences
+    for seed, n, k in ((1, 40, 4), (2, 30, 3)):
+        parses.update(synthetic_workspace(n, seed=seed, planned=k)[2])
+    parse_cache = ParseCache(str(tmp_path / "parse.sqlite3"))
+    parse_cache.put_many(parses.values())
+    before = {name: planned(fake, i["recipes"]) for name, i in ids.items()}
+
+    report = batch.run_batch(
+        batch.load_config(path),
+        rate_limit=1000,
+        notion_cache=NotionCache(str(tmp_path / "notion.sqlite3")),
+        parse_cache=parse_cache,
+        base_url=fake.url,
+    )
+
+    assert report["ok"]
+    home, cabin = report["households"]
+    assert len(home["recipes"]) == 4 and len(cabin["recipes"]) == 3
+    assert home["unoptimized"] == cabin["unoptimized"] == 0
+    for name, n in (("home", 4), ("cabin", 3)):
+        after = planned(fake, ids[name]["recipes"])
+        assert len(after) == n
+        assert not after & before[name]
+
+    # only the home grocery list is posted
+    assert len(fake.children[ids["home"]["mealplan"]]) > 1
+    assert len(fake.children[ids["cabin"]["mealplan"]]) == 1
+    assert any(s["name"] == "grocery_list/parse" for s in home["spans"])
+    assert not any(s["name"].startswith("grocery_list") for s in cabin["spans"])
+
+    total = sum(m["count"] for m in report["requests"].values())
+    assert total == sum(fake.requests.values())
+    assert "home" in batch.format_batch_report(report, profile=True)
+
+
+def test_failed_household(households, tmp_path):
+    """Function to test that one household failing doesn't stop the others"""
+    fake, ids, path = households
+    home, cabin = batch.load_config(path)
+    home.recipes = 1000
+
+    report = batch.run_batch(
+        [home, cabin],
+        dry_run=True,
+        rate_limit=1000,
+        notion_cache=NotionCache(":memory:"),
+        parse_cache=ParseCache(":memory:"),
+        base_url=fake.url,
+    )
+
+    assert not report["ok"]
+    assert report["households"][0]["error"]
+    assert report["households"][1]["ok"]
+
+
+def test_household_unexpected_error(households, monkeypatch):
+    """Function to test that any error of one household is reported without stopping the others"""
+    fake, ids, path = households
+    home, cabin = batch.load_config(path)
+    get_mealplan = mp.get_mealplan
+
+    def flaky_get_mealplan(*args, **kwargs):
+        if kwargs["notion_key"] == home.notion_key:
+            raise sqlite3.OperationalError("database is locked")
+        return get_mealplan(*args, **kwargs)
+
+    monkeypatch.setattr(batch.mp, "get_mealplan", flaky_get_mealplan)
+
+    report = batch.run_batch(
+        [home, cabin],
+        dry_run=True,
+        rate_limit=1000,
+        notion_cache=NotionCache(":memory:"),
+        parse_cache=ParseCache(":memory:"),
+        base_url=fake.url,
+    )
+
+    assert not report["ok"]
+    assert report["households"][0]["error"] == "OperationalError: database is locked"
+    assert report["households"][1]["ok"]
+    assert "home" in batch.format_batch_report(report)
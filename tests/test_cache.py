@@ -0,0 +1,81 @@
+from notion_mealplan.cache import NotionCache
+from datetime import timedelta
+import pytest
+
+
+@pytest.fixture
+def cache():
+    return NotionCache(":memory:")
+
+
+def make_page(page_id, edited, planned=False):
+    return {
+        "id": page_id,
+        "last_edited_time": edited,
+        "properties": {"Planned this week": {"checkbox": planned}},
+    }
+
+
+def test_rows_and_sync(cache):
+    """Function to test that rows are stored per database along with the sync time"""
+    assert cache.last_sync("db") is None
+    assert cache.needs_full_sync("db", timedelta(days=30))
+
+    cache.put_rows(
+        "db",
+        [
+            make_page("a", "2023-12-01T10:00:00.000Z"),
+            make_page("b", "2023-12-01T10:00:00.000Z"),
+        ],
+        sync_time="2023-12-07T10:00:00.000Z",
+        full=True,
+    )
+    cache.put_rows("db", [make_page("b", "2023-12-08T10:00:00.000Z", planned=True)])
+
+    rows = cache.rows("db")
+    assert [r["id"] for r in sorted(rows, key=lambda r: r["id"])] == ["a", "b"]
+    assert cache.last_sync("db") == "2023-12-07T10:00:00.000Z"
+    assert cache.rows("other") == []
+
+    # a full sync replaces every row
+    cache.put_rows("db", [make_page("c", "2023-12-09T10:00:00.000Z")], full=True)
+    assert [r["id"] for r in cache.rows("db")] == ["c"]
+
+
+def test_blocks_follow_last_edited(cache):
+    """Function to test that cached blocks are only used while the page is unchanged"""
+    blocks = [{"id": "1", "type": "paragraph"}]
+    cache.put_blocks("a", "2023-12-01T10:00:00.000Z", blocks)
+    cache.put_blocks("a#ingredients", "2023-12-01T10:00:00.000Z", blocks)
+
+    assert cache.get_blocks("a", "2023-12-01T10:00:00.000Z") == blocks
+    assert cache.get_blocks("a", "2023-12-02T10:00:00.000Z") is None
+    assert cache.get_blocks("a", None) is None
+
+    # editing a property of the page keeps its blocks valid
+    cache.touch(
+        "db",
+        make_page("a", "2023-12-03T10:00:00.000Z", True),
+        "2023-12-01T10:00:00.000Z",
+    )
+    assert cache.get_blocks("a", "2023-12-03T10:00:00.000Z") == blocks
+    assert cache.get_blocks("a#ingredients", "2023-12-03T10:00:00.000Z") == blocks
+    assert cache.rows("db")[0]["properties"]["Planned this week"]["checkbox"]
+
+
+def test_deleted_rows(cache):
+    """Function to test that archived and missing pages are removed from the cache"""
+    cache.put_rows(
+        "db",
+        [make_page(p, "2023-12-01T10:00:00.000Z") for p in "abc"],
+        sync_time="2023-12-07T10:00:00.000Z",
+        full=True,
+    )
+
+    cache.put_rows(
+        "db", [{**make_page("a", "2023-12-08T10:00:00.000Z"), "archived": True}]
+    )
+    assert [r["id"] for r in cache.rows("db")] == ["b", "c"]
+
+    cache.remove_missing("db", ["c", "d"])
+    assert [r["id"] for r in cache.rows("db")] == ["c"]
@@ -0,0 +1,55 @@
+import subprocess
+import sys
+import pytest
+
+# modules that should only be imported on the grocery list path
+HEAVY_MODULES = ["ingredient_parser", "numpy", "nltk"]
+
+# limit on the cumulative import time of the CLI, in microseconds, a margin over the
+# ~0.3 s it takes without the modules above, which take longer than that on their own
+IMPORT_BUDGET_US = 400_000
+
+
+def import_times(module: str) -> dict:
+    """Imports a module in a fresh interpreter and returns the cumulative import time of every module loaded"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def loaded_modules(module: str) -> set:
+    """Imports a module in a fresh interpreter and returns the names in sys.modules"""
+    result = subprocess.run(
+        [sys.executable, "-c", f"import sys, {module}; print(*sys.modules)"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return set(result.stdout.split())
+
+
+@pytest.mark.parametrize("module", ["notion_mealplan", "notion_mealplan.main"])
+def test_no_heavy_imports(module):
+    """Function to test that the CLI doesn't import the parser model or NumPy at startup"""
+    modules = loaded_modules(module)
+
+    assert module in modules
+    for heavy in HEAVY_MODULES:
+        assert not {m for m in modules if m.split(".")[0] == heavy}
+
+
+def test_import_budget():
+    """Function to test that importing the CLI stays within the startup budget"""
+    times = import_times("notion_mealplan.main")
+
+    assert times["notion_mealplan.main"] < IMPORT_BUDGET_US
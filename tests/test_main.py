@@ -0,0 +1,134 @@
+from notion_mealplan import main
+from notion_mealplan import mp_functions as mp
+from notion_mealplan import notion_filters as nf
+from notion_mealplan.parse_cache import ParseCache
+import dotenv
+import pytest
+
+
+@pytest.fixture
+def cli(workspace, monkeypatch):
+    """The workspace, with the clients made by the CLI sent to it without rate limits"""
+    fake, ids, parses = workspace
+    ParseCache().put_many(parses.values())
+    client_class = mp.NotionClient
+    monkeypatch.setattr(
+        mp,
+        "NotionClient",
+        lambda key, **kwargs: client_class(
+            key, base_url=fake.url, rate_limit=1000, **kwargs
+        ),
+    )
+    return fake, ids
+
+
+def planned(fake, ids):
+    return {
+        p
+        for p in fake.databases[ids["recipes"]]
+        if fake.pages[p]["properties"][nf.planned_property]["checkbox"]
+    }
+
+
+def test_run(cli, capsys):
+    """Function to test a non-interactive run of the CLI"""
+    fake, ids = cli
+    before = planned(fake, ids)
+
+    assert main.main(["--recipes", "5", "--repeat", "0"]) == main.EXIT_OK
+
+    after = planned(fake, ids)
+    assert len(after) == 5
+    assert not after & before
+    assert len(fake.children[ids["mealplan"]]) > 1
+    assert "Mealplan complete!" in capsys.readouterr().out
+
+
+def test_dry_run(cli, capsys):
+    """Function to test that a dry run prints the plan without changing Notion"""
+    fake, ids = cli
+    before = planned(fake, ids)
+    children = list(fake.children[ids["mealplan"]])
+
+    assert main.main(["-n", "4", "--dry-run"]) == main.EXIT_OK
+
+    assert planned(fake, ids) == before
+    assert fake.children[ids["mealplan"]] == children
+    assert not any(r.startswith(("PATCH", "DELETE")) for r in fake.requests)
+    out = capsys.readouterr().out
+    assert "Meal plan:" in out and "Grocery list:" in out
+
+
+def test_dry_run_loads_dotenv(cli, capsys):
+    """Function to test that main() runs with the real load_dotenv against the fake server"""
+    fake, ids = cli
+    assert main.load_dotenv is dotenv.load_dotenv
+
+    assert main.main(["--dry-run", "-n", "3", "--no-grocery"]) == main.EXIT_OK
+
+    assert not any(r.startswith(("PATCH", "DELETE")) for r in fake.requests)
+    assert "Mealplan complete!" in capsys.readouterr().out
+
+
+def test_no_grocery(cli):
+    """Function to test that --no-grocery leaves the grocery list alone"""
+    fake, ids = cli
+    children = list(fake.children[ids["mealplan"]])
+
+    assert main.main(["-n", "3", "--no-grocery"]) == main.EXIT_OK
+
+    assert len(planned(fake, ids)) == 3
+    assert fake.children[ids["mealplan"]] == children
+
+
+def test_infeasible_plan(cli):
+    """Function to test the exit code when there aren't enough recipes"""
+    assert main.main(["-n", "1000"]) == main.EXIT_FAILURE
+
+
+def test_missing_config(monkeypatch):
+    """Function to test the exit code when the Notion variables aren't set"""
+    monkeypatch.delenv("NOTION_KEY", raising=False)
+    monkeypatch.delenv("NOTION_PAGE_ID", raising=False)
+    monkeypatch.setattr(main, "load_dotenv", lambda: None)
+
+    assert main.main(["-n", "3"]) == main.EXIT_CONFIG
+
+
+@pytest.mark.parametrize(
+    "argv",
+    [
+        [],
+        ["-n", "0"],
+        ["-n", "x"],
+        ["-r", "1"],
+        ["-n", "3", "-r", "-1"],
+        ["--config", "households.toml", "--weeks", "2"],
+    ],
+)
+def test_usage_errors(argv):
+    """Function to test that invalid arguments exit with the usage exit code"""
+    with pytest.raises(SystemExit) as exc_info:
+        main.parse_args(argv)
+    assert exc_info.value.code == main.EXIT_USAGE
+
+
+def test_get_input(monkeypatch):
+    """Function to test that the prompts are repeated until the answers are integers"""
+    answers = iter(["three", "1", "3", "1"])
+    monkeypatch.setattr("builtins.input", lambda: next(answers))
+
+    assert main.get_input() == (3, 1)
+
+
+def test_weeks(cli, capsys):
+    """Function to test planning several weeks, posting the combined grocery list"""
+    fake, ids = cli
+
+    assert main.main(["-n", "4", "--weeks", "3", "--combined"]) == main.EXIT_OK
+
+    out = capsys.readouterr().out
+    assert "Week 3:" in out and "Week 3 grocery list:" in out
+    assert "All weeks grocery list:" in out
+    assert len(planned(fake, ids)) == 4
+    assert len(fake.children[ids["mealplan"]]) > 1
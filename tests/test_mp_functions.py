@@ -3,6 +3,7 @@ import os
 import pytest
 from typing import Tuple, List
 import requests
+import json
 
 filter_prev = {"property": "Planned this week", "checkbox": {"equals": True}}
 filter_b = {"property": "Dish", "multi_select": {"contains": "Breakfast"}}
@@ -67,10 +68,10 @@ def test_loaddb(loaded_database):
     """Test that database is loaded in correctly and is not empty"""
     l_db = loaded_database(None)
     assert l_db.db_len > 0
-    assert "results" in l_db.db
+    assert len(l_db.db) == l_db.db_len
 
     # check that pages in database have planned this week parameter
-    assert "Planned this week" in l_db.db["results"][0]["properties"]
+    assert len(l_db.db.planned) == l_db.db_len
 
 
 @pytest.mark.xfail
@@ -118,7 +119,7 @@ def test_get_selected(loaded_database):
     l_db.get_selected()
 
     assert len(l_db.selected_pages) == l_db.db_len
-    assert l_db.db["results"][0]["id"] == l_db.selected_pages[0]
+    assert l_db.db.ids[0] == l_db.selected_pages[0]
 
 
 def test_update_planned_and_remove(loaded_database):
@@ -171,3 +172,235 @@ def test_get_mealplan(notion_keys, client, loaded_database):
     # return everything to prev (nothing planned)
     db1.get_selected()
     db1.update_planned(update_prev_planned_props)
+
+
+def test_async_client_concurrency(monkeypatch):
+    """Function to test that AsyncNotionClient bounds the number of requests in flight"""
+    import asyncio
+    import threading
+    import time
+
+    client = mp.NotionClient("123a", pool_maxsize=2)
+    a_client = mp.AsyncNotionClient(client=client, concurrency=4)
+
+    assert client.pool_maxsize == 4
+    assert client.aio is not a_client
+
+    lock = threading.Lock()
+    in_flight = [0, 0]
+
+    def fake_get_children(block_id, start_cursor=None, page_size=None):
+        with lock:
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight)
+        time.sleep(0.01)
+        with lock:
+            in_flight[0] -= 1
+        return block_id
+
+    monkeypatch.setattr(client, "get_children", fake_get_children)
+
+    async def _fetch_all():
+        async with a_client:
+            return await asyncio.gather(
+                *(a_client.get_children(str(i)) for i in range(12))
+            )
+
+    results = asyncio.run(_fetch_all())
+
+    assert results == [str(i) for i in range(12)]
+    assert 1 < in_flight[1] <= 4
+
+
+def test_client_retries(monkeypatch):
+    """Function to test that 429 and 5xx responses are retried and counted"""
+    client = mp.NotionClient("123a", rate_limit=1000, max_retries=3)
+    monkeypatch.setattr(mp.time, "sleep", lambda s: None)
+    monkeypatch.setattr(client.limiter, "_sleep", lambda s: None)
+
+    codes = [429, 503, 200]
+
+    def fake_request(method, url, **kwargs):
+        response = requests.Response()
+        response.status_code = codes.pop(0)
+        response.headers["Retry-After"] = "0"
+        return response
+
+    monkeypatch.setattr(client.session, "request", fake_request)
+
+    response = client.get_children("543b")
+
+    assert response.status_code == 200
+    assert client.stats["requests"] == 3
+    assert client.stats["throttled"] == 1
+    assert client.stats["retried"] == 2
+
+    # retries run out and the last response is returned
+    codes = [500] * 5
+    assert client.get_children("543b").status_code == 500
+    assert client.stats["retried"] == 5
+
+
+def test_client_connection_retries(monkeypatch):
+    """Function to test that timeouts and connection errors are backed off and retried"""
+    client = mp.NotionClient("123a", rate_limit=1000, max_retries=2, timeout=(1, 2))
+    sleeps = []
+    monkeypatch.setattr(mp.time, "sleep", sleeps.append)
+    monkeypatch.setattr(mp.rl, "backoff", lambda attempt: attempt + 0.5)
+
+    outcomes = [requests.Timeout(), requests.ConnectionError(), 200]
+    timeouts = []
+
+    def fake_request(method, url, **kwargs):
+        timeouts.append(kwargs["timeout"])
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        response = requests.Response()
+        response.status_code = outcome
+        return response
+
+    monkeypatch.setattr(client.session, "request", fake_request)
+
+    assert client.get_children("543b").status_code == 200
+    assert timeouts == [(1, 2)] * 3
+    assert sleeps == [0.5, 1.5]
+    assert client.stats["requests"] == 3
+    assert client.stats["retried"] == 2
+    assert client.metrics.to_dict()["GET blocks/children"]["errors"] == 2
+
+    # retries run out and the last error is raised
+    outcomes = [requests.Timeout()] * 3
+    with pytest.raises(requests.Timeout):
+        client.get_children("543b")
+    assert client.stats["retried"] == 4
+
+
+def test_load_db_pagination(monkeypatch):
+    """Function to test that every page of a query ends up in one flat results list"""
+    client = mp.NotionClient("123a")
+    results = [{"id": str(i), "properties": {}} for i in range(5)]
+    pages = {
+        None: {"results": results[:2], "has_more": True, "next_cursor": "b"},
+        "b": {"results": results[2:4], "has_more": True, "next_cursor": "c"},
+        "c": {"results": results[4:], "has_more": False, "next_cursor": None},
+    }
+    sizes = []
+
+    def fake_query(
+        db_id, filter_object=None, start_cursor=None, page_size=None, **kwargs
+    ):
+        sizes.append(page_size)
+        response = requests.Response()
+        response.status_code = 200
+        response._content = json.dumps(pages[start_cursor]).encode()
+        return response
+
+    monkeypatch.setattr(client, "query_database", fake_query)
+
+    db = mp.NotionDatabase(client)
+    assert [len(r) for r in db.iter_results("543b", page_size=2)] == [2, 2, 1]
+
+    db.load_db("543b")
+    assert db.db.ids == ["0", "1", "2", "3", "4"]
+    assert db.db_len == 5
+    assert sizes[-1] == mp.MAX_PAGE_SIZE
+
+
+def test_sync_db(monkeypatch):
+    """Function to test that only pages edited since the last sync are queried"""
+    from notion_mealplan.cache import NotionCache
+
+    client = mp.NotionClient("123a")
+    filters = []
+    pages = [
+        {
+            "id": "a",
+            "last_edited_time": "2023-12-01T10:00:00.000Z",
+            "properties": {"Dish": {"multi_select": [{"name": "Lunch/Dinner"}]}},
+        },
+        {
+            "id": "b",
+            "last_edited_time": "2023-12-01T10:00:00.000Z",
+            "properties": {"Planned this week": {"checkbox": True}},
+        },
+    ]
+
+    def fake_query(
+        db_id, filter_object=None, start_cursor=None, page_size=None, **kwargs
+    ):
+        filters.append(filter_object)
+        response = requests.Response()
+        response.status_code = 200
+        results = pages if filter_object is None else pages[1:]
+        response._content = json.dumps({"results": results, "has_more": False}).encode()
+        return response
+
+    monkeypatch.setattr(client, "query_database", fake_query)
+    cache = NotionCache(":memory:")
+
+    db = mp.NotionDatabase(client)
+    db.sync_db("543b", cache)
+    assert filters == [None]
+    assert db.db_len == 2
+
+    db.sync_db("543b", cache)
+    # every id is listed, then only the pages edited since the last sync are queried
+    assert filters[1] is None
+    assert filters[2]["last_edited_time"]["on_or_after"] == cache.last_sync("543b")
+    assert cache.last_sync("543b").endswith(":00.000Z")
+    assert db.db_len == 2
+
+    assert db.subset(planned=True).db.ids == ["b"]
+    assert db.subset(dish="Lunch/Dinner").db.ids == ["a"]
+
+    # a page deleted from the database is removed from the cache
+    del pages[0]
+    db.sync_db("543b", cache)
+    assert db.db.ids == ["b"]
+
+
+def test_update_planned_bulk(monkeypatch):
+    """Function to test that updates are skipped when not needed and failures are collected"""
+    from notion_mealplan.recipe_table import RecipeTable
+
+    client = mp.NotionClient("123a")
+    sent = []
+
+    def fake_update(page_id, properties):
+        sent.append(page_id)
+        response = requests.Response()
+        response.status_code = 404 if page_id == "c" else 200
+        response._content = json.dumps(
+            {
+                "id": page_id,
+                "last_edited_time": "2023-12-08T10:00:00.000Z",
+                "properties": {"Planned this week": {"checkbox": True}},
+            }
+        ).encode()
+        return response
+
+    monkeypatch.setattr(client, "update_page", fake_update)
+
+    db = mp.NotionDatabase(client)
+    db.db = RecipeTable.from_results(
+        [
+            {"id": "a", "properties": {"Planned this week": {"checkbox": False}}},
+            {"id": "b", "properties": {"Planned this week": {"checkbox": True}}},
+            {"id": "c", "properties": {"Planned this week": {"checkbox": False}}},
+            {"id": "d", "properties": {"Planned this week": {"checkbox": False}}},
+        ]
+    )
+    db.get_selected()
+
+    result = db.update_planned(update_planned_props, skip=["d"])
+
+    assert sorted(sent) == ["a", "c"]
+    assert result.updated == ["a"]
+    assert sorted(result.skipped) == ["b", "d"]
+    assert list(result.failed) == ["c"]
+    assert not result.ok
+    assert db.db.planned[0] == 1
+
+    with pytest.raises(requests.HTTPError):
+        result.raise_for_status()
@@ -0,0 +1,109 @@
+import random
+import time
+from notion_mealplan import mp_functions as mp
+from notion_mealplan import sampling
+from notion_mealplan.optimizer import IngredientIndex, optimize_rows
+from notion_mealplan.recipe_table import RecipeTable
+import pytest
+
+
+@pytest.fixture
+def recipes():
+    """Two groups of recipes that share ingredients within each group"""
+    return [
+        {"pasta", "tomato", "garlic", "basil"},
+        {"pizza dough", "tomato", "basil", "mozzarella"},
+        {"bruschetta", "tomato", "garlic", "basil", "bread"},
+        {"rice", "soy sauce", "ginger", "chicken"},
+        {"noodles", "soy sauce", "ginger", "scallion"},
+        {"fried rice", "rice", "soy sauce", "egg", "scallion"},
+        None,
+    ]
+
+
+def test_ingredient_index(recipes):
+    """Function to test the inverted index from ingredients to recipes"""
+    index = IngredientIndex(recipes)
+
+    assert len(index) == 7
+    assert index.recipes[6] is None
+    tomato = index.names.index("tomato")
+    assert index.postings[tomato] == [0, 1, 2]
+    assert index.distinct([0, 2]) == 6
+
+
+def test_optimize_rows_shares_ingredients(recipes):
+    """Function to test that the optimizer keeps to one group of recipes"""
+    index = IngredientIndex(recipes)
+    for seed in range(20):
+        rows = optimize_rows(3, range(7), index, rng=random.Random(seed))
+        assert sorted(rows) in ([0, 1, 2], [3, 4, 5])
+
+
+def test_optimize_rows_repeat_budget(recipes):
+    """Function to test that the optimizer keeps to the repeat budget"""
+    index = IngredientIndex(recipes)
+    for seed in range(20):
+        rows = optimize_rows(
+            3, range(7), index, [0, 1], 1, "overlap", rng=random.Random(seed)
+        )
+        assert len(set(rows)) == 3
+        assert len(set(rows) & {0, 1}) <= 1
+
+    with pytest.raises(ValueError):
+        optimize_rows(6, range(7), index, [0, 1, 2], 1)
+    with pytest.raises(ValueError):
+        optimize_rows(3, range(7), index, objective="cheapest")
+
+
+def test_optimize_rows_unknown_ingredients(recipes):
+    """Function to test that places the known recipes can't fill are picked at random"""
+    index = IngredientIndex(recipes)
+    for seed in range(20):
+        rows = optimize_rows(4, range(7), index, [0, 1, 2], 0, rng=random.Random(seed))
+        assert sorted(rows[:3]) == [3, 4, 5]
+        assert rows[3] == 6
+
+    assert optimize_rows(1, range(7), index, range(6), 0) == [6]
+    assert sorted(optimize_rows(7, range(7), index)) == list(range(7))
+    assert optimize_rows(0, range(7), index) == []
+    with pytest.raises(ValueError):
+        optimize_rows(5, range(7), index, [0, 1, 2], 0)
+
+
+def test_optimize_rows_large():
+    """Function to test that thousands of recipes are optimized quickly"""
+    rng = random.Random(0)
+    vocab = ["ingredient {0}".format(i) for i in range(800)]
+    recipes = [
+        rng.sample(vocab[: rng.randint(50, 800)], rng.randint(5, 15))
+        for i in range(3000)
+    ]
+    index = IngredientIndex(recipes)
+
+    start = time.perf_counter()
+    rows = optimize_rows(7, range(3000), index, range(50), 1, rng=rng)
+    elapsed = time.perf_counter() - start
+
+    random_plans = [sampling.sample_rows(7, range(3000), rng=rng) for i in range(20)]
+    assert index.distinct(rows) < min(index.distinct(p) for p in random_plans)
+    assert elapsed < 1.0
+
+
+def test_optimize_select(recipes):
+    """Function to test selecting recipes from a NotionDatabase with the optimizer"""
+    db = mp.NotionDatabase(mp.NotionClient("123a"))
+    db.db = RecipeTable.from_results(
+        [{"id": str(i), "properties": {}} for i in range(7)]
+    )
+    db.db_len = len(db.db)
+
+    db.optimize_select(3, recipes, ["3"], 0, rng=random.Random(1))
+
+    assert sorted(db.selected_pages) == ["0", "1", "2"]
+    assert db.unoptimized == 0
+
+    db.optimize_select(4, recipes, ["0", "1", "2"], 0, rng=random.Random(1))
+
+    assert sorted(db.selected_pages) == ["3", "4", "5", "6"]
+    assert db.unoptimized == 1
@@ -0,0 +1,164 @@
+from notion_mealplan import parse_cache as pc
+import os
+import pytest
+
+# set in the worker processes by stub_load_parser
+_loaded = False
+
+
+def stub_load_parser():
+    global _loaded
+    _loaded = True
+
+
+def stub_parse_chunk(sentences):
+    """Stands in for the model in worker processes, which import it from this module"""
+    if not _loaded:
+        raise RuntimeError("the initializer didn't run")
+    return [
+        pc.ParsedSentence(
+            s, pc.ParsedText(s, 0.9), [pc.ParsedAmount(str(os.getpid()), "", 0.9)]
+        )
+        for s in sentences
+    ]
+
+
+@pytest.fixture
+def parsed():
+    return [
+        pc.ParsedSentence(
+            "2 cloves garlic",
+            pc.ParsedText("garlic", 0.99),
+            [pc.ParsedAmount("2", "cloves", 0.98)],
+        ),
+        pc.ParsedSentence(
+            "1 tbsp olive oil",
+            pc.ParsedText("olive oil", 0.97),
+            [pc.ParsedAmount("1", "tbsp", 0.99)],
+        ),
+        pc.ParsedSentence("salt", pc.ParsedText("salt", 0.95), []),
+        pc.ParsedSentence("?", None, []),
+    ]
+
+
+def test_get_and_put(parsed):
+    """Function to test that parsed sentences come back out of the cache unchanged"""
+    cache = pc.ParseCache(":memory:", version="1")
+    cache.put_many(parsed)
+
+    found = cache.get_many(["salt", "2 cloves garlic", "pepper", "?"])
+
+    assert found == {"salt": parsed[2], "2 cloves garlic": parsed[0], "?": parsed[3]}
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_lru_eviction(parsed):
+    """Function to test that the least recently used sentences are removed first"""
+    cache = pc.ParseCache(":memory:", max_entries=3, version="1")
+    cache.put_many(parsed[:3])
+    cache.get_many(["2 cloves garlic"])
+    cache.put_many(parsed[3:])
+
+    assert len(cache) == 3
+    assert list(cache.get_many(s.sentence for s in parsed)) == [
+        "2 cloves garlic",
+        "salt",
+        "?",
+    ]
+
+
+def test_version_change(parsed, tmp_path):
+    """Function to test that the cache is cleared when the parser version changes"""
+    path = str(tmp_path / "parse.sqlite3")
+    cache = pc.ParseCache(path, version="1")
+    cache.put_many(parsed)
+    cache.close()
+
+    assert len(pc.ParseCache(path, version="1")) == 4
+    assert len(pc.ParseCache(path, version="2")) == 0
+
+
+def test_key_format_change(parsed, tmp_path):
+    """Function to test that entries stored under an older format of key are cleared"""
+    path = str(tmp_path / "parse.sqlite3")
+    cache = pc.ParseCache(path, version="1")
+    cache.put_many(parsed)
+    # caches written before KEY_FORMAT only stored the parser version
+    with cache._conn:
+        cache._conn.execute("UPDATE meta SET value = '1' WHERE key = 'version'")
+    cache.close()
+
+    assert len(pc.ParseCache(path, version="1")) == 0
+
+
+def test_sentences_differing_in_whitespace(monkeypatch):
+    """Function to test that each spelling of a sentence is cached and returned as itself"""
+
+    def fake_parse_chunk(sentences):
+        return [pc.ParsedSentence(s, pc.ParsedText("eggs", 0.9), []) for s in sentences]
+
+    monkeypatch.setattr(pc, "_parse_chunk", fake_parse_chunk)
+    cache = pc.ParseCache(":memory:", version="1")
+    sentences = ["2 eggs", " 2 eggs "]
+
+    assert [p.sentence for p in pc.parse_sentences(sentences, cache)] == sentences
+    assert [p.sentence for p in pc.parse_sentences(sentences[::-1], cache)] == (
+        sentences[::-1]
+    )
+    assert len(cache) == 2
+    assert cache.hits == 2
+
+
+def test_parse_sentences_cached(parsed):
+    """Function to test that cached sentences aren't sent to the parser"""
+    cache = pc.ParseCache(":memory:", version="1")
+    cache.put_many(parsed)
+
+    sentences = ["salt", "2 cloves garlic", "salt"]
+    assert pc.parse_sentences(sentences, cache) == [parsed[2], parsed[0], parsed[2]]
+
+
+def test_split():
+    """Function to test that sentences are split into ordered chunks of nearly equal size"""
+    sentences = [str(i) for i in range(10)]
+    chunks = pc._split(sentences, 4)
+
+    assert [len(c) for c in chunks] == [3, 3, 2, 2]
+    assert [s for c in chunks for s in c] == sentences
+    assert pc._split(sentences[:2], 4) == [["0"], ["1"]]
+
+
+def test_parse_uncached_threshold(monkeypatch, parsed):
+    """Function to test that small batches are parsed without starting worker processes"""
+    calls = []
+
+    def fake_parse_chunk(sentences):
+        calls.append(list(sentences))
+        return [p for p in parsed if p.sentence in sentences]
+
+    monkeypatch.setattr(pc, "_parse_chunk", fake_parse_chunk)
+    monkeypatch.setattr(pc, "ProcessPoolExecutor", None)
+
+    sentences = [p.sentence for p in parsed]
+    assert pc.parse_uncached(sentences, processes=4, threshold=10) == parsed
+    assert pc.parse_uncached(sentences, processes=1, threshold=1) == parsed
+    assert len(calls) == 2
+
+
+def test_parse_uncached_processes(monkeypatch):
+    """Function to test that a large batch is parsed in worker processes and cached in order"""
+    monkeypatch.setattr(pc, "_load_parser", stub_load_parser)
+    monkeypatch.setattr(pc, "_parse_chunk", stub_parse_chunk)
+    cache = pc.ParseCache(":memory:", version="1")
+    sentences = [
+        "{0} cups item {1}".format(i % 7, i) for i in range(pc.PARALLEL_THRESHOLD + 50)
+    ]
+
+    parsed = pc.parse_sentences(sentences, cache, processes=2)
+
+    assert [p.sentence for p in parsed] == sentences
+    assert [p.name.text for p in parsed] == sentences
+    # the chunks were parsed outside this process
+    pids = {int(p.amount[0].quantity) for p in parsed}
+    assert os.getpid() not in pids
+    assert cache.get_many(sentences) == dict(zip(sentences, parsed))
@@ -0,0 +1,71 @@
+import json
+from notion_mealplan import profiling
+import pytest
+
+
+@pytest.mark.parametrize(
+    "method, url, name",
+    [
+        (
+            "POST",
+            "https://api.notion.com/v1/databases/abc/query",
+            "POST databases/query",
+        ),
+        ("GET", "https://api.notion.com/v1/blocks/abc/children", "GET blocks/children"),
+        ("PATCH", "http://127.0.0.1:8000/v1/pages/abc", "PATCH pages"),
+        ("DELETE", "http://127.0.0.1:8000/blocks/abc", "DELETE blocks"),
+    ],
+)
+def test_endpoint(method, url, name):
+    """Function to test that endpoints are named without the version and ids"""
+    assert profiling.endpoint(method, url) == name
+
+
+def test_request_metrics():
+    """Function to test the counts, histogram and bytes recorded for each endpoint"""
+    metrics = profiling.RequestMetrics()
+    metrics.record("GET pages", 200, 0.005, 0, 100)
+    metrics.record("GET pages", 200, 0.2, 0, 50)
+    metrics.record("GET pages", 429, 10.0, 0, 10)
+    metrics.record("PATCH pages", 200, 0.03, 20, 30)
+
+    report = metrics.to_dict()
+    pages = report["GET pages"]
+    assert pages["count"] == 3
+    assert pages["errors"] == 1
+    assert pages["bytes_received"] == 160
+    assert pages["latency_ms"]["<=10ms"] == 1
+    assert pages["latency_ms"]["<=250ms"] == 1
+    assert pages["latency_ms"][">5000ms"] == 1
+    assert sum(pages["latency_ms"].values()) == 3
+    assert report["PATCH pages"]["bytes_sent"] == 20
+    assert report["PATCH pages"]["latency_ms"]["<=50ms"] == 1
+
+
+def test_spans(tmp_path):
+    """Function to test that spans are nested, and only recorded while a profiler is active"""
+    profiler = profiling.Profiler()
+    with profiling.span("ignored"):
+        pass
+
+    with profiler.activate():
+        with profiling.span("mealplan"):
+            with profiling.span("select"):
+                pass
+        with profiling.span("grocery_list"):
+            pass
+
+    with profiling.span("ignored"):
+        pass
+
+    report = profiler.report()
+    names = [s["name"] for s in report["spans"]]
+    assert names == ["mealplan", "mealplan/select", "grocery_list"]
+    assert report["total_s"] >= sum(
+        s["duration_s"] for s in report["spans"] if "/" not in s["name"]
+    )
+    assert "select" in profiling.format_report(report)
+
+    path = tmp_path / "report.json"
+    profiler.write_json(str(path))
+    assert json.loads(path.read_text())["spans"] == report["spans"]
@@ -0,0 +1,70 @@
+from notion_mealplan import grocery_list as groc
+from notion_mealplan.quantity import (
+    EXACT,
+    RANGE,
+    UNPARSEABLE,
+    ParsedQuantity,
+    parse_quantity,
+)
+import pytest
+from types import SimpleNamespace
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("2", ParsedQuantity(EXACT, 2)),
+        (" 1.25 ", ParsedQuantity(EXACT, 1.25)),
+        (".5", ParsedQuantity(EXACT, 0.5)),
+        ("3/4", ParsedQuantity(EXACT, 0.75)),
+        ("1 1/2", ParsedQuantity(EXACT, 1.5)),
+        (" 1 / 2 ", ParsedQuantity(EXACT, 0.5)),
+        ("1.5 1/2", ParsedQuantity(EXACT, 2.0)),
+        ("1/2 cup", ParsedQuantity(EXACT, 0.5, None, "cup")),
+        ("½", ParsedQuantity(EXACT, 0.5)),
+        ("1½", ParsedQuantity(EXACT, 1.5)),
+        ("2 ¼", ParsedQuantity(EXACT, 2.25)),
+        ("1-2", ParsedQuantity(RANGE, 1, 2)),
+        ("2 to 3", ParsedQuantity(RANGE, 2, 3)),
+        ("1/2–¾", ParsedQuantity(RANGE, 0.5, 0.75)),
+        ("200g", ParsedQuantity(EXACT, 200, None, "g")),
+        ("1.5 kg", ParsedQuantity(EXACT, 1.5, None, "kg")),
+        ("1-2 lbs", ParsedQuantity(RANGE, 1, 2, "lbs")),
+        ("-1/2", ParsedQuantity(EXACT, -0.5)),
+        ("-1 1/2", ParsedQuantity(EXACT, -1.5)),
+        ("-1 / 2", ParsedQuantity(EXACT, -0.5)),
+        ("-2", ParsedQuantity(EXACT, -2)),
+        ("-1-2", ParsedQuantity(UNPARSEABLE)),
+        ("a", ParsedQuantity(UNPARSEABLE)),
+        ("1/0", ParsedQuantity(UNPARSEABLE)),
+        ("", ParsedQuantity(UNPARSEABLE)),
+    ],
+)
+def test_parse_quantity(text, expected):
+    """Function to test reading exact amounts, ranges and units from quantities"""
+    assert parse_quantity(text) == expected
+
+
+def test_test_float():
+    """Function to test that test_float still returns a float or the original string"""
+    assert groc.test_float("1 1/2") == 1.5
+    assert groc.test_float("½") == 0.5
+    assert groc.test_float(2) == 2.0
+    assert groc.test_float("-1 1/2") == -1.5
+    assert groc.test_float("-1/2") == -0.5
+    assert groc.test_float("1-2") == "1-2"
+    assert groc.test_float("200g") == "200g"
+    assert groc.test_float("a") == "a"
+
+
+def test_to_quantity_ranges_and_attached_units():
+    """Function to test that ranges use the high end and attached units are kept"""
+
+    def amount(quantity, unit):
+        return SimpleNamespace(quantity=quantity, unit=unit, confidence=0.9)
+
+    assert groc.to_quantity(amount("1-2", "cups")) == groc.Quantity(2, "cups")
+    assert groc.to_quantity(amount("200g", "")) == groc.Quantity(200, "g")
+    assert groc.to_quantity(amount("a", "pinch")) == groc.Quantity(
+        None, "pinches", "a pinch"
+    )
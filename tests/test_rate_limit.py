@@ -0,0 +1,46 @@
+from notion_mealplan import rate_limit as rl
+import pytest
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def test_token_bucket_paces(clock):
+    """Function to test that the bucket allows a burst then paces calls to the rate"""
+    bucket = rl.TokenBucket(rate=3, clock=clock, sleep=clock.sleep)
+
+    waits = [bucket.acquire() for i in range(6)]
+
+    assert waits[:3] == [0, 0, 0]
+    assert waits[3:] == pytest.approx([1 / 3, 1 / 3, 1 / 3])
+    assert clock.now == pytest.approx(1.0)
+
+
+def test_token_bucket_defer(clock):
+    """Function to test that defer holds back the next call"""
+    bucket = rl.TokenBucket(rate=3, clock=clock, sleep=clock.sleep)
+    bucket.defer(2)
+
+    assert bucket.acquire() == pytest.approx(2 + 1 / 3)
+
+
+def test_backoff():
+    """Function to test that backoff is jittered and capped"""
+    for attempt in range(10):
+        wait = rl.backoff(attempt, base=0.5, cap=4)
+        assert 0 <= wait <= min(4, 0.5 * 2**attempt)
@@ -0,0 +1,63 @@
+from notion_mealplan.recipe_table import RecipeTable
+import pytest
+
+
+def make_page(page_id, name, dishes, planned=False):
+    return {
+        "object": "page",
+        "id": page_id,
+        "properties": {
+            "Name": {"title": [{"plain_text": name}]},
+            "Dish": {"multi_select": [{"name": d} for d in dishes]},
+            "Planned this week": {"checkbox": planned},
+        },
+    }
+
+
+@pytest.fixture
+def table():
+    return RecipeTable.from_results(
+        [
+            make_page("a", "zoodles", ["Lunch/Dinner"]),
+            make_page("b", "pancakes", ["Breakfast"], planned=True),
+            make_page("c", "chili", ["Lunch/Dinner"], planned=True),
+        ]
+    )
+
+
+def test_from_results(table):
+    """Function to test that query results are loaded into rows"""
+    assert len(table) == 3
+    assert table.get(1) == ("b", "pancakes")
+    assert table.index["c"] == 2
+    assert "a" in table
+    assert table.dishes[0] == ("Lunch/Dinner",)
+    assert list(table.planned) == [0, 1, 1]
+
+
+def test_append_replaces_row(table):
+    """Function to test that a page already in the table is updated in place"""
+    table.append(make_page("a", "zucchini noodles", ["Lunch/Dinner"], planned=True))
+
+    assert len(table) == 3
+    assert table.get(0) == ("a", "zucchini noodles")
+    assert table.planned[0] == 1
+
+
+def test_where_and_take(table):
+    """Function to test filtering rows and copying them into a new table"""
+    assert table.where(dish="Lunch/Dinner") == [0, 2]
+    assert table.where(planned=True) == [1, 2]
+    assert table.where(dish="Lunch/Dinner", planned=False) == [0]
+
+    sub = table.take([2, 0])
+    assert sub.ids == ["c", "a"]
+    assert sub.index == {"c": 0, "a": 1}
+
+
+def test_missing_title():
+    """Function to test that a recipe without a title gets an empty name"""
+    page = make_page("d", "", [])
+    page["properties"]["Name"]["title"] = []
+
+    assert RecipeTable.from_results([page]).get(0) == ("d", "")
@@ -0,0 +1,68 @@
+from collections import Counter
+from datetime import datetime, timezone
+import random
+from notion_mealplan import mp_functions as mp
+from notion_mealplan import sampling
+from notion_mealplan.recipe_table import RecipeTable
+import pytest
+
+
+def test_sample_rows_repeat_budget():
+    """Function to test that no more than the allowed number of previous rows are picked"""
+    rng = random.Random(1)
+    prev = [0, 1, 2, 3, 4]
+    for budget in range(6):
+        for i in range(50):
+            rows = sampling.sample_rows(5, range(10), prev, budget, rng=rng)
+            assert len(rows) == len(set(rows)) == 5
+            assert len(set(rows) & set(prev)) <= budget
+
+    # every fresh row plus the whole budget is exactly enough
+    rows = sampling.sample_rows(7, range(10), prev, 2, rng=rng)
+    assert set(range(5, 10)) <= set(rows)
+    assert len(set(rows) & set(prev)) == 2
+
+
+def test_sample_rows_not_enough():
+    """Function to test that an impossible selection raises straight away"""
+    with pytest.raises(ValueError):
+        sampling.sample_rows(9, range(10), [0, 1, 2], 1)
+    with pytest.raises(ValueError):
+        sampling.sample_rows(3, range(3), weights=[1, 0, 1])
+
+
+def test_sample_rows_weights():
+    """Function to test that heavier rows are picked more often"""
+    rng = random.Random(2)
+    counts = Counter()
+    for i in range(3000):
+        counts.update(sampling.sample_rows(1, range(3), weights=[1, 2, 0], rng=rng))
+
+    assert counts[2] == 0
+    assert counts[1] / counts[0] == pytest.approx(2, rel=0.15)
+
+
+def test_days_since():
+    """Function to test weights from the last edited times"""
+    now = datetime(2023, 12, 10, tzinfo=timezone.utc)
+    weights = sampling.days_since(
+        ["2023-12-08T00:00:00.000Z", None, "2023-12-11T00:00:00.000Z"], now
+    )
+    assert weights == [3.0, 1.0, 1.0]
+
+
+def test_random_select_offline():
+    """Function to test random_select on a table without querying Notion"""
+    db = mp.NotionDatabase(mp.NotionClient("123a"))
+    db.db = RecipeTable.from_results(
+        [{"id": str(i), "properties": {}} for i in range(6)]
+    )
+    db.db_len = len(db.db)
+
+    db.random_select(4, ["0", "1", "2", "x"], 1, rng=random.Random(3))
+
+    assert len(set(db.selected_pages)) == 4
+    assert len(set(db.selected_pages) & {"0", "1", "2"}) == 1
+
+    with pytest.raises(ValueError):
+        db.random_select(5, ["0", "1", "2"], 1)
@@ -0,0 +1,256 @@
+from notion_mealplan import grocery_list as groc
+from notion_mealplan import mp_functions as mp
+from notion_mealplan import notion_filters as nf
+from notion_mealplan import profiling
+from notion_mealplan.cache import NotionCache, format_time, parse_time
+from notion_mealplan.parse_cache import ParseCache
+from notion_mealplan.testing import FakeNotion, make_block
+import requests
+
+
+def fake_client(fake, **kwargs):
+    return mp.NotionClient("offline", base_url=fake.url, rate_limit=1000, **kwargs)
+
+
+def test_query_pagination_and_filters(workspace):
+    """Function to test that queries are filtered and split into pages"""
+    fake, ids, parses = workspace
+    db = mp.NotionDatabase(fake_client(fake))
+
+    db.load_db(ids["recipes"], filter_object=nf.filter_prev)
+    assert db.db_len == 5
+
+    db.load_db(ids["recipes"])
+    assert db.db_len == 60
+    assert fake.requests["POST databases/query"] == 1 + 9
+
+
+def test_throttling_is_retried():
+    """Function to test that injected 429 responses are retried by the client"""
+    with FakeNotion(throttle_every=2) as fake:
+        page_id = fake.add_page(None, {}, [make_block("paragraph", "hello")])
+        client = fake_client(fake)
+
+        responses = [client.get_children(page_id) for i in range(4)]
+
+        assert all(r.ok for r in responses)
+        assert fake.throttled == 3
+        assert client.stats["throttled"] == 3
+
+
+def test_block_endpoints():
+    """Function to test appending, updating and deleting blocks"""
+    with FakeNotion() as fake:
+        page_id = fake.add_page(None, {})
+        client = fake_client(fake)
+
+        added = client.append_block_children(
+            page_id, {"children": [make_block("to_do", "eggs")]}
+        ).json()["results"]
+        block_id = added[0]["id"]
+        client.update_block(block_id, {"to_do": {"checked": True}})
+
+        (block,) = client.get_children(page_id).json()["results"]
+        assert block["to_do"]["checked"]
+        assert block["to_do"]["rich_text"][0]["plain_text"] == "eggs"
+
+        assert client.delete_block(block_id).ok
+        assert client.get_children(page_id).json()["results"] == []
+        assert client.delete_block(block_id).status_code == 404
+
+
+def test_get_mealplan_offline(workspace):
+    """Function to test making a meal plan and grocery list without the Notion API"""
+    fake, ids, parses = workspace
+    ParseCache().put_many(parses.values())
+    before = {p for p in fake.databases[ids["recipes"]] if _planned(fake, p)}
+
+    recipes, client = mp.get_mealplan(5, 1, notion_client=fake_client(fake))
+    groc.post_grocery_list(recipes, client)
+
+    planned = {p for p in fake.databases[ids["recipes"]] if _planned(fake, p)}
+    assert planned == set(recipes.selected_pages)
+    assert len(planned) == 5
+    assert len(planned & before) <= 1
+
+    todos = [fake.blocks[b] for b in fake.children[ids["mealplan"]][1:]]
+    assert todos and all(b["type"] == "to_do" for b in todos)
+
+
+def test_profiled_run(workspace):
+    """Function to test the stage timings and request metrics of a profiled run"""
+    fake, ids, parses = workspace
+    ParseCache().put_many(parses.values())
+
+    profiler = profiling.Profiler()
+    with profiler.activate():
+        with profiler.span("mealplan"):
+            recipes, client = mp.get_mealplan(5, 1, notion_client=fake_client(fake))
+        with profiler.span("grocery_list"):
+            groc.post_grocery_list(recipes, client)
+    report = profiler.report(client)
+
+    names = {s["name"] for s in report["spans"]}
+    assert {"mealplan/sync_db", "mealplan/select", "mealplan/update_planned"} <= names
+    assert {"grocery_list/parse", "grocery_list/merge", "grocery_list/post"} <= names
+
+    requests = report["requests"]
+    assert {name: m["count"] for name, m in requests.items()} == dict(fake.requests)
+    assert sum(m["count"] for m in requests.values()) == client.stats["requests"]
+    assert requests["POST databases/query"]["bytes_received"] > 0
+    assert requests["PATCH pages"]["bytes_sent"] > 0
+
+
+def test_incremental_sync(workspace):
+    """Function to test that a sync sees edits made in its own minute and deleted recipes"""
+    fake, ids, parses = workspace
+    client = fake_client(fake)
+    cache = NotionCache()
+    db = mp.NotionDatabase(client)
+    db.sync_db(ids["recipes"], cache)
+
+    # Notion rounds last_edited_time down, so this edit is stamped with the sync's minute
+    page = fake.pages[fake.databases[ids["recipes"]][0]]
+    page["properties"][nf.name_property]["title"][0]["plain_text"] = "Renamed"
+    sync = parse_time(cache.last_sync(ids["recipes"]))
+    page["last_edited_time"] = format_time(sync.replace(second=0))
+
+    # delete every lunch/dinner recipe but five, planned ones included
+    dinners = [
+        p
+        for p in fake.databases[ids["recipes"]]
+        if nf.dish_ld
+        in [
+            t["name"]
+            for t in fake.pages[p]["properties"][nf.dish_property]["multi_select"]
+        ]
+    ]
+    for p in dinners[5:]:
+        assert client.update_page(p, {"archived": True}).ok
+
+    db.sync_db(ids["recipes"], cache)
+    assert db.db.names[db.db.index[page["id"]]] == "Renamed"
+    assert set(db.subset(dish=nf.dish_ld).db.ids) == set(dinners[:5])
+
+    recipes, client = mp.get_mealplan(
+        5, 5, notion_client=client, notion_cache=cache, strict=True
+    )
+    assert set(recipes.selected_pages) == set(dinners[:5])
+
+
+def test_grocery_list_failures(workspace, monkeypatch):
+    """Function to test that failed updates are collected and nested to-dos aren't deleted twice"""
+    fake, ids, parses = workspace
+    parse_cache = ParseCache()
+    parse_cache.put_many(parses.values())
+    client = fake_client(fake)
+    recipes = mp.NotionDatabase(client)
+    recipes.load_db(ids["recipes"])
+
+    recipes.get_selected(recipes.db.ids[:3])
+    assert groc.post_grocery_list(recipes, client, parse_cache=parse_cache).ok
+    first = fake.children[ids["mealplan"]][1]
+    fake.add_blocks(first, [make_block("to_do", "nested")])
+
+    # a list of other recipes reuses the old to-dos, and every update fails
+    def failing_update(block_id, properties):
+        raise requests.ConnectionError("connection reset")
+
+    recipes.get_selected(recipes.db.ids[3:6])
+    with monkeypatch.context() as m:
+        m.setattr(client, "update_block", failing_update)
+        assert not groc.post_grocery_list(recipes, client, parse_cache=parse_cache).ok
+
+    # the nested to-do is deleted with its parent, not on its own
+    deleted = fake.requests["DELETE blocks"]
+    top_level = len(fake.children[ids["mealplan"]]) - 1
+    assert groc.post_grocery_list(
+        recipes, client, sync="replace", parse_cache=parse_cache
+    ).ok
+    assert fake.requests["DELETE blocks"] - deleted == top_level
+
+
+def test_grocery_list_resume(workspace, monkeypatch):
+    """Function to test finishing a grocery list whose updates and appends failed"""
+    fake, ids, parses = workspace
+    parse_cache = ParseCache()
+    parse_cache.put_many(parses.values())
+    client = fake_client(fake)
+    recipes = mp.NotionDatabase(client)
+    recipes.load_db(ids["recipes"])
+    recipes.get_selected(recipes.db.ids[:1])
+    groc.post_grocery_list(recipes, client, parse_cache=parse_cache)
+
+    def fail(*args):
+        raise requests.ConnectionError("connection reset")
+
+    recipes.get_selected(recipes.db.ids[1:6])
+    with monkeypatch.context() as m:
+        m.setattr(client, "update_block", fail)
+        m.setattr(client, "append_block_children", fail)
+        progress = groc.post_grocery_list(recipes, client, parse_cache=parse_cache)
+    assert progress.failed and progress.append.error is not None
+    assert progress.append.posted == 0
+
+    fetched = fake.requests["GET blocks/children"]
+    progress = groc.post_grocery_list(recipes, client, resume=progress)
+    assert progress.ok
+    assert fake.requests["GET blocks/children"] == fetched
+
+    # the list now matches the recipes, so posting it again changes nothing
+    again = groc.post_grocery_list(recipes, client, parse_cache=parse_cache)
+    assert again.ok and not (
+        again.diff.update or again.diff.delete or again.diff.append
+    )
+
+
+def _planned(fake, page_id):
+    return fake.pages[page_id]["properties"][nf.planned_property]["checkbox"]
+
+
+def test_get_mealplan_weeks(workspace):
+    """Function to test planning several weeks with the repeat limit between neighbouring weeks"""
+    fake, ids, parses = workspace
+    ParseCache().put_many(parses.values())
+    before = {p for p in fake.databases[ids["recipes"]] if _planned(fake, p)}
+
+    recipes, client = mp.get_mealplan(5, 1, notion_client=fake_client(fake), weeks=3)
+
+    assert len(recipes.weeks) == 3
+    assert all(len(set(week)) == 5 for week in recipes.weeks)
+    assert len(set(recipes.weeks[0]) & before) <= 1
+    for prev, week in zip(recipes.weeks, recipes.weeks[1:]):
+        assert len(set(prev) & set(week)) <= 1
+    # only the first week is marked as planned
+    planned = {p for p in fake.databases[ids["recipes"]] if _planned(fake, p)}
+    assert planned == set(recipes.weeks[0]) == set(recipes.selected_pages)
+    assert fake.requests["POST databases/query"] == 9
+
+
+def test_weekly_grocery_lists(workspace):
+    """Function to test that each recipe is fetched once for the lists of every week"""
+    fake, ids, parses = workspace
+    parse_cache = ParseCache()
+    parse_cache.put_many(parses.values())
+    client = fake_client(fake)
+    recipes = mp.NotionDatabase(client)
+    recipes.load_db(ids["recipes"])
+    a, b, c = recipes.db.ids[:3]
+
+    fetched = fake.requests["GET blocks/children"]
+    lists, combined = groc.weekly_grocery_lists(
+        recipes, client, [[a, b], [b, c]], parse_cache
+    )
+    weekly_fetches = fake.requests["GET blocks/children"] - fetched
+
+    recipes.get_selected([a, b, c])
+    fetched = fake.requests["GET blocks/children"]
+    groc.ingredients_to_list(recipes, client, parse_cache)
+    assert weekly_fetches == fake.requests["GET blocks/children"] - fetched
+
+    recipes.get_selected([a, b])
+    assert lists[0] == groc.ingredients_to_list(recipes, client, parse_cache)
+    # a recipe planned in both weeks counts twice
+    recipes.get_selected([a, b, b, c])
+    assert combined == groc.ingredients_to_list(recipes, client, parse_cache)
+    assert groc.format_grocery_list(lists[1])
@@ -0,0 +1,72 @@
+from notion_mealplan import units
+import pytest
+
+
+def test_lookup_aliases():
+    """Function to test that singulars, plurals and abbreviations find the same unit"""
+    assert units.lookup("cup") == units.lookup("cups")
+    assert units.lookup("tbsp") == units.lookup("tbsps") == units.lookup("Tbs")
+    assert units.lookup("kg").factor == units.lookup("kilograms").factor == 1000
+    assert units.lookup("pinch") is None
+    assert units.unit_type("lb") == "weight"
+    assert units.unit_type("teaspoon") == "volume"
+    assert units.unit_type("clove") == "other"
+
+
+def test_normalize():
+    """Function to test that singulars, plurals and abbreviations share a canonical form"""
+    assert units.normalize("clove") == units.normalize("Cloves ") == "cloves"
+    assert units.normalize("tbsp") == "tbsps"
+    assert units.normalize("lb") == "lbs"
+    assert units.normalize("qt") == units.normalize("qts")
+    assert units.normalize("kg") == "kg"
+    assert units.normalize("glug") == "glug"
+    for plural, singular in units.UNITS.items():
+        assert units.normalize(singular) == units.normalize(plural) == plural
+
+
+def test_inflect():
+    """Function to test showing a canonical unit in the form that goes with an amount"""
+    assert units.inflect("cloves", 1) == "clove"
+    assert units.inflect("cloves", 2) == "cloves"
+    assert units.inflect("cups", 1.0) == "cup"
+    assert units.inflect("cups", 0.5) == "cups"
+    assert units.inflect("lbs", 1) == "lb"
+    assert units.inflect("lbs", 2) == "lbs"
+    assert units.inflect("tbsps", 3) == "tbsp"
+    assert units.inflect("tsps", 1) == "tsp"
+    assert units.inflect("g", 250) == "g"
+    assert units.inflect("glugs", 1) == "glugs"
+
+
+def test_convert():
+    """Function to test converting between units of the same type"""
+    assert units.convert(1, "lbs", "oz") == pytest.approx(16)
+    assert units.convert(4, "tablespoons", "cups") == pytest.approx(0.25)
+    assert units.convert(1, "tbsp", "tsp") == pytest.approx(3)
+    assert units.convert(500, "g", "kg") == pytest.approx(0.5)
+
+    with pytest.raises(ValueError):
+        units.convert(1, "cups", "g")
+    with pytest.raises(ValueError):
+        units.convert(1, "cloves", "g")
+
+
+def test_conversion_tables_match_registry():
+    """Function to test that the matrices are built from the same factors"""
+    for names, table in (
+        (units.WEIGHT, units.W_CONVERSIONS),
+        (units.VOLUME, units.V_CONVERSIONS),
+    ):
+        for i, a in enumerate(names):
+            for j, b in enumerate(names):
+                assert table[i, j] == pytest.approx(units.convert(1, a, b))
+
+
+def test_display_unit():
+    """Function to test picking a readable unit for a total"""
+    assert units.display_unit(14.78676478125 * 4, "volume", False) == (0.25, "cups")
+    assert units.display_unit(2 * 4.92892159375, "volume", False) == (2, "tsps")
+    assert units.display_unit(1500, "volume", True) == (1.5, "l")
+    assert units.display_unit(250, "weight", True) == (250, "g")
+    assert units.display_unit(0, "weight", False) == (0, "oz")